@@ -0,0 +1,200 @@
+import argparse
+import random
+import time
+
+from easyAI import Negamax, TwoPlayerGame
+
+from connect_four import ConnectFour, win_loss_scoring
+from parallel_search import ParallelRootSearch
+from search import IterativeDeepening
+from transposition_table import BoundedTranspositionTable
+
+
+"""
+Benchmarks for the Connect Four AI.
+
+How to run:
+---
+Run the benchmarks with: `python3 benchmark.py <benchmark>`,
+e.g. `python3 benchmark.py search --depth 6`.
+Run `python3 benchmark.py --help` to list the available benchmarks.
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+# Fixed positions given as the columns played from the empty board.
+POSITIONS = [
+    [],
+    [3, 3],
+    [3, 3, 2, 4],
+    [3, 2, 3, 3, 4, 1],
+    [3, 3, 3, 3, 2, 4, 4, 2, 5],
+    [3, 3, 2, 4, 4, 2, 1, 5, 5, 3, 0, 6],
+]
+
+
+class CountingConnectFour(ConnectFour):
+    """
+    ConnectFour that counts the searched nodes (made moves) in a class attribute,
+    so that the count survives the copies made by the search.
+    """
+    nodes = 0
+
+    def make_move(self, column):
+        CountingConnectFour.nodes += 1
+        super().make_move(column)
+
+
+class CopyingConnectFour(CountingConnectFour):
+    """
+    ConnectFour searched the way it was before unmake_move existed:
+    easyAI deep-copies the whole game for every child.
+    """
+
+    @property
+    def unmake_move(self):
+        raise AttributeError('unmake_move')
+
+    copy = TwoPlayerGame.copy
+
+
+def setup_position(game_class, moves):
+    """
+    Create a game and play the given moves on it.
+
+    Args:
+        game_class (type): The ConnectFour class to instantiate.
+        moves (list): The columns to play from the empty board.
+
+    Returns:
+        ConnectFour: The game in the requested position.
+    """
+    game = game_class([None, None])
+    for move in moves:
+        game.play_move(move)
+    return game
+
+
+def benchmark_search(depth):
+    """
+    Compare nodes per second of Negamax with copied games and with make/unmake moves.
+
+    Args:
+        depth (int): The depth of the Negamax search.
+    """
+    for name, game_class in (('copy', CopyingConnectFour), ('unmake', CountingConnectFour)):
+        CountingConnectFour.nodes = 0
+        start = time.perf_counter()
+        for moves in POSITIONS:
+            Negamax(depth)(setup_position(game_class, moves))
+        elapsed = time.perf_counter() - start
+        nodes = CountingConnectFour.nodes
+        print(f'{name:>8}: {nodes} nodes in {elapsed:.2f} s, {nodes / elapsed:,.0f} nodes/s')
+
+
+def benchmark_transposition_table(depth, size_bits):
+    """
+    Compare Negamax without and with a transposition table, reporting its hit rate and memory use.
+
+    Args:
+        depth (int): The depth of the Negamax search.
+        size_bits (int): The transposition table has 2 ** size_bits buckets.
+    """
+    for name, tt in (('no tt', None), ('tt', BoundedTranspositionTable(size_bits))):
+        CountingConnectFour.nodes = 0
+        start = time.perf_counter()
+        for moves in POSITIONS:
+            Negamax(depth, tt=tt)(setup_position(CountingConnectFour, moves))
+        elapsed = time.perf_counter() - start
+        print(f'{name:>8}: {CountingConnectFour.nodes} nodes in {elapsed:.2f} s')
+    print(f'hit rate: {tt.hit_rate:.1%}, used slots: {tt.used_slots()}, memory: {tt.memory_bytes / 2 ** 20:.1f} MiB')
+
+
+def benchmark_evaluators(games, time_per_move, seed):
+    """
+    Play the heuristic scoring against the win/loss scoring with a fixed time per move.
+
+    Every game starts from two random moves and the evaluators switch sides every game.
+
+    Args:
+        games (int): The number of games to play.
+        time_per_move (float): The time budget of every move in seconds.
+        seed (int): The seed of the random openings.
+    """
+    evaluators = {
+        'heuristic': IterativeDeepening(time_per_move * 1000),
+        'win/loss': IterativeDeepening(time_per_move * 1000, scoring=win_loss_scoring),
+    }
+    results = {'heuristic': 0, 'win/loss': 0, 'draw': 0}
+    depths = {name: [] for name in evaluators}
+    rng = random.Random(seed)
+    for number in range(games):
+        names = ['heuristic', 'win/loss'] if number % 2 == 0 else ['win/loss', 'heuristic']
+        game = setup_position(ConnectFour, [rng.randrange(7), rng.randrange(7)])
+        while not game.is_over():
+            name = names[game.current_player - 1]
+            move = evaluators[name](game)
+            depths[name].append(evaluators[name].depth)
+            game.play_move(move)
+        results[names[game.opponent_index - 1] if game.lose() else 'draw'] += 1
+    print(f'{games} games, {time_per_move:.2f} s per move')
+    for name, count in results.items():
+        average_depth = f', average depth {sum(depths[name]) / len(depths[name]):.1f}' if name in depths else ''
+        print(f'{name:>10}: {count}{average_depth}')
+
+
+def benchmark_parallel(depths, workers_counts):
+    """
+    Measure how the parallel root-split search scales with the number of workers.
+
+    Every search is checked to return the same move as the serial search.
+
+    Args:
+        depths (list): The search depths to measure.
+        workers_counts (list): The numbers of worker processes to measure.
+    """
+    positions = [ConnectFour.from_moves(moves) for moves in POSITIONS]
+    for depth in depths:
+        start = time.perf_counter()
+        serial_moves = [IterativeDeepening(time_limit_ms=None).search(game, depth)[1][0] for game in positions]
+        serial_time = time.perf_counter() - start
+        print(f'depth {depth}: serial {serial_time:.2f} s')
+        for workers in workers_counts:
+            with ParallelRootSearch(depth, workers) as search:
+                search(positions[0])  # start the worker processes
+                start = time.perf_counter()
+                moves = [search(game) for game in positions]
+                elapsed = time.perf_counter() - start
+            same = 'same moves' if moves == serial_moves else f'DIFFERENT MOVES {moves} != {serial_moves}'
+            print(f'  {workers} workers: {elapsed:.2f} s, speedup {serial_time / elapsed:.2f}x, {same}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Connect Four AI benchmarks.')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    search_parser = subparsers.add_parser('search', help='nodes/s with copied games vs make/unmake moves')
+    search_parser.add_argument('--depth', type=int, default=6)
+
+    tt_parser = subparsers.add_parser('tt', help='Negamax without and with the transposition table')
+    tt_parser.add_argument('--depth', type=int, default=8)
+    tt_parser.add_argument('--size-bits', type=int, default=18)
+
+    evaluators_parser = subparsers.add_parser('evaluators', help='heuristic vs win/loss scoring at fixed time per move')
+    evaluators_parser.add_argument('--games', type=int, default=10)
+    evaluators_parser.add_argument('--time-per-move', type=float, default=0.2)
+    evaluators_parser.add_argument('--seed', type=int, default=0)
+
+    parallel_parser = subparsers.add_parser('parallel', help='parallel root-split search scaling')
+    parallel_parser.add_argument('--depths', type=int, nargs='+', default=[8, 10, 12])
+    parallel_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+
+    args = parser.parse_args()
+    if args.benchmark == 'search':
+        benchmark_search(args.depth)
+    elif args.benchmark == 'tt':
+        benchmark_transposition_table(args.depth, args.size_bits)
+    elif args.benchmark == 'evaluators':
+        benchmark_evaluators(args.games, args.time_per_move, args.seed)
+    elif args.benchmark == 'parallel':
+        benchmark_parallel(args.depths, args.workers)
@@ -1,5 +1,6 @@
 from easyAI import TwoPlayerGame
 import numpy as np
+import random
 
 
 """
@@ -24,6 +25,73 @@ https://instructions.hasbro.com/en-my/instruction/connect-4-game
 Authors: Adam Łuszcz, Anna Rogala
 """
 
+WIDTH = 7
+HEIGHT = 6
+# Every column takes HEIGHT + 1 bits of the bitboard: the extra sentinel bit on top
+# of each column is always empty, so shifted lines never wrap into the next column.
+COLUMN_BITS = HEIGHT + 1
+
+BOTTOM_MASK = sum(1 << (column * COLUMN_BITS) for column in range(WIDTH))
+BOARD_MASK = BOTTOM_MASK * ((1 << HEIGHT) - 1)
+TOP_MASKS = [1 << (column * COLUMN_BITS + HEIGHT - 1) for column in range(WIDTH)]
+CENTRE_MASK = ((1 << HEIGHT) - 1) << (WIDTH // 2 * COLUMN_BITS)
+
+# Legal moves for every combination of full columns, indexed by a 7-bit "full columns" mask.
+LEGAL_MOVES = [
+    tuple(column for column in range(WIDTH) if not full_columns & (1 << column))
+    for full_columns in range(1 << WIDTH)
+]
+
+# Random 64-bit keys for every (player, cell) pair, XOR-ed into the Zobrist hash of a position.
+# The generator is seeded so that hashes are the same in every process and every run.
+_zobrist_random = random.Random(20231107)
+ZOBRIST_KEYS = [
+    [_zobrist_random.getrandbits(64) for bit in range(WIDTH * COLUMN_BITS)]
+    for player in range(2)
+]
+
+# Masks of all 69 lines of four cells a player can win with.
+WINNING_LINES = [
+    sum(1 << ((column + k * dc) * COLUMN_BITS + row + k * dr) for k in range(4))
+    for dc, dr in ((1, 0), (0, 1), (1, 1), (1, -1))
+    for column in range(WIDTH)
+    for row in range(HEIGHT)
+    if 0 <= column + 3 * dc < WIDTH and 0 <= row + 3 * dr < HEIGHT
+]
+# Indexes of the winning lines passing through every cell.
+CELL_LINES = [
+    tuple(line for line, mask in enumerate(WINNING_LINES) if mask >> cell & 1)
+    for cell in range(WIDTH * COLUMN_BITS)
+]
+
+# Heuristic evaluation weights: open windows (lines with checkers of only one player)
+# holding two or three checkers, and every checker in the centre column.
+TWO_WEIGHT = 2
+THREE_WEIGHT = 5
+CENTRE_WEIGHT = 3
+# Heuristic scores are kept inside (-MAX_HEURISTIC, MAX_HEURISTIC) so that they can
+# never compete with a win or a loss (+-100), even after easyAI's depth bonus.
+MAX_HEURISTIC = 90
+
+# A line state is `5 * checkers of player 1 + checkers of player 2`. Every state has a
+# score from the point of view of player 1, and every player a score change for adding
+# one checker to a line in the given state.
+LINE_STEPS = (5, 1)
+_WINDOW_WEIGHTS = (0, 0, TWO_WEIGHT, THREE_WEIGHT, 0)
+LINE_SCORES = [
+    0 if state // 5 and state % 5 else _WINDOW_WEIGHTS[state // 5] - _WINDOW_WEIGHTS[state % 5]
+    for state in range(25)
+]
+LINE_DELTAS = [
+    [LINE_SCORES[state + step] - LINE_SCORES[state] if state + step < 25 else 0 for state in range(25)]
+    for step in LINE_STEPS
+]
+CELL_SCORES = [
+    [sign * CENTRE_WEIGHT if cell // COLUMN_BITS == WIDTH // 2 else 0 for cell in range(WIDTH * COLUMN_BITS)]
+    for sign in (1, -1)
+]
+
+
 class ConnectFour(TwoPlayerGame):
     def __init__(self, players):
         """
@@ -35,12 +103,63 @@ class ConnectFour(TwoPlayerGame):
 
         Attributes:
             - players (list): The list of players.
-            - board (numpy.ndarray): A 6x7 grid representing the game board.
+            - bitboards (list): Two integers, one per player, with a bit set for every checker
+                                of that player. Bit `column * 7 + row` is the cell in the given
+                                column and row (row 0 is the bottom one).
+            - heights (list): For every column, the index of the bit of its first free cell.
+            - full_columns (int): A 7-bit mask of the columns that are already full.
+            - moves (list): The stack of columns played so far, used to unmake moves.
+            - last_move (int): The bit of the last dropped checker, or 0 before the first move.
+            - zobrist_hash (int): The 64-bit Zobrist hash of the position, updated with every move.
+            - line_states (list): The state of every winning line, see LINE_SCORES.
+            - position_score (int): The heuristic score of the position for player 1,
+                                    updated with every move.
             - current_player (int): The ID of the current player (1 or 2).
         """
         self.players = players
-        self.board = np.zeros((6, 7), dtype=int)
+        self.bitboards = [0, 0]
+        self.heights = [column * COLUMN_BITS for column in range(WIDTH)]
+        self.full_columns = 0
+        self.moves = []
+        self.last_move = 0
+        self.zobrist_hash = 0
+        self.line_states = [0] * len(WINNING_LINES)
+        self.position_score = 0
         self.current_player = 1
+        self._lost = None
+
+    @classmethod
+    def from_moves(cls, moves, players=None):
+        """
+        Create a game in the position reached by playing the given moves.
+
+        Args:
+            moves (list): The columns played from the empty board.
+            players (list): The players of the game, two placeholders if not given.
+
+        Returns:
+            ConnectFour: The game after the moves, with the next player to move.
+        """
+        game = cls(players if players is not None else [None, None])
+        for column in moves:
+            game.play_move(column)
+        return game
+
+    @property
+    def board(self):
+        """
+        Build a 6x7 grid view of the game board.
+
+        Returns:
+            numpy.ndarray: A 6x7 grid with 0 for empty cells and the player ID (1 or 2) otherwise.
+        """
+        board = np.zeros((HEIGHT, WIDTH), dtype=int)
+        for player, bitboard in enumerate(self.bitboards, start=1):
+            for column in range(WIDTH):
+                for row in range(HEIGHT):
+                    if bitboard >> (column * COLUMN_BITS + row) & 1:
+                        board[row, column] = player
+        return board
 
     def possible_moves(self):
         """
@@ -49,13 +168,7 @@ class ConnectFour(TwoPlayerGame):
         Returns:
             list: A list of column numbers (0-6) where a checker can be placed.
         """
-        moves = []
-        for i in range(7):
-            for row in self.board:
-                if row[i] == 0:
-                    moves.append(i)
-                    break
-        return moves
+        return list(LEGAL_MOVES[self.full_columns])
 
     def make_move(self, column):
         """
@@ -64,17 +177,93 @@ class ConnectFour(TwoPlayerGame):
         Args:
             column (int): The column where the checker is to be placed.
         """
-        for row in range(6):
-            if self.board[row, column] == 0:
-                self.board[row, column] = self.current_player
-                break
+        player = self.current_player - 1
+        cell = self.heights[column]
+        bit = 1 << cell
+        self.bitboards[player] |= bit
+        self.zobrist_hash ^= ZOBRIST_KEYS[player][cell]
+        self.heights[column] = cell + 1
+
+        line_states = self.line_states
+        step = LINE_STEPS[player]
+        deltas = LINE_DELTAS[player]
+        score = self.position_score + CELL_SCORES[player][cell]
+        for line in CELL_LINES[cell]:
+            state = line_states[line]
+            score += deltas[state]
+            line_states[line] = state + step
+        self.position_score = score
+        if bit & TOP_MASKS[column]:
+            self.full_columns |= 1 << column
+        self.moves.append(column)
+        self.last_move = bit
+        self._lost = None
+
+    def unmake_move(self, column):
+        """
+        Take back the last move, which was made by the current player in the specified column.
+
+        easyAI calls it after switching the player back, which lets Negamax search
+        the game in place instead of copying it for every child.
+
+        Args:
+            column (int): The column of the last move.
+        """
+        player = self.current_player - 1
+        self.moves.pop()
+        cell = self.heights[column] - 1
+        self.heights[column] = cell
+        self.bitboards[player] ^= 1 << cell
+        self.zobrist_hash ^= ZOBRIST_KEYS[player][cell]
+
+        line_states = self.line_states
+        step = LINE_STEPS[player]
+        deltas = LINE_DELTAS[player]
+        score = self.position_score - CELL_SCORES[player][cell]
+        for line in CELL_LINES[cell]:
+            state = line_states[line] - step
+            score -= deltas[state]
+            line_states[line] = state
+        self.position_score = score
+        self.full_columns &= ~(1 << column)
+        self.last_move = 1 << (self.heights[self.moves[-1]] - 1) if self.moves else 0
+        self._lost = None
+
+    def ttentry(self):
+        """
+        Get a key that identifies the position, used by transposition tables.
+
+        The key is the current player's bitboard added to the mask of all checkers.
+        The addition moves a bit above the top checker of each column, so the key
+        is unique for every position and fits in 49 bits.
+
+        Returns:
+            int: The key of the position.
+        """
+        return self.bitboards[self.current_player - 1] + (self.bitboards[0] | self.bitboards[1])
+
+    def copy(self):
+        """
+        Copy the game state without deep-copying the players.
+
+        Returns:
+            ConnectFour: A new game with the same position and the same players.
+        """
+        game = self.__class__.__new__(self.__class__)
+        game.__dict__.update(self.__dict__)
+        game.bitboards = self.bitboards[:]
+        game.heights = self.heights[:]
+        game.moves = self.moves[:]
+        game.line_states = self.line_states[:]
+        return game
 
     def show(self):
         """
         Display the current state of the game board.
         """
+        board = self.board
         for row in range(6):
-            row_str = ' '.join([['.', '1', '2'][self.board[5 - row][col]] for col in range(7)])
+            row_str = ' '.join([['.', '1', '2'][board[5 - row][col]] for col in range(7)])
             print(row_str)
         print("-" * 13)
         print("0 1 2 3 4 5 6")
@@ -83,10 +272,18 @@ class ConnectFour(TwoPlayerGame):
         """
         Check if the current player has lost the game.
 
+        Only the lines through the last dropped checker can have been completed
+        by the previous move, so only those are checked. The result is kept until
+        the next move, as it is asked for by both is_over() and scoring().
+
         Returns:
             bool: True if the current player has lost, False otherwise.
         """
-        return find_four(self.board, self.opponent_index)
+        if self._lost is None:
+            last_move = self.last_move
+            bitboard = self.bitboards[0] if self.bitboards[0] & last_move else self.bitboards[1]
+            self._lost = bool(last_move) and find_four_through(bitboard, last_move)
+        return self._lost
 
     def is_over(self):
         """
@@ -95,48 +292,118 @@ class ConnectFour(TwoPlayerGame):
         Returns:
             bool: True if the game is over, False otherwise.
         """
-        return (self.board.min() > 0) or self.lose()
+        return (self.bitboards[0] | self.bitboards[1]) == BOARD_MASK or self.lose()
 
     def scoring(self):
         """
         Define the scoring for the game.
 
+        Positions that are not lost are scored with the heuristic position score:
+        open windows of two and three checkers and checkers in the centre column,
+        counted for the current player and against the opponent.
+
         Returns:
-            int: -100 if the current player has lost, otherwise 0.
+            int: -100 if the current player has lost, otherwise the heuristic score
+                 between -MAX_HEURISTIC and MAX_HEURISTIC.
         """
-        return -100 if self.lose() else 0
+        if self.lose():
+            return -100
+        score = self.position_score if self.current_player == 1 else -self.position_score
+        return max(-MAX_HEURISTIC, min(MAX_HEURISTIC, score))
+
+
+def win_loss_scoring(game):
+    """
+    Score a game only by its result, without any heuristic.
 
+    Args:
+        game (ConnectFour): The game to score.
 
-def find_four(board, opponent_player):
+    Returns:
+        int: -100 if the current player has lost, otherwise 0.
+    """
+    return -100 if game.lose() else 0
+
+
+def evaluate(bitboards):
+    """
+    Compute the heuristic position score from scratch, using the winning line masks.
+
+    ConnectFour keeps this score up to date move by move in `position_score`,
+    this function is the reference it can be checked against.
+
+    Args:
+        bitboards (list): The bitboards of player 1 and player 2.
+
+    Returns:
+        int: The heuristic score of the position for player 1.
+    """
+    first, second = bitboards
+    score = CENTRE_WEIGHT * (
+        (first & CENTRE_MASK).bit_count() - (second & CENTRE_MASK).bit_count()
+    )
+    for mask in WINNING_LINES:
+        score += LINE_SCORES[5 * (first & mask).bit_count() + (second & mask).bit_count()]
+    return score
+
+
+def find_four(bitboard):
     """
     Check if a player has formed a line of four checkers on the game board.
 
+    The bitboard is shifted against itself in each direction: vertical (1),
+    horizontal (7) and both diagonals (6 and 8), so every line of four
+    leaves at least one bit set after the two shift-and-mask steps.
+
     Args:
-        board (numpy.ndarray): The game board.
-        opponent_player (int): The ID of the opponent player (1 or 2).
+        bitboard (int): The bitboard of the player to check.
 
     Returns:
         bool: True if a line of four checkers is found, False otherwise.
     """
-    directions = [(1, 0), (0, 1), (1, 1), (1, -1)]
-
-    for i in range(6):
-        for j in range(7):
-            for dr, dc in directions:
-                for k in range(4):
-                    r, c = i + k * dr, j + k * dc
-                    if 0 <= r < 6 and 0 <= c < 7 and board[r, c] == opponent_player:
-                        if k == 3:
-                            return True
-                    else:
-                        break
+    for shift in (1, COLUMN_BITS, COLUMN_BITS - 1, COLUMN_BITS + 1):
+        pairs = bitboard & (bitboard >> shift)
+        if pairs & (pairs >> 2 * shift):
+            return True
+
+    return False
+
+
+def find_four_through(bitboard, bit):
+    """
+    Check if a player has a line of four checkers passing through the given cell.
+
+    Args:
+        bitboard (int): The bitboard of the player to check.
+        bit (int): The bit of the cell the line has to pass through.
+
+    Returns:
+        bool: True if a line of four checkers passes through the cell, False otherwise.
+    """
+    for shift in (1, COLUMN_BITS, COLUMN_BITS - 1, COLUMN_BITS + 1):
+        count = 1
+        probe = bit << shift
+        while probe & bitboard:
+            count += 1
+            probe <<= shift
+        probe = bit >> shift
+        while probe & bitboard:
+            count += 1
+            probe >>= shift
+        if count >= 4:
+            return True
 
     return False
 
 if __name__ == '__main__':
-    from easyAI import Human_Player, AI_Player, Negamax
+    import os
+    from easyAI import Human_Player, AI_Player
+    from opening_book import OpeningBook
+    from search import IterativeDeepening
+    from transposition_table import BoundedTranspositionTable
 
-    ai = Negamax(6)
+    book = OpeningBook('opening_book.bin') if os.path.isfile('opening_book.bin') else None
+    ai = IterativeDeepening(time_limit_ms=1000, tt=BoundedTranspositionTable(), book=book)
     game = ConnectFour([Human_Player(), AI_Player(ai)])
     game.play()
     if game.lose():
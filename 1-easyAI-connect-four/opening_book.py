@@ -0,0 +1,171 @@
+import argparse
+import mmap
+import multiprocessing
+import struct
+import time
+
+from connect_four import ConnectFour
+from search import IterativeDeepening
+
+
+"""
+Opening book for the Connect Four AI.
+
+The builder searches every position reachable in the first plies and writes one
+fixed-width record per position to a file sorted by position key:
+- the 49-bit position key from `ConnectFour.ttentry()` (unsigned 64-bit),
+- the best move (signed 8-bit),
+- the score of the position for the player to move (32-bit float).
+
+At runtime the file is memory-mapped and binary-searched, so nothing is loaded
+up front and every lookup reads only O(log n) records.
+
+How to run:
+---
+Build the book with e.g.: `python3 opening_book.py --plies 4 --depth 10 --output opening_book.bin`.
+Run `python3 opening_book.py --help` to see all options.
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+RECORD = struct.Struct('<Qbf')
+KEY = struct.Struct('<Q')
+
+
+def opening_positions(plies):
+    """
+    List all different positions reachable in at most the given number of plies, without finished games.
+
+    Args:
+        plies (int): The number of plies from the empty board.
+
+    Returns:
+        list: The moves leading to every position, one list of columns per position.
+    """
+    positions = {}
+    frontier = [[]]
+    for ply in range(plies + 1):
+        next_frontier = []
+        for moves in frontier:
+            game = ConnectFour.from_moves(moves)
+            key = game.ttentry()
+            if key in positions or game.is_over():
+                continue
+            positions[key] = moves
+            if ply < plies:
+                next_frontier.extend(moves + [column] for column in game.possible_moves())
+        frontier = next_frontier
+    return list(positions.values())
+
+
+def _search_position(moves, depth, time_limit_ms):
+    """
+    Search one book position in a worker process.
+
+    Args:
+        moves (list): The columns leading to the position.
+        depth (int): The depth to search to.
+        time_limit_ms (float): The time limit of the search in milliseconds, or None.
+
+    Returns:
+        tuple: The key of the position, the best move and the score.
+    """
+    game = ConnectFour.from_moves(moves)
+    search = IterativeDeepening(time_limit_ms=time_limit_ms, max_depth=depth)
+    move = search(game)
+    return game.ttentry(), move, search.value
+
+
+def build_book(output, plies, depth, time_limit_ms=None, workers=None):
+    """
+    Search all opening positions and write the book file.
+
+    Args:
+        output (str): The path of the book file.
+        plies (int): The book covers positions up to this many plies.
+        depth (int): The depth to search every position to.
+        time_limit_ms (float): The time limit of every search in milliseconds, or None.
+        workers (int): The number of worker processes, the number of CPUs if not given.
+
+    Returns:
+        int: The number of positions in the book.
+    """
+    positions = opening_positions(plies)
+    tasks = [(moves, depth, time_limit_ms) for moves in positions]
+    with multiprocessing.Pool(workers) as pool:
+        records = pool.starmap(_search_position, tasks, chunksize=8)
+    records.sort()
+    with open(output, 'wb') as file:
+        for record in records:
+            file.write(RECORD.pack(*record))
+    return len(records)
+
+
+class OpeningBook:
+    def __init__(self, path):
+        """
+        Open a book file built with `build_book`.
+
+        Args:
+            path (str): The path of the book file.
+
+        Attributes:
+            - size (int): The number of positions in the book.
+        """
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = len(self.data) // RECORD.size
+
+    def lookup(self, game):
+        """
+        Find the position of the game in the book.
+
+        Args:
+            game (ConnectFour): The game to look up.
+
+        Returns:
+            tuple: The best move and the score of the position, or None if it is not in the book.
+        """
+        key = game.ttentry()
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if KEY.unpack_from(self.data, middle * RECORD.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.size:
+            record_key, move, score = RECORD.unpack_from(self.data, low * RECORD.size)
+            if record_key == key:
+                return move, score
+        return None
+
+    def close(self):
+        """
+        Unmap and close the book file.
+        """
+        self.data.close()
+        self.file.close()
+
+    def __deepcopy__(self, memo):
+        """
+        Share the book instead of copying it.
+
+        The book is read-only, and easyAI's `play()` deep-copies the players before every
+        move, which cannot copy the open file and its memory map.
+        """
+        return self
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the Connect Four opening book.')
+    parser.add_argument('--plies', type=int, default=4, help='the book covers positions up to this many plies')
+    parser.add_argument('--depth', type=int, default=10, help='the search depth of every position')
+    parser.add_argument('--time-ms', type=float, default=None, help='time limit of every search')
+    parser.add_argument('--output', default='opening_book.bin')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = build_book(args.output, args.plies, args.depth, args.time_ms, args.workers)
+    print(f'{count} positions written to {args.output} in {time.perf_counter() - start:.1f} s')
@@ -0,0 +1,147 @@
+import math
+import multiprocessing
+
+from connect_four import ConnectFour
+from search import IterativeDeepening, ORDERED_MOVES, inf
+
+
+"""
+Parallel root-split search for the Connect Four AI.
+
+The root moves are searched in separate processes. The workers share the best
+score found so far (alpha) and its move through shared memory, so every subtree
+searched after a good move is pruned with the tighter bound.
+
+It can be used anywhere an easyAI AI algorithm is expected, e.g.
+`AI_Player(ParallelRootSearch(10, workers=4))`, and it returns the same move as
+`IterativeDeepening().search(game, depth)`.
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+# Worker process state, set up by _init_worker.
+_shared = None
+_scoring = None
+
+
+def _init_worker(shared, scoring):
+    """
+    Store the shared bound and the scoring function in a worker process.
+
+    Args:
+        shared (multiprocessing.Array): The best score so far and the index of its root move.
+        scoring (function): The scoring function of the search, None for the game's own.
+    """
+    global _shared, _scoring
+    _shared = shared
+    _scoring = scoring
+
+
+def _search_root_move(moves, index, move, depth):
+    """
+    Score one root move in a worker process.
+
+    Moves ordered before the current best one are searched with a window just below
+    the shared alpha, so that a tie is still scored exactly and, as in the serial
+    search, the first of equally good moves wins.
+
+    Args:
+        moves (list): The columns played to reach the root position.
+        index (int): The position of the move in the root move order.
+        move (int): The root move to score.
+        depth (int): The depth of the whole search.
+
+    Returns:
+        tuple: The index of the move, its score and the number of searched nodes.
+    """
+    game = ConnectFour.from_moves(moves)
+    game.make_move(move)
+    game.switch_player()
+
+    with _shared.get_lock():
+        alpha, best_index = _shared[0], _shared[1]
+    if index < best_index:
+        alpha = math.nextafter(alpha, -inf)
+
+    searcher = IterativeDeepening(time_limit_ms=None, scoring=_scoring)
+    value, principal_variation = searcher.search(game, depth - 1, -inf, -alpha)
+    value = -value
+
+    with _shared.get_lock():
+        if value > alpha and (value > _shared[0] or (value == _shared[0] and index < _shared[1])):
+            _shared[0], _shared[1] = value, index
+    return index, value, searcher.nodes
+
+
+class ParallelRootSearch:
+    def __init__(self, depth, workers=None, scoring=None):
+        """
+        Initialize the search. The process pool is started with the first search.
+
+        Args:
+            depth (int): The depth to search to.
+            workers (int): The number of worker processes, the number of CPUs if not given.
+            scoring (function): A function f(game) -> score defined at module level.
+                                The game's `scoring` method is used if not given.
+
+        Attributes:
+            - value (float): The score of the best move of the last search.
+            - nodes (int): The number of nodes searched by all workers in the last search.
+        """
+        self.depth = depth
+        self.workers = workers or multiprocessing.cpu_count()
+        self.scoring = scoring
+        self.value = None
+        self.nodes = 0
+        self.shared = None
+        self.pool = None
+
+    def __call__(self, game):
+        """
+        Find the best move for the current player.
+
+        Args:
+            game (ConnectFour): The game to find a move for.
+
+        Returns:
+            int: The column to play.
+        """
+        if self.pool is None:
+            self.shared = multiprocessing.Array('d', 2)
+            self.pool = multiprocessing.Pool(self.workers, _init_worker, (self.shared, self.scoring))
+
+        root_moves = ORDERED_MOVES[game.full_columns]
+        with self.shared.get_lock():
+            self.shared[0], self.shared[1] = -inf, len(root_moves)
+
+        tasks = [(game.moves, index, move, self.depth) for index, move in enumerate(root_moves)]
+        self.nodes = 1
+        for index, value, nodes in self.pool.starmap(_search_root_move, tasks, chunksize=1):
+            self.nodes += nodes
+
+        self.value, best_index = self.shared[0], int(self.shared[1])
+        return root_moves[best_index]
+
+    def close(self):
+        """
+        Stop the worker processes.
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __deepcopy__(self, memo):
+        """
+        Share the search instead of copying it.
+
+        easyAI's `play()` deep-copies the players before every move; the process pool and
+        the shared bound cannot be copied, and the copy would start a new pool every move.
+        """
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
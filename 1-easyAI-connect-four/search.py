@@ -0,0 +1,226 @@
+import time
+
+from easyAI.AI.Negamax import LOWERBOUND, EXACT, UPPERBOUND
+
+from connect_four import LEGAL_MOVES, WIDTH, HEIGHT
+
+
+"""
+Iterative-deepening, time-bounded search for the Connect Four AI.
+
+It can be used anywhere an easyAI AI algorithm is expected, e.g.
+`AI_Player(IterativeDeepening(time_limit_ms=500))`.
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+inf = float('infinity')
+
+# Columns closer to the centre take part in more winning lines, so they are tried first.
+CENTRE_FIRST = sorted(range(WIDTH), key=lambda column: abs(column - WIDTH // 2))
+ORDERED_MOVES = [
+    [column for column in CENTRE_FIRST if column in legal_moves]
+    for legal_moves in LEGAL_MOVES
+]
+# How many nodes are searched between two checks of the clock.
+CLOCK_CHECK_INTERVAL = 1024
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the search when the deadline of the move has passed.
+    """
+
+
+class IterativeDeepening:
+    def __init__(self, time_limit_ms=1000, max_depth=None, scoring=None, tt=None, book=None):
+        """
+        Initialize the search.
+
+        Args:
+            time_limit_ms (float): The time to search for a move, in milliseconds.
+                                   None searches until max_depth without a deadline.
+            max_depth (int): The deepest search to run, None for no limit other than
+                             the number of empty cells.
+            scoring (function): A function f(game) -> score. The game's `scoring`
+                                method is used if not given.
+            tt (BoundedTranspositionTable): An optional transposition table.
+            book (OpeningBook): An optional opening book, positions found in it are not searched.
+
+        Attributes:
+            - depth (int): The depth of the last completed search.
+            - value (float): The score of the best move at that depth.
+            - principal_variation (list): The expected moves of both players at that depth.
+            - nodes (int): The number of nodes searched for the last move.
+        """
+        self.time_limit_ms = time_limit_ms
+        self.max_depth = max_depth
+        self.scoring = scoring
+        self.tt = tt
+        self.book = book
+        self.depth = 0
+        self.value = None
+        self.principal_variation = []
+        self.nodes = 0
+        self.deadline = inf
+
+    def __call__(self, game):
+        """
+        Find the best move for the current player, searching deeper until the time runs out.
+
+        Only fully searched depths count: the move from the last completed depth is returned.
+        Positions in the opening book are answered from the book without searching.
+
+        Args:
+            game (ConnectFour): The game to find a move for. It is searched in place
+                                and left in the same position.
+
+        Returns:
+            int: The column to play.
+        """
+        start = time.perf_counter()
+        self.nodes = 0
+        self.principal_variation = []
+        self.deadline = inf
+        if self.book is not None:
+            entry = self.book.lookup(game)
+            if entry is not None:
+                move, self.value = entry
+                self.depth = 0
+                self.principal_variation = [move]
+                return move
+        root_moves = len(game.moves)
+        empty_cells = WIDTH * HEIGHT - root_moves
+        max_depth = empty_cells if self.max_depth is None else min(self.max_depth, empty_cells)
+
+        move = ORDERED_MOVES[game.full_columns][0]
+        for depth in range(1, max_depth + 1):
+            try:
+                value, principal_variation = self.search(game, depth)
+            except SearchTimeout:
+                self.unwind(game, len(game.moves) - root_moves)
+                break
+            move = principal_variation[0]
+            self.depth, self.value, self.principal_variation = depth, value, principal_variation
+            # A forced win or loss will not change with deeper searches.
+            if abs(value) >= 100:
+                break
+            # The first depth always completes, so there is always a move to return.
+            if self.time_limit_ms is not None:
+                self.deadline = start + self.time_limit_ms / 1000
+                if time.perf_counter() >= self.deadline:
+                    break
+        return move
+
+    def search(self, game, depth, alpha=-inf, beta=inf):
+        """
+        Search the game to a fixed depth with alpha-beta Negamax.
+
+        Args:
+            game (ConnectFour): The game to search.
+            depth (int): The depth to search to.
+            alpha (float): The lower bound of the search window.
+            beta (float): The upper bound of the search window.
+
+        Returns:
+            tuple: The score of the position and the principal variation (list of moves).
+        """
+        self.pv_table = [[] for ply in range(depth + 1)]
+        value = self.negamax(game, depth, alpha, beta, 0, True)
+        return value, self.pv_table[0]
+
+    def negamax(self, game, depth, alpha, beta, ply, on_pv=False):
+        """
+        Score the game with alpha-beta Negamax, as easyAI's Negamax would.
+
+        Moves are tried in this order: the principal variation of the previous depth,
+        the transposition table move and then the columns from the centre outwards.
+
+        Args:
+            game (ConnectFour): The game to search.
+            depth (int): The remaining depth.
+            alpha (float): The lower bound of the search window.
+            beta (float): The upper bound of the search window.
+            ply (int): The distance from the root of the search.
+            on_pv (bool): Whether the moves so far follow the previous principal variation.
+
+        Returns:
+            float: The score of the position for the current player.
+        """
+        self.nodes += 1
+        if self.nodes % CLOCK_CHECK_INTERVAL == 0 and time.perf_counter() >= self.deadline:
+            raise SearchTimeout()
+
+        self.pv_table[ply] = []
+        if depth == 0 or game.is_over():
+            # Quicker wins and slower losses score better, as in easyAI.
+            score = self.scoring(game) if self.scoring else game.scoring()
+            return score * (1 + 0.001 * depth)
+
+        alpha_orig = alpha
+        tt = self.tt
+        entry = tt.lookup(game) if tt is not None else None
+        if entry is not None and entry['depth'] >= depth and ply > 0:
+            flag, value = entry['flag'], entry['value']
+            if flag == EXACT:
+                return value
+            elif flag == LOWERBOUND:
+                alpha = max(alpha, value)
+            elif flag == UPPERBOUND:
+                beta = min(beta, value)
+            if alpha >= beta:
+                return value
+
+        moves = ORDERED_MOVES[game.full_columns]
+        first_moves = []
+        pv_move = None
+        if on_pv and ply < len(self.principal_variation):
+            pv_move = self.principal_variation[ply]
+            first_moves.append(pv_move)
+        if entry is not None and entry['move'] not in first_moves:
+            first_moves.append(entry['move'])
+        if first_moves:
+            moves = first_moves + [move for move in moves if move not in first_moves]
+
+        best_value = -inf
+        best_move = moves[0]
+        for move in moves:
+            game.make_move(move)
+            game.switch_player()
+            value = -self.negamax(game, depth - 1, -beta, -alpha, ply + 1, move == pv_move)
+            game.switch_player()
+            game.unmake_move(move)
+
+            if value > best_value:
+                best_value = value
+                best_move = move
+            if value > alpha:
+                alpha = value
+                self.pv_table[ply] = [move] + self.pv_table[ply + 1]
+                if alpha >= beta:
+                    break
+
+        if not self.pv_table[ply]:
+            self.pv_table[ply] = [best_move]
+        if tt is not None:
+            if best_value <= alpha_orig:
+                flag = UPPERBOUND
+            elif best_value >= beta:
+                flag = LOWERBOUND
+            else:
+                flag = EXACT
+            tt.store(game=game, depth=depth, value=best_value, move=best_move, flag=flag)
+        return best_value
+
+    @staticmethod
+    def unwind(game, moves):
+        """
+        Take back the moves an interrupted search left on the game.
+
+        Args:
+            game (ConnectFour): The searched game.
+            moves (int): The number of moves to take back.
+        """
+        for _ in range(moves):
+            game.switch_player()
+            game.unmake_move(game.moves[-1])
@@ -0,0 +1,154 @@
+import argparse
+import json
+import multiprocessing
+import random
+import time
+
+from connect_four import ConnectFour, win_loss_scoring
+from search import IterativeDeepening
+
+
+"""
+Headless batch self-play for the Connect Four AI.
+
+It plays AI-vs-AI games in worker processes and writes one JSON line per game
+to the output file, as soon as the game is finished:
+- game: the number of the game,
+- opening: how many of the first moves were random,
+- moves: all columns played,
+- winner: 1 or 2, or 0 for a draw,
+- nodes: the nodes searched for every AI move,
+- times_ms: the thinking time of every AI move in milliseconds.
+
+How to run:
+---
+Run e.g. `python3 self_play.py --games 10000 --depth 4 6 --opening-plies 4 --output games.jsonl`.
+Run `python3 self_play.py --help` to see all options.
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+EVALUATORS = {
+    'heuristic': None,
+    'win-loss': win_loss_scoring,
+}
+
+# Worker process state, set up by _init_worker.
+_players = None
+_opening_plies = 0
+_seed = 0
+
+
+def _init_worker(depths, evaluators, time_limits_ms, opening_plies, seed):
+    """
+    Create the AI of both players in a worker process.
+
+    Args:
+        depths (list): The search depth of player 1 and player 2.
+        evaluators (list): The evaluator names (keys of EVALUATORS) of both players.
+        time_limits_ms (list): The time per move of both players in milliseconds, or None.
+        opening_plies (int): How many random moves open every game.
+        seed (int): The seed of the random openings.
+    """
+    global _players, _opening_plies, _seed
+    _players = [
+        IterativeDeepening(time_limit_ms=time_limit_ms, max_depth=depth, scoring=EVALUATORS[evaluator])
+        for depth, evaluator, time_limit_ms in zip(depths, evaluators, time_limits_ms)
+    ]
+    _opening_plies = opening_plies
+    _seed = seed
+
+
+def play_game(number):
+    """
+    Play one game between the AI players of the worker process.
+
+    Args:
+        number (int): The number of the game. Together with the seed it decides the opening.
+
+    Returns:
+        dict: The game record described in the module docstring.
+    """
+    rng = random.Random(_seed * 1_000_003 + number)
+    game = ConnectFour([None, None])
+    for _ in range(_opening_plies):
+        if game.is_over():
+            break
+        game.play_move(rng.choice(game.possible_moves()))
+
+    nodes = []
+    times_ms = []
+    while not game.is_over():
+        player = _players[game.current_player - 1]
+        start = time.perf_counter()
+        move = player(game)
+        times_ms.append(round((time.perf_counter() - start) * 1000, 3))
+        nodes.append(player.nodes)
+        game.play_move(move)
+
+    return {
+        'game': number,
+        'opening': min(_opening_plies, len(game.moves)),
+        'moves': game.moves,
+        'winner': game.opponent_index if game.lose() else 0,
+        'nodes': nodes,
+        'times_ms': times_ms,
+    }
+
+
+def self_play(games, output, depths, evaluators, time_limits_ms=(None, None), opening_plies=0, seed=0, workers=None):
+    """
+    Play a batch of AI-vs-AI games and stream their records to a JSONL file.
+
+    Args:
+        games (int): The number of games to play.
+        output (str): The path of the JSONL file to write.
+        depths (list): The search depth of player 1 and player 2.
+        evaluators (list): The evaluator names (keys of EVALUATORS) of both players.
+        time_limits_ms (list): The time per move of both players in milliseconds, or None.
+        opening_plies (int): How many random moves open every game.
+        seed (int): The seed of the random openings.
+        workers (int): The number of worker processes, the number of CPUs if not given.
+
+    Returns:
+        list: The number of draws, wins of player 1 and wins of player 2.
+    """
+    results = [0, 0, 0]
+    init_args = (depths, evaluators, time_limits_ms, opening_plies, seed)
+    with multiprocessing.Pool(workers, _init_worker, init_args) as pool, open(output, 'w') as file:
+        chunksize = max(1, min(64, games // (4 * (workers or multiprocessing.cpu_count()))))
+        for record in pool.imap_unordered(play_game, range(games), chunksize):
+            file.write(json.dumps(record, separators=(',', ':')) + '\n')
+            results[record['winner']] += 1
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Play Connect Four AI-vs-AI games headless.')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--output', default='games.jsonl')
+    parser.add_argument('--depth', type=int, nargs='+', default=[4],
+                        help='search depth of both players, or of player 1 and player 2')
+    parser.add_argument('--evaluator', choices=EVALUATORS, nargs='+', default=['heuristic'],
+                        help='evaluator of both players, or of player 1 and player 2')
+    parser.add_argument('--time-ms', type=float, nargs='+', default=[None],
+                        help='time per move of both players, or of player 1 and player 2')
+    parser.add_argument('--opening-plies', type=int, default=0, help='number of random opening moves')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    draws, first_wins, second_wins = self_play(
+        args.games,
+        args.output,
+        (args.depth * 2)[:2],
+        (args.evaluator * 2)[:2],
+        (args.time_ms * 2)[:2],
+        args.opening_plies,
+        args.seed,
+        args.workers,
+    )
+    elapsed = time.perf_counter() - start
+    print(f'{args.games} games in {elapsed:.1f} s ({args.games / elapsed:.1f} games/s)')
+    print(f'player 1 wins: {first_wins}, player 2 wins: {second_wins}, draws: {draws}')
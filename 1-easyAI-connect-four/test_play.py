@@ -0,0 +1,54 @@
+import copy
+
+from easyAI import AI_Player
+
+from connect_four import ConnectFour
+from opening_book import OpeningBook, build_book
+from parallel_search import ParallelRootSearch
+from search import IterativeDeepening
+from transposition_table import BoundedTranspositionTable
+
+
+"""
+Tests of the searches and their helpers played through easyAI's `play()`, which deep-copies
+the game and its players before every move.
+
+How to run:
+---
+Run the tests with the following command `python3 -m pytest test_play.py`
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+
+def test_transposition_table_is_shared_across_moves():
+    tt = BoundedTranspositionTable(size_bits=10)
+    game = ConnectFour([AI_Player(IterativeDeepening(time_limit_ms=20, tt=tt)),
+                        AI_Player(IterativeDeepening(time_limit_ms=20))])
+    assert copy.deepcopy(game).players[0].AI_algo.tt is tt
+
+    game.play(nmoves=4, verbose=False)
+    assert tt.stores > 0
+
+
+def test_parallel_root_search_plays_through_play():
+    with ParallelRootSearch(4, workers=2) as search:
+        game = ConnectFour([AI_Player(search), AI_Player(IterativeDeepening(50))])
+        game.play(nmoves=4, verbose=False)
+        assert len(game.moves) == 4
+        assert search.pool is not None
+
+
+def test_opening_book_plays_through_play(tmp_path):
+    path = str(tmp_path / 'opening_book.bin')
+    build_book(path, plies=2, depth=4, workers=1)
+    book = OpeningBook(path)
+    try:
+        search = IterativeDeepening(time_limit_ms=50, book=book)
+        game = ConnectFour([AI_Player(search), AI_Player(IterativeDeepening(50))])
+        assert copy.deepcopy(game).players[0].AI_algo.book is book
+
+        game.play(nmoves=4, verbose=False)
+        assert len(game.moves) == 4
+    finally:
+        book.close()
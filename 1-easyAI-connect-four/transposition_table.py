@@ -0,0 +1,135 @@
+from array import array
+
+
+"""
+A bounded transposition table for the Connect Four AI.
+
+It plugs into easyAI's `tt` hook, e.g. `Negamax(8, tt=BoundedTranspositionTable())`,
+and keys positions by their Zobrist hash (`ConnectFour.zobrist_hash`).
+
+The table has a fixed number of buckets and never grows. Every bucket has two slots:
+- a depth-preferred slot, which keeps the entry searched to the greatest depth,
+- an always-replace slot, which takes the entries the depth-preferred slot rejects.
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+EMPTY = -1
+
+
+class BoundedTranspositionTable:
+    def __init__(self, size_bits=18):
+        """
+        Initialize an empty transposition table.
+
+        Args:
+            size_bits (int): The table has 2 ** size_bits buckets of two slots each.
+
+        Attributes:
+            - keys, depths, values, flags, moves (array.array): The slot fields. Bucket i uses
+                                                                slots 2i (depth-preferred)
+                                                                and 2i + 1 (always-replace).
+            - lookups (int): The number of lookups made.
+            - hits (int): The number of lookups that found the position.
+            - stores (int): The number of stored entries.
+        """
+        slots = 2 << size_bits
+        self.bucket_mask = (1 << size_bits) - 1
+        self.keys = array('Q', bytes(8 * slots))
+        self.depths = array('b', [EMPTY]) * slots
+        self.values = array('d', bytes(8 * slots))
+        self.flags = array('b', bytes(slots))
+        self.moves = array('b', bytes(slots))
+        self.lookups = 0
+        self.hits = 0
+        self.stores = 0
+
+    def lookup(self, game):
+        """
+        Find the entry of the game position.
+
+        Args:
+            game (ConnectFour): The game in the position to look up.
+
+        Returns:
+            dict: The stored "depth", "value", "flag" (easyAI's LOWERBOUND, EXACT or UPPERBOUND)
+                  and best "move", or None if the position is not in the table.
+        """
+        self.lookups += 1
+        key = game.zobrist_hash
+        slot = (key & self.bucket_mask) << 1
+        for slot in (slot, slot + 1):
+            if self.keys[slot] == key and self.depths[slot] != EMPTY:
+                self.hits += 1
+                return {
+                    'depth': self.depths[slot],
+                    'value': self.values[slot],
+                    'flag': self.flags[slot],
+                    'move': self.moves[slot],
+                }
+        return None
+
+    def store(self, game, depth, value, move, flag):
+        """
+        Store the search result of the game position.
+
+        The entry goes to the depth-preferred slot when it holds the same position or
+        a position searched less deeply, otherwise it goes to the always-replace slot.
+
+        Args:
+            game (ConnectFour): The game in the searched position.
+            depth (int): The depth the position was searched to.
+            value (float): The score of the position.
+            move (int): The best move found.
+            flag (int): easyAI's LOWERBOUND, EXACT or UPPERBOUND for the value.
+        """
+        self.stores += 1
+        key = game.zobrist_hash
+        slot = (key & self.bucket_mask) << 1
+        if self.keys[slot] != key and depth < self.depths[slot]:
+            slot += 1
+        self.keys[slot] = key
+        self.depths[slot] = depth
+        self.values[slot] = value
+        self.flags[slot] = flag
+        self.moves[slot] = move
+
+    def clear(self):
+        """
+        Remove all entries and reset the statistics.
+        """
+        self.__init__(self.bucket_mask.bit_length())
+
+    def __deepcopy__(self, memo):
+        """
+        Share the table instead of copying it.
+
+        easyAI's `play()` deep-copies the players before every move; a copy would cost
+        the whole table every move and the player would never see its earlier entries.
+        """
+        return self
+
+    @property
+    def hit_rate(self):
+        """
+        Returns:
+            float: The fraction of lookups that found the position.
+        """
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    @property
+    def memory_bytes(self):
+        """
+        Returns:
+            int: The memory taken by the table slots, in bytes.
+        """
+        return sum(len(field) * field.itemsize for field in (self.keys, self.depths, self.values, self.flags, self.moves))
+
+    def used_slots(self):
+        """
+        Count the slots holding an entry.
+
+        Returns:
+            int: The number of used slots.
+        """
+        return len(self.depths) - self.depths.count(EMPTY)
@@ -0,0 +1,355 @@
+import argparse
+import cProfile
+import json
+import platform
+import pstats
+import statistics
+import time
+import tracemalloc
+
+import numpy as np
+import skfuzzy
+from skfuzzy import control as ctrl
+
+from compiled_controller import CompiledControlSystem
+from controller import music_volume_ctrl
+from inference_cache import InferenceCache
+from lookup_table import ControlSurface
+
+
+"""
+Benchmarks of the music volume controller.
+
+Every evaluator runs over the same stream of random inputs:
+- skfuzzy: `ControlSystemSimulation.compute()` of one reused simulation,
+- cache: `InferenceCache` with inputs rounded to whole units, as sensor readings come,
+- surface: `ControlSurface` trilinear interpolation,
+- compiled: `CompiledControlSystem` over whole batches of inputs.
+
+For every evaluator the benchmark reports the throughput, the p50/p90/p99/max latency
+of one call (one batch for the compiled evaluator) and the peak traced memory of its
+setup and calls. The construction of the control system and the first (cold) `compute()`
+of a new simulation are timed separately. Memory is traced in a separate pass, so tracing
+does not slow the timed one.
+
+How to run:
+---
+Run the benchmark with: `python3 benchmark.py`,
+e.g. `python3 benchmark.py --samples 2000 --json results.json --profile compute.prof`.
+Run `python3 benchmark.py --help` to see all options.
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+INPUT_LABELS = ('heart_beat', 'surrounding_noise', 'music_beat_rate')
+
+
+def random_inputs(count, seed):
+    """
+    Draw random inputs uniformly from the universes of the antecedents.
+
+    Args:
+        count (int): The number of inputs.
+        seed (int): The seed of the random generator.
+
+    Returns:
+        numpy.ndarray: A (count, 3) array of heart_beat, surrounding_noise and music_beat_rate.
+    """
+    rng = np.random.default_rng(seed)
+    universes = {antecedent.label: antecedent.universe for antecedent in music_volume_ctrl.antecedents}
+    return np.column_stack([
+        rng.uniform(universes[label][0], universes[label][-1], count) for label in INPUT_LABELS
+    ])
+
+
+def summarize(latencies, samples):
+    """
+    Summarize the latencies of the calls of a benchmark.
+
+    Args:
+        latencies (list): The duration of every call in seconds.
+        samples (int): The number of inputs evaluated by all calls.
+
+    Returns:
+        dict: The throughput in samples per second and the latency percentiles in microseconds.
+    """
+    ordered = sorted(latencies)
+
+    def percentile(percent):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))] * 1e6
+
+    total = sum(latencies)
+    return {
+        'calls': len(latencies),
+        'samples': samples,
+        'total_s': total,
+        'throughput_per_s': samples / total,
+        'p50_us': percentile(50),
+        'p90_us': percentile(90),
+        'p99_us': percentile(99),
+        'max_us': ordered[-1] * 1e6,
+    }
+
+
+def peak_memory(function):
+    """
+    Measure the peak memory allocated while running a function.
+
+    Args:
+        function (function): The function to run, without arguments.
+
+    Returns:
+        int: The peak traced memory in bytes.
+    """
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_construction(repeats):
+    """
+    Time the construction of the control system and of a simulation.
+
+    Args:
+        repeats (int): The number of constructions to time.
+
+    Returns:
+        dict: The median construction times in milliseconds.
+    """
+    rules = list(music_volume_ctrl.rules)
+    system_times = []
+    simulation_times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        control_system = ctrl.ControlSystem(rules)
+        system_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        ctrl.ControlSystemSimulation(control_system)
+        simulation_times.append(time.perf_counter() - start)
+    return {
+        'control_system_ms': statistics.median(system_times) * 1000,
+        'simulation_ms': statistics.median(simulation_times) * 1000,
+    }
+
+
+def benchmark_cold_compute(inputs, repeats):
+    """
+    Time the first and the second `compute()` of new simulations.
+
+    The second compute gets different inputs, because a simulation caches the outputs
+    of the inputs it has already seen.
+
+    Args:
+        inputs (numpy.ndarray): The random inputs, the first `2 * repeats` rows are used.
+        repeats (int): The number of simulations to create.
+
+    Returns:
+        dict: The median cold and warm compute times in milliseconds.
+    """
+    cold_times = []
+    warm_times = []
+    for cold_row, warm_row in zip(inputs[:repeats], inputs[repeats:2 * repeats]):
+        simulation = ctrl.ControlSystemSimulation(music_volume_ctrl)
+        for times, row in ((cold_times, cold_row), (warm_times, warm_row)):
+            for label, value in zip(INPUT_LABELS, row):
+                simulation.input[label] = value
+            start = time.perf_counter()
+            simulation.compute()
+            times.append(time.perf_counter() - start)
+    return {
+        'cold_compute_ms': statistics.median(cold_times) * 1000,
+        'warm_compute_ms': statistics.median(warm_times) * 1000,
+    }
+
+
+def skfuzzy_evaluator():
+    """
+    Returns:
+        function: A function computing the volume of one input row with a reused simulation.
+    """
+    simulation = ctrl.ControlSystemSimulation(music_volume_ctrl)
+
+    def compute(row):
+        for label, value in zip(INPUT_LABELS, row):
+            simulation.input[label] = value
+        simulation.compute()
+        return simulation.output['music_volume']
+
+    return compute
+
+
+def cache_evaluator():
+    """
+    Returns:
+        function: A function computing the volume of one input row with the inference cache.
+    """
+    cache = InferenceCache(music_volume_ctrl)
+
+    def compute(row):
+        return cache.compute(**dict(zip(INPUT_LABELS, row)))['music_volume']
+
+    compute.cache = cache
+    return compute
+
+
+def surface_evaluator():
+    """
+    Returns:
+        function: A function interpolating the volume of one input row on the control surface.
+    """
+    surface = ControlSurface.build(music_volume_ctrl)
+    return lambda row: surface(*row)
+
+
+def benchmark_calls(evaluator, inputs):
+    """
+    Time every call of an evaluator of single inputs.
+
+    Args:
+        evaluator (function): The function creating the evaluator.
+        inputs (list): The input rows.
+
+    Returns:
+        dict: The setup time, the summary of the calls and their peak memory.
+    """
+    start = time.perf_counter()
+    compute = evaluator()
+    setup = time.perf_counter() - start
+    latencies = []
+    for row in inputs:
+        start = time.perf_counter()
+        compute(row)
+        latencies.append(time.perf_counter() - start)
+    result = {'setup_ms': setup * 1000, **summarize(latencies, len(inputs))}
+    if hasattr(compute, 'cache'):
+        result['cache'] = compute.cache.stats()
+
+    def run():
+        compute = evaluator()
+        for row in inputs:
+            compute(row)
+
+    result['peak_memory_bytes'] = peak_memory(run)
+    return result
+
+
+def benchmark_compiled(inputs, batch_size):
+    """
+    Time the compiled evaluator over batches of inputs.
+
+    Args:
+        inputs (numpy.ndarray): The (count, 3) input array.
+        batch_size (int): The number of inputs evaluated by one call.
+
+    Returns:
+        dict: The setup time, the summary of the batches and their peak memory.
+    """
+    start = time.perf_counter()
+    compiled = CompiledControlSystem(music_volume_ctrl)
+    setup = time.perf_counter() - start
+    batches = [inputs[start:start + batch_size] for start in range(0, len(inputs), batch_size)]
+
+    def compute(batch):
+        return compiled.compute(**dict(zip(INPUT_LABELS, batch.T)))
+
+    compute(batches[0])
+    latencies = []
+    for batch in batches:
+        start = time.perf_counter()
+        compute(batch)
+        latencies.append(time.perf_counter() - start)
+    result = {'setup_ms': setup * 1000, 'batch_size': batch_size, **summarize(latencies, len(inputs))}
+    result['peak_memory_bytes'] = peak_memory(lambda: [compute(batch) for batch in batches])
+    return result
+
+
+def profile_compute(inputs, output, top):
+    """
+    Profile `ControlSystemSimulation.compute()`, save the profile and print the hottest skfuzzy functions.
+
+    Args:
+        inputs (numpy.ndarray): The input rows.
+        output (str): The path of the pstats file.
+        top (int): The number of functions to print.
+    """
+    compute = skfuzzy_evaluator()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    for row in inputs:
+        compute(row)
+    profiler.disable()
+    profiler.dump_stats(output)
+    stats = pstats.Stats(output)
+    stats.sort_stats('cumulative').print_stats('skfuzzy', top)
+
+
+def run_benchmarks(samples, batch_samples, batch_size, seed, evaluators):
+    """
+    Run all benchmarks.
+
+    Args:
+        samples (int): The number of inputs of the single-input evaluators.
+        batch_samples (int): The number of inputs of the compiled evaluator.
+        batch_size (int): The number of inputs of one compiled batch.
+        seed (int): The seed of the random inputs.
+        evaluators (list): The names of the evaluators to run.
+
+    Returns:
+        dict: The results described in the module docstring.
+    """
+    inputs = random_inputs(max(samples, batch_samples, 20), seed)
+    rows = [tuple(row) for row in inputs[:samples].tolist()]
+    results = {
+        'construction': benchmark_construction(10),
+        'cold_compute': benchmark_cold_compute(inputs, 10),
+    }
+    single = {'skfuzzy': skfuzzy_evaluator, 'cache': cache_evaluator, 'surface': surface_evaluator}
+    for name in evaluators:
+        if name == 'cache':
+            results[name] = benchmark_calls(cache_evaluator, [tuple(map(round, row)) for row in rows])
+        elif name in single:
+            results[name] = benchmark_calls(single[name], rows)
+        else:
+            results[name] = benchmark_compiled(inputs[:batch_samples], batch_size)
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'skfuzzy': skfuzzy.__version__,
+        'samples': samples,
+        'seed': seed,
+        'results': results,
+    }
+
+
+if __name__ == '__main__':
+    evaluator_names = ['skfuzzy', 'cache', 'surface', 'compiled']
+    parser = argparse.ArgumentParser(description='Music volume controller benchmarks.')
+    parser.add_argument('--samples', type=int, default=1000, help='inputs of the single-input evaluators')
+    parser.add_argument('--batch-samples', type=int, default=100000, help='inputs of the compiled evaluator')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--evaluators', choices=evaluator_names, nargs='+', default=evaluator_names)
+    parser.add_argument('--json', default=None, help='write the results to this JSON file')
+    parser.add_argument('--profile', default=None, help='profile skfuzzy compute() and save the pstats to this file')
+    parser.add_argument('--profile-top', type=int, default=15)
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.samples, args.batch_samples, args.batch_size, args.seed, args.evaluators)
+    results = report['results']
+    print(f"ControlSystem construction: {results['construction']['control_system_ms']:.2f} ms, "
+          f"simulation: {results['construction']['simulation_ms']:.2f} ms")
+    print(f"compute() cold: {results['cold_compute']['cold_compute_ms']:.2f} ms, "
+          f"warm: {results['cold_compute']['warm_compute_ms']:.2f} ms")
+    for name in args.evaluators:
+        result = results[name]
+        print(f"{name:>9}: {result['throughput_per_s']:12,.0f} samples/s, "
+              f"p50 {result['p50_us']:9.1f} us, p99 {result['p99_us']:9.1f} us, max {result['max_us']:9.1f} us, "
+              f"peak memory {result['peak_memory_bytes'] / 2 ** 20:.1f} MiB")
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
+    if args.profile:
+        profile_compute(random_inputs(args.samples, args.seed), args.profile, args.profile_top)
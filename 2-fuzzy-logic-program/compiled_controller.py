@@ -0,0 +1,306 @@
+import numpy as np
+from skfuzzy.control.term import Term, TermAggregate
+
+
+"""
+Vectorised evaluation of a skfuzzy control system.
+
+`CompiledControlSystem` reads the antecedents, consequents and rules of a
+`ctrl.ControlSystem` once and then evaluates whole NumPy arrays of inputs in one pass:
+membership of the inputs, AND/OR/NOT of the rule antecedents, accumulation of the
+rule activations and centroid defuzzification, the same way `ControlSystemSimulation`
+does it for a single set of inputs.
+
+Usage:
+---
+from controller import music_volume_ctrl
+from compiled_controller import CompiledControlSystem
+
+controller = CompiledControlSystem(music_volume_ctrl)
+outputs = controller.compute(heart_beat=heart_beats, surrounding_noise=noises, music_beat_rate=beat_rates)
+outputs['music_volume']  # array of volumes, NaN where no rule fired
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+# Number of samples evaluated at once, which bounds the memory of the intermediate arrays.
+CHUNK_SIZE = 16384
+
+
+class CompiledConsequent:
+    def __init__(self, consequent, term_labels):
+        """
+        Prepare the defuzzification of a consequent.
+
+        Every term membership function must be unimodal (e.g. triangular or trapezoidal),
+        so that a cut at any level crosses it at most once on each side of the peak.
+
+        Args:
+            consequent (ctrl.Consequent): The consequent to defuzzify.
+            term_labels (list): The labels of the terms used by the rules.
+
+        Raises:
+            ValueError: If the defuzzification method is not centroid or a term is not unimodal.
+        """
+        if consequent.defuzzify_method != 'centroid':
+            raise ValueError(f"Only centroid defuzzification is supported, got '{consequent.defuzzify_method}'.")
+        self.label = consequent.label
+        self.universe = consequent.universe.astype(float)
+        self.term_labels = term_labels
+        self.mfs = [consequent[label].mf.astype(float) for label in term_labels]
+        self.slopes = [np.diff(mf) / np.diff(self.universe) for mf in self.mfs]
+        # The areas and moments of the trapezoids between universe points are linear in
+        # the membership values at the points, so their sums are two dot products.
+        x1, x2 = self.universe[:-1], self.universe[1:]
+        dx = x2 - x1
+        self.area_weights = np.zeros(len(self.universe))
+        self.area_weights[:-1] += 0.5 * dx
+        self.area_weights[1:] += 0.5 * dx
+        self.moment_weights = np.zeros(len(self.universe))
+        self.moment_weights[:-1] += 0.5 * dx * x1 + dx * dx / 6
+        self.moment_weights[1:] += 0.5 * dx * x1 + dx * dx / 3
+        self.rising = []
+        self.falling = []
+        for label, mf in zip(term_labels, self.mfs):
+            rising, falling = self._split_unimodal(mf)
+            if rising is None:
+                raise ValueError(f"Membership function '{label}' of '{self.label}' is not unimodal.")
+            self.rising.append((mf[rising], self.universe[rising]))
+            self.falling.append((mf[falling][::-1], self.universe[falling][::-1]))
+
+    @staticmethod
+    def _split_unimodal(mf):
+        """
+        Find the strictly rising and strictly falling edges of a unimodal membership function.
+
+        Args:
+            mf (numpy.ndarray): The membership function.
+
+        Returns:
+            tuple: The slices of the rising and the falling edge (peak included),
+                   or (None, None) if the function is not unimodal.
+        """
+        peak = mf.max()
+        first_peak = int(np.argmax(mf == peak))
+        last_peak = len(mf) - 1 - int(np.argmax(mf[::-1] == peak))
+        start = first_peak
+        while start > 0 and mf[start - 1] < mf[start] and mf[start] > 0:
+            start -= 1
+        end = last_peak
+        while end < len(mf) - 1 and mf[end + 1] < mf[end] and mf[end] > 0:
+            end += 1
+        if (mf[:start] != 0).any() or (mf[end + 1:] != 0).any() or (mf[first_peak:last_peak + 1] != peak).any():
+            return None, None
+        return slice(start, first_peak + 1), slice(last_peak, end + 1)
+
+    def defuzz(self, cuts):
+        """
+        Compute the centroid of the accumulated output membership function.
+
+        As in skfuzzy, the universe is upsampled with the points where each term
+        crosses its cut, the output membership function is linear between the points
+        and its centroid is computed exactly from the trapezoids between them.
+        Instead of sorting every upsampled universe, the trapezoids of the universe
+        segments holding crossing points are replaced by the pieces between them.
+
+        Args:
+            cuts (list): For every term, the array of its cuts (accumulated activations).
+
+        Returns:
+            numpy.ndarray: The crisp outputs, NaN where the output membership is empty.
+        """
+        universe = self.universe
+        n = len(cuts[0])
+        rows = np.arange(n)[:, None]
+
+        grid_y = np.zeros((n, len(universe)))
+        for cut, mf in zip(cuts, self.mfs):
+            np.maximum(grid_y, np.minimum(cut[:, None], mf), out=grid_y)
+        total_area = grid_y @ self.area_weights
+        total_moment = grid_y @ self.moment_weights
+
+        crossings = []
+        for cut, (rising_mf, rising_x), (falling_mf, falling_x) in zip(cuts, self.rising, self.falling):
+            crossings.append(np.interp(cut, rising_mf, rising_x))
+            crossings.append(np.interp(cut, falling_mf, falling_x))
+        x = np.stack(crossings, axis=1)
+        x.sort(axis=1)
+        segment = np.clip(np.searchsorted(universe, x, side='right') - 1, 0, len(universe) - 2)
+        start_x, end_x = universe[segment], universe[segment + 1]
+        offset = x - start_x
+        y = np.zeros_like(x)
+        for cut, mf, slope in zip(cuts, self.mfs, self.slopes):
+            np.maximum(y, np.minimum(cut[:, None], mf[segment] + offset * slope[segment]), out=y)
+
+        # Replace the trapezoids of the segments holding crossing points by the pieces
+        # between the segment start, its crossing points and its end.
+        same_segment = segment[:, 1:] == segment[:, :-1]
+        last = np.ones(x.shape, dtype=bool)
+        last[:, :-1] = ~same_segment
+        start_y, end_y = grid_y[rows, segment], grid_y[rows, segment + 1]
+        piece_area, piece_moment = _trapezoids(start_x, start_y, end_x, end_y)
+        total_area -= piece_area.sum(axis=1, where=last)
+        total_moment -= piece_moment.sum(axis=1, where=last)
+
+        left_x = start_x.copy()
+        left_y = start_y.copy()
+        left_x[:, 1:] = np.where(same_segment, x[:, :-1], left_x[:, 1:])
+        left_y[:, 1:] = np.where(same_segment, y[:, :-1], left_y[:, 1:])
+        piece_area, piece_moment = _trapezoids(left_x, left_y, x, y)
+        total_area += piece_area.sum(axis=1)
+        total_moment += piece_moment.sum(axis=1)
+
+        piece_area, piece_moment = _trapezoids(x, y, end_x, end_y)
+        total_area += piece_area.sum(axis=1, where=last)
+        total_moment += piece_moment.sum(axis=1, where=last)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(total_area > 0, total_moment / total_area, np.nan)
+
+
+def _trapezoids(x1, y1, x2, y2):
+    """
+    Compute the areas and first moments of the trapezoids under linear pieces of a function.
+
+    Args:
+        x1, y1 (numpy.ndarray): The start points of the pieces.
+        x2, y2 (numpy.ndarray): The end points of the pieces.
+
+    Returns:
+        tuple: The areas and the moments (area times centroid) of the trapezoids.
+    """
+    dx = x2 - x1
+    area = 0.5 * dx * (y1 + y2)
+    return area, area * x1 + dx * dx * (y1 + 2 * y2) / 6
+
+
+class CompiledControlSystem:
+    def __init__(self, control_system):
+        """
+        Compile a control system for vectorised evaluation.
+
+        Args:
+            control_system (ctrl.ControlSystem): The control system with its rules.
+
+        Attributes:
+            - antecedents (dict): For every antecedent label, its universe and term membership functions.
+            - rules (list): For every rule, its antecedent expression, AND/OR functions and weighted consequent terms.
+            - consequents (list): The CompiledConsequent of every consequent.
+        """
+        self.antecedents = {
+            antecedent.label: (
+                antecedent.universe.astype(float),
+                {label: term.mf.astype(float) for label, term in antecedent.terms.items()},
+            )
+            for antecedent in control_system.antecedents
+        }
+
+        self.rules = []
+        used_terms = {}
+        for rule in control_system.rules:
+            consequents = [
+                (weighted.term.parent.label, weighted.term.label, weighted.weight) for weighted in rule.consequent
+            ]
+            for label, term_label, weight in consequents:
+                used_terms.setdefault(label, [])
+                if term_label not in used_terms[label]:
+                    used_terms[label].append(term_label)
+            self.rules.append((rule.antecedent, rule.and_func, rule.or_func, consequents))
+
+        self.accumulation = {}
+        self.consequents = []
+        for consequent in control_system.consequents:
+            if consequent.label in used_terms:
+                self.accumulation[consequent.label] = consequent.accumulation_method
+                self.consequents.append(CompiledConsequent(consequent, used_terms[consequent.label]))
+
+    def compute(self, chunk_size=CHUNK_SIZE, **inputs):
+        """
+        Evaluate the control system for arrays of inputs.
+
+        Args:
+            chunk_size (int): The number of samples evaluated at once.
+            **inputs: An array (or scalar) of crisp values for every antecedent label.
+                      Values outside the universe are clipped to its bounds, as in skfuzzy.
+
+        Returns:
+            dict: An array of crisp outputs for every consequent label.
+
+        Raises:
+            ValueError: If an antecedent has no input.
+        """
+        missing = set(self.antecedents) - set(inputs)
+        if missing:
+            raise ValueError(f"All antecedents must have input values, missing: {', '.join(sorted(missing))}")
+        arrays = np.broadcast_arrays(*(np.asarray(inputs[label], dtype=float) for label in self.antecedents))
+        shape = arrays[0].shape
+        flat = dict(zip(self.antecedents, (array.ravel() for array in arrays)))
+        size = arrays[0].size
+
+        outputs = {consequent.label: np.empty(size) for consequent in self.consequents}
+        for start in range(0, size, chunk_size):
+            chunk = {label: values[start:start + chunk_size] for label, values in flat.items()}
+            for label, values in self._compute_chunk(chunk).items():
+                outputs[label][start:start + chunk_size] = values
+        return {label: values.reshape(shape) for label, values in outputs.items()}
+
+    def _compute_chunk(self, inputs):
+        """
+        Evaluate the control system for one chunk of flat input arrays.
+
+        Args:
+            inputs (dict): A 1-D array of crisp values for every antecedent label.
+
+        Returns:
+            dict: A 1-D array of crisp outputs for every consequent label.
+        """
+        memberships = {}
+        for label, (universe, terms) in self.antecedents.items():
+            values = np.clip(inputs[label], universe[0], universe[-1])
+            for term_label, mf in terms.items():
+                memberships[label, term_label] = np.interp(values, universe, mf)
+
+        cuts = {}
+        for antecedent, and_func, or_func, consequents in self.rules:
+            firing = self._evaluate(antecedent, memberships, and_func, or_func)
+            for label, term_label, weight in consequents:
+                activation = firing * weight
+                key = label, term_label
+                cuts[key] = activation if key not in cuts else self.accumulation[label](activation, cuts[key])
+
+        return {
+            consequent.label: consequent.defuzz([cuts[consequent.label, term] for term in consequent.term_labels])
+            for consequent in self.consequents
+        }
+
+    def _evaluate(self, expression, memberships, and_func, or_func):
+        """
+        Evaluate a rule antecedent expression.
+
+        As in skfuzzy, the rule's AND/OR functions apply to its top-level aggregate
+        and nested aggregates use their own.
+
+        Args:
+            expression (TermPrimitive): A term or an aggregate of terms.
+            memberships (dict): The membership arrays of all antecedent terms.
+            and_func (function): The AND function of this aggregate.
+            or_func (function): The OR function of this aggregate.
+
+        Returns:
+            numpy.ndarray: The membership of the expression.
+        """
+        if isinstance(expression, Term):
+            return memberships[expression.parent.label, expression.label]
+        if not isinstance(expression, TermAggregate):
+            raise ValueError(f'Unexpected antecedent: {expression}')
+
+        def nested(term):
+            if isinstance(term, TermAggregate):
+                return self._evaluate(term, memberships, term.agg_methods.and_func, term.agg_methods.or_func)
+            return self._evaluate(term, memberships, None, None)
+
+        if expression.kind == 'not':
+            return 1. - nested(expression.term1)
+        if expression.kind == 'and':
+            return and_func(nested(expression.term1), nested(expression.term2))
+        return or_func(nested(expression.term1), nested(expression.term2))
@@ -0,0 +1,62 @@
+import numpy as np
+import skfuzzy as fuzz
+from skfuzzy import control as ctrl
+
+
+"""
+Definition of the fuzzy logic controller for a music player volume.
+It bases on 3 inputs:
+- user heart beat as beat per minut,
+- surrounding noise as decibels
+- music beat rate as beat per minute.
+The output is music player volume as percentage of full music volume.
+
+The module only defines the antecedents, the consequent, the rules and `music_volume_ctrl`,
+and does not import matplotlib, so it can be imported by other programs at a low cost
+(see `import_budget.py`). Plotting lives in `app.py --plot`.
+scikit-fuzzy 0.5 still loads matplotlib.pyplot inside `skfuzzy.control` on its own.
+
+Usage:
+---
+from skfuzzy import control as ctrl
+from controller import music_volume_ctrl
+
+music_volume_sim = ctrl.ControlSystemSimulation(music_volume_ctrl)
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+heart_beat = ctrl.Antecedent(np.arange(40, 101, 1), 'heart_beat')
+surrounding_noise = ctrl.Antecedent(np.arange(20, 141, 1), 'surrounding_noise')
+music_beat_rate = ctrl.Antecedent(np.arange(20, 201, 10), 'music_beat_rate')
+music_volume = ctrl.Consequent(np.arange(0, 51, 1), 'music_volume')
+
+
+heart_beat['low'] = fuzz.trimf(heart_beat.universe, [40, 40, 60])
+heart_beat['medium'] = fuzz.trimf(heart_beat.universe, [40, 60, 100])
+heart_beat['high'] = fuzz.trimf(heart_beat.universe, [60, 100, 100])
+
+surrounding_noise['low'] = fuzz.trimf(surrounding_noise.universe, [20, 20, 80])
+surrounding_noise['medium'] = fuzz.trimf(surrounding_noise.universe, [20, 80, 140])
+surrounding_noise['high'] = fuzz.trimf(surrounding_noise.universe, [80, 140, 140])
+
+music_beat_rate['low'] = fuzz.trimf(music_beat_rate.universe, [20, 20, 80])
+music_beat_rate['medium'] = fuzz.trimf(music_beat_rate.universe, [20, 100, 180])
+music_beat_rate['high'] = fuzz.trimf(music_beat_rate.universe, [80, 200, 200])
+
+music_volume.automf(3, names=['low', 'medium', 'high'])
+
+
+rule1 = ctrl.Rule(heart_beat['low'], music_volume['low'])
+rule2 = ctrl.Rule(heart_beat['medium'] & (surrounding_noise['low'] & (music_beat_rate['low'] | music_beat_rate['medium'])), music_volume['low'])
+rule3 = ctrl.Rule((heart_beat['high'] & surrounding_noise['low']) & (music_beat_rate['low'] | music_beat_rate['medium']), music_volume['low'])
+
+rule4 = ctrl.Rule(heart_beat['medium'] & surrounding_noise['low'] & music_beat_rate['high'], music_volume['medium'])
+rule5 = ctrl.Rule(heart_beat['medium'] & (surrounding_noise['medium'] | surrounding_noise['high']), music_volume['medium'])
+rule6 = ctrl.Rule(heart_beat['high'] & surrounding_noise['low'] & music_beat_rate['high'], music_volume['medium'])
+rule7 = ctrl.Rule(heart_beat['high'] & surrounding_noise['medium'], music_volume['medium'])
+
+rule8 = ctrl.Rule(heart_beat['high'] & surrounding_noise['high'], music_volume['high'])
+
+music_volume_ctrl = ctrl.ControlSystem([rule1, rule2, rule3, rule4, rule5, rule6, rule7, rule8])
+
@@ -0,0 +1,94 @@
+import argparse
+import statistics
+import subprocess
+import sys
+
+
+"""
+Import-time budget of the fuzzy controller.
+
+Every run imports the module in a fresh Python process, so nothing is cached in
+`sys.modules`, and measures the wall time of the import alone (interpreter startup
+excluded). The median of the runs is compared with the budget and the program exits
+with status 1 when it is exceeded, so it can be used as a check before embedding
+the controller in other processes.
+
+`-X importtime` of the slowest run shows which imports the time goes to.
+
+How to run:
+---
+`python3 import_budget.py` measures `controller` against the default budget.
+Run e.g. `python3 import_budget.py --module app --budget-ms 1500 --runs 5 --details` to change it.
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+# Median import time of `controller` allowed by default, in milliseconds.
+BUDGET_MS = 1500
+
+MEASURE = '''
+import sys, time
+start = time.perf_counter()
+import {module}
+print((time.perf_counter() - start) * 1000, 'matplotlib.pyplot' in sys.modules)
+'''
+
+
+def measure_import(module):
+    """
+    Import a module in a fresh Python process.
+
+    Args:
+        module (str): The name of the module.
+
+    Returns:
+        tuple: The import time in milliseconds and whether matplotlib.pyplot was loaded.
+    """
+    output = subprocess.run(
+        [sys.executable, '-c', MEASURE.format(module=module)], capture_output=True, text=True, check=True
+    ).stdout.split()
+    return float(output[0]), output[1] == 'True'
+
+
+def slowest_imports(module, count=10):
+    """
+    List the imports with the largest cumulative time when importing a module in a fresh process.
+
+    Args:
+        module (str): The name of the module.
+        count (int): The number of imports to list.
+
+    Returns:
+        list: Tuples of the cumulative import time in milliseconds and the imported module, slowest first.
+    """
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'], capture_output=True, text=True, check=True
+    ).stderr
+    imports = []
+    for line in stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            imports.append((int(parts[1]) / 1000, parts[2].strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the import time of the fuzzy controller against a budget.')
+    parser.add_argument('--module', default='controller')
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--details', action='store_true', help='list the slowest imports')
+    args = parser.parse_args()
+
+    results = [measure_import(args.module) for _ in range(args.runs)]
+    times = [time_ms for time_ms, _ in results]
+    median = statistics.median(times)
+    print(f'import {args.module}: median {median:.1f} ms, min {min(times):.1f} ms, max {max(times):.1f} ms '
+          f'(budget {args.budget_ms:.0f} ms)')
+    print(f'matplotlib.pyplot loaded: {results[0][1]}')
+    if args.details:
+        for time_ms, name in slowest_imports(args.module):
+            print(f'{time_ms:10.1f} ms  {name}')
+    if median > args.budget_ms:
+        print(f'Import budget exceeded by {median - args.budget_ms:.1f} ms')
+        sys.exit(1)
@@ -0,0 +1,232 @@
+import collections
+import math
+import sys
+import time
+
+from skfuzzy import control as ctrl
+
+
+"""
+Memoised fuzzy inference for repeating sensor readings.
+
+The inputs are quantised to the step of their universe (e.g. 1 bpm of `heart_beat`,
+10 bpm of `music_beat_rate`) and clipped to its bounds, and the outputs computed
+for the quantised inputs are kept in an LRU cache. A reading that repeats at the
+resolution of the universes costs a dict lookup instead of a full inference.
+
+The cache is bounded both by the number of entries and by an estimate of its memory,
+whichever is reached first, and counts its hits, misses and evictions.
+
+Usage:
+---
+from controller import music_volume_ctrl
+from inference_cache import InferenceCache
+
+cache = InferenceCache(music_volume_ctrl, max_bytes=1024 * 1024)
+cache.compute(heart_beat=80, surrounding_noise=106, music_beat_rate=60)['music_volume']
+
+How to run:
+---
+Compare the cache with plain `compute()` on simulated readings with: `python3 inference_cache.py`
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+# Approximate memory of an OrderedDict entry besides its key and value: the hash table
+# slot and the node of the linked list keeping the LRU order.
+ENTRY_OVERHEAD_BYTES = 100
+
+
+class InferenceCache:
+    def __init__(self, control_system, max_entries=None, max_bytes=16 * 1024 * 1024, steps=None):
+        """
+        Create a cache in front of a control system.
+
+        Args:
+            control_system (ctrl.ControlSystem): The control system to compute the outputs with.
+            max_entries (int): The largest number of cached inputs, None for no limit.
+            max_bytes (int): The largest estimated memory of the cache in bytes, None for no limit.
+            steps (dict): The quantisation step of some antecedent labels, instead of the step of their universe.
+
+        Attributes:
+            - hits (int): The number of computations answered from the cache.
+            - misses (int): The number of computations that ran the inference.
+            - evictions (int): The number of entries dropped to stay under the limits.
+        """
+        steps = steps or {}
+        self.simulation = ctrl.ControlSystemSimulation(control_system)
+        self.labels = [antecedent.label for antecedent in control_system.antecedents]
+        self.output_labels = [consequent.label for consequent in control_system.consequents]
+        self.grids = []
+        for antecedent in control_system.antecedents:
+            start, end = float(antecedent.universe[0]), float(antecedent.universe[-1])
+            step = float(steps.get(antecedent.label, antecedent.universe[1] - antecedent.universe[0]))
+            self.grids.append((start, step, round((end - start) / step)))
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.entry_bytes = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, inputs):
+        """
+        Quantise the inputs to the grid of the universes.
+
+        An input halfway between two grid points goes to the upper one.
+
+        Args:
+            inputs (dict): A crisp value for every antecedent label.
+
+        Returns:
+            tuple: The grid index of every input, in the order of `labels`, or None if an input is NaN or infinite.
+        """
+        key = []
+        for label, (start, step, last) in zip(self.labels, self.grids):
+            value = inputs[label]
+            if not math.isfinite(value):
+                return None
+            index = math.floor((value - start) / step + 0.5)
+            key.append(0 if index < 0 else last if index > last else index)
+        return tuple(key)
+
+    def compute(self, **inputs):
+        """
+        Compute the outputs for the inputs quantised to the grid of the universes.
+
+        Args:
+            **inputs: A crisp value for every antecedent label.
+
+        Returns:
+            dict: The crisp value of every consequent label, NaN if no rule fired or an input is NaN or infinite.
+        """
+        key = self.key(inputs)
+        if key is None:
+            return {label: math.nan for label in self.output_labels}
+        outputs = self.entries.get(key)
+        if outputs is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        else:
+            self.misses += 1
+            outputs = self._infer(key)
+            self._insert(key, outputs)
+        return dict(zip(self.output_labels, outputs))
+
+    def _infer(self, key):
+        """
+        Run the inference for the grid point of a key.
+
+        Args:
+            key (tuple): The grid index of every input.
+
+        Returns:
+            tuple: The crisp value of every consequent, in the order of `output_labels`,
+                   NaN for the consequents no rule fired for.
+        """
+        for label, index, (start, step, last) in zip(self.labels, key, self.grids):
+            self.simulation.input[label] = start + index * step
+        try:
+            self.simulation.compute()
+        except ValueError:
+            # skfuzzy leaves out the consequents no rule fired for, but older versions
+            # (and non-lenient simulations) raise an error instead.
+            return tuple(float('nan') for _ in self.output_labels)
+        return tuple(float(self.simulation.output.get(label, float('nan'))) for label in self.output_labels)
+
+    def _insert(self, key, outputs):
+        """
+        Add an entry and evict the least recently used entries above the limits.
+
+        Args:
+            key (tuple): The grid index of every input.
+            outputs (tuple): The crisp value of every consequent.
+        """
+        if self.entry_bytes is None:
+            self.entry_bytes = (
+                sys.getsizeof(key) + sum(map(sys.getsizeof, key))
+                + sys.getsizeof(outputs) + sum(map(sys.getsizeof, outputs))
+                + ENTRY_OVERHEAD_BYTES
+            )
+        self.entries[key] = outputs
+        while self.entries and (
+            (self.max_entries is not None and len(self.entries) > self.max_entries)
+            or (self.max_bytes is not None and self.memory_bytes > self.max_bytes)
+        ):
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    @property
+    def memory_bytes(self):
+        """
+        Returns:
+            int: The estimated memory of the cached entries in bytes.
+        """
+        return len(self.entries) * (self.entry_bytes or 0)
+
+    @property
+    def hit_rate(self):
+        """
+        Returns:
+            float: The fraction of computations answered from the cache.
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        """
+        Returns:
+            dict: The counters, the number of entries and the estimated memory of the cache.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hit_rate,
+            'entries': len(self.entries),
+            'memory_bytes': self.memory_bytes,
+        }
+
+    def clear(self):
+        """
+        Remove all entries and reset the counters.
+        """
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+
+if __name__ == '__main__':
+    import random
+
+    from controller import music_volume_ctrl
+
+    rng = random.Random(0)
+    readings = [
+        (round(rng.gauss(70, 5)), round(rng.gauss(60, 8)), rng.choice((60, 90, 120, 150)))
+        for _ in range(3000)
+    ]
+    simulation = ctrl.ControlSystemSimulation(music_volume_ctrl)
+    start = time.perf_counter()
+    for heart_beat, noise, beat_rate in readings:
+        simulation.input['heart_beat'] = heart_beat
+        simulation.input['surrounding_noise'] = noise
+        simulation.input['music_beat_rate'] = beat_rate
+        simulation.compute()
+    plain = time.perf_counter() - start
+
+    cache = InferenceCache(music_volume_ctrl)
+    start = time.perf_counter()
+    for heart_beat, noise, beat_rate in readings:
+        cache.compute(heart_beat=heart_beat, surrounding_noise=noise, music_beat_rate=beat_rate)
+    cached = time.perf_counter() - start
+    print(cache.stats())
+
+    start = time.perf_counter()
+    for heart_beat, noise, beat_rate in readings:
+        cache.compute(heart_beat=heart_beat, surrounding_noise=noise, music_beat_rate=beat_rate)
+    warm = time.perf_counter() - start
+
+    print(f'compute():  {plain / len(readings) * 1e6:.1f} us per reading')
+    print(f'cold cache: {cached / len(readings) * 1e6:.1f} us per reading')
+    print(f'warm cache: {warm / len(readings) * 1e6:.1f} us per reading')
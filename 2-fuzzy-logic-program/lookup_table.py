@@ -0,0 +1,268 @@
+import hashlib
+import math
+import os
+import time
+
+import numpy as np
+from skfuzzy import control as ctrl
+
+from compiled_controller import CompiledControlSystem
+
+
+"""
+Precomputed control surface of a fuzzy controller with trilinear interpolation.
+
+The output of the controller is sampled once at every point of the input grid
+(the universes of the antecedents) and kept as a float32 array on disk. A query
+interpolates between the 8 grid points around the inputs, which takes microseconds
+instead of a full fuzzy inference.
+
+The file stores a fingerprint of the rules and membership functions, and the
+surface is rebuilt when they change.
+
+Usage:
+---
+from controller import music_volume_ctrl
+from lookup_table import ControlSurface
+
+surface = ControlSurface.load_or_build(music_volume_ctrl, 'control_surface.npz')
+surface(80, 106, 60)  # heart_beat, surrounding_noise, music_beat_rate
+
+How to run:
+---
+Build the surface and report its interpolation error with: `python3 lookup_table.py`
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+DEFAULT_PATH = 'control_surface.npz'
+
+
+def fingerprint(control_system):
+    """
+    Compute a fingerprint of the rules and membership functions of a control system.
+
+    Args:
+        control_system (ctrl.ControlSystem): The control system.
+
+    Returns:
+        str: A hex digest that changes whenever a rule, universe or membership function changes.
+    """
+    digest = hashlib.sha256()
+    for rule in control_system.rules:
+        digest.update(repr(rule).encode())
+    for variable in list(control_system.antecedents) + list(control_system.consequents):
+        digest.update(variable.label.encode())
+        digest.update(np.asarray(variable.universe, dtype=float).tobytes())
+        digest.update(getattr(variable, 'defuzzify_method', '').encode())
+        for label, term in variable.terms.items():
+            digest.update(label.encode())
+            digest.update(np.asarray(term.mf, dtype=float).tobytes())
+    return digest.hexdigest()
+
+
+class ControlSurface:
+    def __init__(self, axes, values, labels, output_label, fingerprint):
+        """
+        Initialize a control surface from its sampled values.
+
+        Args:
+            axes (list): The evenly spaced input grid of every antecedent.
+            values (numpy.ndarray): The float32 outputs at every point of the grid.
+            labels (list): The antecedent labels, in the order of the axes.
+            output_label (str): The label of the consequent.
+            fingerprint (str): The fingerprint of the control system the surface was sampled from.
+
+        Raises:
+            ValueError: If the surface does not have three axes or an axis is not evenly spaced.
+        """
+        if len(axes) != 3:
+            raise ValueError(f'A control surface needs 3 inputs, got {len(axes)}.')
+        for label, axis in zip(labels, axes):
+            if len(axis) < 2 or not np.allclose(np.diff(axis), axis[1] - axis[0]):
+                raise ValueError(f"The universe of '{label}' is not evenly spaced.")
+        self.axes = [np.asarray(axis, dtype=float) for axis in axes]
+        self.values = np.asarray(values, dtype=np.float32)
+        self.labels = list(labels)
+        self.output_label = output_label
+        self.fingerprint = fingerprint
+        self.starts = [float(axis[0]) for axis in self.axes]
+        self.steps = [float(axis[1] - axis[0]) for axis in self.axes]
+        self.sizes = [len(axis) for axis in self.axes]
+        # A flat list of Python floats is much faster to index than a NumPy array for single queries.
+        self.flat_values = self.values.ravel().tolist()
+
+    @classmethod
+    def build(cls, control_system):
+        """
+        Sample the output of a control system at every point of its input grid.
+
+        Args:
+            control_system (ctrl.ControlSystem): A control system with three antecedents and one consequent.
+
+        Returns:
+            ControlSurface: The sampled surface.
+        """
+        compiled = CompiledControlSystem(control_system)
+        labels = list(compiled.antecedents)
+        axes = [compiled.antecedents[label][0] for label in labels]
+        grids = np.meshgrid(*axes, indexing='ij')
+        output_label = compiled.consequents[0].label
+        values = compiled.compute(**dict(zip(labels, grids)))[output_label]
+        return cls(axes, values, labels, output_label, fingerprint(control_system))
+
+    @classmethod
+    def load_or_build(cls, control_system, path=DEFAULT_PATH):
+        """
+        Load the surface from a file, or build and save it when the file is missing
+        or was sampled from different rules or membership functions.
+
+        Args:
+            control_system (ctrl.ControlSystem): The control system of the surface.
+            path (str): The path of the surface file.
+
+        Returns:
+            ControlSurface: The surface of the control system.
+        """
+        if os.path.isfile(path):
+            with np.load(path) as data:
+                if str(data['fingerprint']) == fingerprint(control_system):
+                    labels = [str(label) for label in data['labels']]
+                    axes = [data[f'axis_{i}'] for i in range(len(labels))]
+                    return cls(axes, data['values'], labels, str(data['output_label']), str(data['fingerprint']))
+        surface = cls.build(control_system)
+        surface.save(path)
+        return surface
+
+    def save(self, path=DEFAULT_PATH):
+        """
+        Save the surface to a file.
+
+        Args:
+            path (str): The path of the surface file.
+        """
+        axes = {f'axis_{i}': axis for i, axis in enumerate(self.axes)}
+        with open(path, 'wb') as file:
+            np.savez(file, values=self.values, labels=np.array(self.labels), output_label=self.output_label,
+                     fingerprint=self.fingerprint, **axes)
+
+    def __call__(self, x, y, z):
+        """
+        Interpolate the output for a single set of inputs.
+
+        Inputs outside the grid are clipped to its bounds, as in skfuzzy.
+
+        Args:
+            x, y, z (float): The inputs, in the order of `labels`.
+
+        Returns:
+            float: The interpolated output, NaN if an input is NaN or infinite.
+        """
+        if not (math.isfinite(x) and math.isfinite(y) and math.isfinite(z)):
+            return math.nan
+        (start_x, start_y, start_z), (step_x, step_y, step_z) = self.starts, self.steps
+        size_x, size_y, size_z = self.sizes
+        i, fx = _cell(x, start_x, step_x, size_x)
+        j, fy = _cell(y, start_y, step_y, size_y)
+        k, fz = _cell(z, start_z, step_z, size_z)
+
+        v = self.flat_values
+        base = (i * size_y + j) * size_z + k
+        next_x, next_y = size_y * size_z, size_z
+        c00 = v[base] + (v[base + 1] - v[base]) * fz
+        c01 = v[base + next_y] + (v[base + next_y + 1] - v[base + next_y]) * fz
+        base += next_x
+        c10 = v[base] + (v[base + 1] - v[base]) * fz
+        c11 = v[base + next_y] + (v[base + next_y + 1] - v[base + next_y]) * fz
+        c0 = c00 + (c01 - c00) * fy
+        c1 = c10 + (c11 - c10) * fy
+        return c0 + (c1 - c0) * fx
+
+    def interpolate(self, x, y, z):
+        """
+        Interpolate the outputs for arrays of inputs.
+
+        Args:
+            x, y, z (numpy.ndarray): The inputs, in the order of `labels`.
+
+        Returns:
+            numpy.ndarray: The interpolated outputs, NaN where an input is NaN or infinite.
+        """
+        x, y, z = np.broadcast_arrays(*(np.asarray(values, dtype=float) for values in (x, y, z)))
+        finite = np.isfinite(x) & np.isfinite(y) & np.isfinite(z)
+        indexes = []
+        fractions = []
+        for values, start, step, size in zip((x, y, z), self.starts, self.steps, self.sizes):
+            position = np.clip((np.where(finite, values, start) - start) / step, 0, size - 1)
+            index = np.minimum(position.astype(int), size - 2)
+            indexes.append(index)
+            fractions.append(position - index)
+        (i, j, k), (fx, fy, fz) = indexes, fractions
+
+        v = self.values
+        c00 = v[i, j, k] + (v[i, j, k + 1] - v[i, j, k]) * fz
+        c01 = v[i, j + 1, k] + (v[i, j + 1, k + 1] - v[i, j + 1, k]) * fz
+        c10 = v[i + 1, j, k] + (v[i + 1, j, k + 1] - v[i + 1, j, k]) * fz
+        c11 = v[i + 1, j + 1, k] + (v[i + 1, j + 1, k + 1] - v[i + 1, j + 1, k]) * fz
+        c0 = c00 + (c01 - c00) * fy
+        c1 = c10 + (c11 - c10) * fy
+        return np.where(finite, c0 + (c1 - c0) * fx, np.nan)
+
+    def max_error(self, control_system, samples=1000, seed=0):
+        """
+        Measure the largest interpolation error against the exact `compute()` of skfuzzy.
+
+        Args:
+            control_system (ctrl.ControlSystem): The control system of the surface.
+            samples (int): The number of random inputs to compare.
+            seed (int): The seed of the random inputs.
+
+        Returns:
+            float: The largest absolute difference between the surface and skfuzzy.
+        """
+        rng = np.random.default_rng(seed)
+        simulation = ctrl.ControlSystemSimulation(control_system)
+        error = 0.0
+        for _ in range(samples):
+            inputs = [rng.uniform(axis[0], axis[-1]) for axis in self.axes]
+            for label, value in zip(self.labels, inputs):
+                simulation.input[label] = value
+            simulation.compute()
+            error = max(error, abs(self(*inputs) - simulation.output[self.output_label]))
+        return error
+
+
+def _cell(value, start, step, size):
+    """
+    Find the grid cell of a value and its position inside the cell.
+
+    Args:
+        value (float): The input value, finite (a NaN has no cell).
+        start (float): The first grid point.
+        step (float): The distance between grid points.
+        size (int): The number of grid points.
+
+    Returns:
+        tuple: The index of the lower grid point and the fraction (0-1) towards the upper one.
+    """
+    position = (value - start) / step
+    if position <= 0:
+        return 0, 0.0
+    if position >= size - 1:
+        return size - 2, 1.0
+    index = int(position)
+    return index, position - index
+
+
+if __name__ == '__main__':
+    from controller import music_volume_ctrl
+
+    start = time.perf_counter()
+    surface = ControlSurface.load_or_build(music_volume_ctrl)
+    print(f'Surface {surface.values.shape} loaded in {(time.perf_counter() - start) * 1000:.1f} ms')
+
+    start = time.perf_counter()
+    for _ in range(100000):
+        surface(80, 106, 60)
+    print(f'Query time: {(time.perf_counter() - start) * 10:.2f} us')
+    print(f'Max interpolation error: {surface.max_error(music_volume_ctrl):.4f}')
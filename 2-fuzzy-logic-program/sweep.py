@@ -0,0 +1,236 @@
+import argparse
+import collections
+import csv
+import math
+import multiprocessing
+import time
+
+from skfuzzy import control as ctrl
+
+from controller import music_volume_ctrl
+
+
+"""
+Offline what-if sweep of the music volume controller over recorded sensor logs.
+
+The input is a CSV file with a header, or a Parquet file (requires pyarrow), with the columns
+`heart_beat`, `surrounding_noise` and `music_beat_rate`. Its rows are read in chunks
+and the chunks are computed by a pool of worker processes, each of which builds its
+`ControlSystemSimulation` once. The output file gets the input columns and `music_volume`,
+in the order of the input.
+
+At most `--window` chunks are read ahead of the writer, so the memory stays bounded
+by the window and the chunk size, whatever the size of the input.
+
+How to set up:
+---
+Install pyarrow with `pip3 install pyarrow` to read or write Parquet files.
+
+How to run:
+---
+Run e.g. `python3 sweep.py night.csv --output volumes.csv --workers 4`.
+Run `python3 sweep.py --help` to see all options.
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+INPUT_LABELS = ('heart_beat', 'surrounding_noise', 'music_beat_rate')
+OUTPUT_LABEL = 'music_volume'
+
+# Worker process state, set up by _init_worker.
+_compute_chunk = None
+
+
+def _init_worker(compiled):
+    """
+    Build the controller of a worker process.
+
+    Args:
+        compiled (bool): Whether to use the vectorised CompiledControlSystem instead of skfuzzy.
+    """
+    global _compute_chunk
+    if compiled:
+        from compiled_controller import CompiledControlSystem
+
+        controller = CompiledControlSystem(music_volume_ctrl)
+
+        def compute_chunk(columns):
+            return controller.compute(**dict(zip(INPUT_LABELS, columns)))[OUTPUT_LABEL].tolist()
+    else:
+        simulation = ctrl.ControlSystemSimulation(music_volume_ctrl)
+
+        def compute_chunk(columns):
+            volumes = []
+            for inputs in zip(*columns):
+                for label, value in zip(INPUT_LABELS, inputs):
+                    simulation.input[label] = value
+                simulation.compute()
+                volumes.append(simulation.output.get(OUTPUT_LABEL, math.nan))
+            return volumes
+
+    _compute_chunk = compute_chunk
+
+
+def compute_chunk(columns):
+    """
+    Compute the volume for one chunk of rows in a worker process.
+
+    Args:
+        columns (list): The list of values of every input column.
+
+    Returns:
+        list: The volume of every row, NaN where no rule fired.
+    """
+    return _compute_chunk(columns)
+
+
+def read_chunks(path, chunk_size):
+    """
+    Read the input columns of a CSV or Parquet file in chunks.
+
+    Args:
+        path (str): The path of the input file, Parquet if it ends with `.parquet`.
+        chunk_size (int): The number of rows in a chunk.
+
+    Yields:
+        list: The list of float values of every input column, in the order of INPUT_LABELS.
+
+    Raises:
+        ValueError: If an input column is missing.
+    """
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        with pq.ParquetFile(path) as file:
+            missing = set(INPUT_LABELS) - set(file.schema_arrow.names)
+            if missing:
+                raise ValueError(f"Missing input columns: {', '.join(sorted(missing))}")
+            for batch in file.iter_batches(batch_size=chunk_size, columns=list(INPUT_LABELS)):
+                yield [batch.column(label).cast('float64').to_pylist() for label in INPUT_LABELS]
+        return
+
+    with open(path, newline='') as file:
+        reader = csv.DictReader(file)
+        missing = set(INPUT_LABELS) - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f"Missing input columns: {', '.join(sorted(missing))}")
+        chunk = [[] for _ in INPUT_LABELS]
+        for row in reader:
+            for column, label in zip(chunk, INPUT_LABELS):
+                column.append(float(row[label]))
+            if len(chunk[0]) == chunk_size:
+                yield chunk
+                chunk = [[] for _ in INPUT_LABELS]
+        if chunk[0]:
+            yield chunk
+
+
+class CsvWriter:
+    def __init__(self, path):
+        """
+        Open a CSV output file and write its header.
+
+        Args:
+            path (str): The path of the output file.
+        """
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(INPUT_LABELS + (OUTPUT_LABEL,))
+
+    def write(self, columns, volumes):
+        """
+        Write the rows of a chunk.
+
+        Args:
+            columns (list): The list of values of every input column.
+            volumes (list): The volume of every row.
+        """
+        self.writer.writerows(zip(*columns, volumes))
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    def __init__(self, path):
+        """
+        Open a Parquet output file.
+
+        Args:
+            path (str): The path of the output file.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.schema = pa.schema([(label, pa.float64()) for label in INPUT_LABELS + (OUTPUT_LABEL,)])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, columns, volumes):
+        """
+        Write the rows of a chunk as a row group.
+
+        Args:
+            columns (list): The list of values of every input column.
+            volumes (list): The volume of every row.
+        """
+        self.writer.write_batch(self.pa.record_batch(list(columns) + [volumes], schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def sweep(input_path, output_path, workers=None, chunk_size=2000, window=None, compiled=False):
+    """
+    Compute the volume for every row of the input file and write them to the output file in order.
+
+    The chunks are submitted with `apply_async` and at most `window` of them are in flight,
+    so the reading never runs ahead of the writing (unlike `Pool.imap`, which consumes
+    its whole input eagerly).
+
+    Args:
+        input_path (str): The path of the CSV or Parquet input file.
+        output_path (str): The path of the output file, Parquet if it ends with `.parquet`, CSV otherwise.
+        workers (int): The number of worker processes, the number of CPUs if not given.
+        chunk_size (int): The number of rows sent to a worker at once.
+        window (int): The largest number of chunks in flight, 2 per worker if not given.
+        compiled (bool): Whether the workers use the vectorised CompiledControlSystem instead of skfuzzy.
+
+    Returns:
+        int: The number of rows written.
+    """
+    workers = workers or multiprocessing.cpu_count()
+    window = window or 2 * workers
+    writer = ParquetWriter(output_path) if output_path.endswith('.parquet') else CsvWriter(output_path)
+    rows = 0
+    pending = collections.deque()
+    try:
+        with multiprocessing.Pool(workers, _init_worker, (compiled,)) as pool:
+            for columns in read_chunks(input_path, chunk_size):
+                if len(pending) == window:
+                    done_columns, result = pending.popleft()
+                    writer.write(done_columns, result.get())
+                pending.append((columns, pool.apply_async(compute_chunk, (columns,))))
+                rows += len(columns[0])
+            while pending:
+                done_columns, result = pending.popleft()
+                writer.write(done_columns, result.get())
+    finally:
+        writer.close()
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compute the music volume for every row of a sensor log.')
+    parser.add_argument('input', help='CSV or Parquet file with heart_beat, surrounding_noise, music_beat_rate columns')
+    parser.add_argument('--output', default='volumes.csv', help='CSV or Parquet (.parquet) output file')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=2000)
+    parser.add_argument('--window', type=int, default=None, help='largest number of chunks in flight')
+    parser.add_argument('--compiled', action='store_true', help='use the vectorised compiled controller')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = sweep(args.input, args.output, args.workers, args.chunk_size, args.window, args.compiled)
+    elapsed = time.perf_counter() - start
+    print(f'{count} rows written to {args.output} in {elapsed:.1f} s ({count / elapsed:,.0f} rows/s)')
@@ -0,0 +1,35 @@
+import math
+
+import pytest
+
+from controller import music_volume_ctrl
+from inference_cache import InferenceCache
+
+
+"""
+Tests of the quantisation of the inference cache.
+
+How to run:
+---
+Run the tests with the following command `python3 -m pytest test_inference_cache.py`
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+
+@pytest.fixture
+def cache():
+    return InferenceCache(music_volume_ctrl)
+
+
+def test_inputs_halfway_between_grid_points_go_up(cache):
+    # heart_beat starts at 40 with a step of 1, music_beat_rate at 20 with a step of 10.
+    assert cache.key({'heart_beat': 80.5, 'surrounding_noise': 106, 'music_beat_rate': 65}) == (41, 86, 5)
+    assert cache.key({'heart_beat': 81.5, 'surrounding_noise': 106, 'music_beat_rate': 75}) == (42, 86, 6)
+
+
+@pytest.mark.parametrize('value', [math.nan, math.inf, -math.inf])
+def test_non_finite_inputs_give_nan(cache, value):
+    outputs = cache.compute(heart_beat=value, surrounding_noise=106, music_beat_rate=60)
+    assert math.isnan(outputs['music_volume'])
+    assert cache.misses == 0
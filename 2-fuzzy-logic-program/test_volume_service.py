@@ -0,0 +1,61 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from volume_service import VolumeService, parse_reading
+
+
+"""
+Tests of the volume service: a bad reading is reported and the service goes on with the next readings.
+
+How to run:
+---
+Run the tests with the following command `python3 -m pytest test_volume_service.py`
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.mark.parametrize('line', ['nan 1 1', '80 inf 60', '80,106,-inf', '80 106'])
+def test_parse_reading_rejects_bad_lines(line):
+    with pytest.raises(ValueError):
+        parse_reading(line)
+
+
+def test_stdin_answers_the_reading_after_a_bad_line():
+    result = subprocess.run([sys.executable, 'volume_service.py'], input='nan 1 1\n80 106 60\n',
+                            capture_output=True, text=True, cwd=HERE, timeout=120)
+    assert result.returncode == 0
+    assert result.stdout.split() == ['27.38']
+    assert 'nan 1 1' in result.stderr
+
+
+def test_run_goes_on_after_a_failing_reading():
+    service = VolumeService()
+    compute = service.compute
+
+    def failing_compute(*inputs):
+        if inputs[0] == 0:
+            raise ValueError('no volume')
+        return compute(*inputs)
+
+    service.compute = failing_compute
+    volumes, errors = [], []
+
+    async def run():
+        queue = asyncio.Queue()
+        for inputs in ((0, 106, 60), (80, 106, 60)):
+            queue.put_nowait((time.perf_counter(), inputs, volumes.append, errors.append))
+        queue.put_nowait(None)
+        await service.run(queue)
+
+    asyncio.run(run())
+    assert [round(volume, 2) for volume in volumes] == [27.38]
+    assert [str(error) for error in errors] == ['no volume']
+    assert service.stats.count == 1
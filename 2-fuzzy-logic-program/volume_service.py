@@ -0,0 +1,364 @@
+import argparse
+import asyncio
+import collections
+import math
+import sys
+import threading
+import time
+
+from skfuzzy import control as ctrl
+
+from controller import music_volume_ctrl
+
+
+"""
+Long-running music volume controller.
+
+It reads sensor readings, one per line: `<heart_beat> <surrounding_noise> <music_beat_rate>`
+(separated by spaces or commas), and answers every reading with a line holding the new volume.
+The readings come from stdin or from clients of a UNIX socket, and can also be put
+into an asyncio queue by other code (see `VolumeService.run`).
+
+The controller is built and warmed up before the first reading, and nothing is plotted,
+so the latency of a reading is only the fuzzy inference. Bursts of readings can be
+coalesced (only the newest waiting reading is computed) and the volume can be smoothed
+with an exponential moving average. The p50/p99 latency is written to stderr at the end
+and every `--stats-interval` seconds.
+
+How to run:
+---
+`python3 volume_service.py` reads stdin, e.g. `echo "80 106 60" | python3 volume_service.py`
+`python3 volume_service.py --source unix --socket /tmp/volume.sock` serves a UNIX socket.
+Run `python3 volume_service.py --help` to see all options.
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+INPUT_LABELS = ('heart_beat', 'surrounding_noise', 'music_beat_rate')
+
+
+def skfuzzy_engine():
+    """
+    Create an engine computing the volume with one reused skfuzzy simulation.
+
+    Returns:
+        function: A function f(heart_beat, surrounding_noise, music_beat_rate) -> volume.
+    """
+    simulation = ctrl.ControlSystemSimulation(music_volume_ctrl)
+
+    def compute(*inputs):
+        for label, value in zip(INPUT_LABELS, inputs):
+            simulation.input[label] = value
+        simulation.compute()
+        return simulation.output['music_volume']
+
+    return compute
+
+
+def surface_engine():
+    """
+    Create an engine interpolating the volume on the precomputed control surface.
+
+    Returns:
+        function: A function f(heart_beat, surrounding_noise, music_beat_rate) -> volume.
+    """
+    from lookup_table import ControlSurface
+
+    return ControlSurface.load_or_build(music_volume_ctrl)
+
+
+def cached_engine():
+    """
+    Create an engine computing the volume with skfuzzy for inputs quantised to
+    the step of their universe, with the results kept in an LRU cache.
+
+    Returns:
+        function: A function f(heart_beat, surrounding_noise, music_beat_rate) -> volume.
+    """
+    from inference_cache import InferenceCache
+
+    cache = InferenceCache(music_volume_ctrl)
+
+    def compute(*inputs):
+        return cache.compute(**dict(zip(INPUT_LABELS, inputs)))['music_volume']
+
+    return compute
+
+
+ENGINES = {
+    'skfuzzy': skfuzzy_engine,
+    'surface': surface_engine,
+    'cached': cached_engine,
+}
+
+
+def parse_reading(line):
+    """
+    Parse a sensor reading line.
+
+    Args:
+        line (str): The three inputs separated by spaces or commas.
+
+    Returns:
+        tuple: heart_beat, surrounding_noise and music_beat_rate.
+
+    Raises:
+        ValueError: If the line does not hold three finite numbers.
+    """
+    values = line.replace(',', ' ').split()
+    if len(values) != len(INPUT_LABELS):
+        raise ValueError(f'Expected {len(INPUT_LABELS)} values, got: {line.strip()!r}')
+    inputs = tuple(float(value) for value in values)
+    if not all(math.isfinite(value) for value in inputs):
+        raise ValueError(f'Expected finite values, got: {line.strip()!r}')
+    return inputs
+
+
+class LatencyStats:
+    def __init__(self, history=10000):
+        """
+        Initialize the latency statistics.
+
+        Args:
+            history (int): How many of the latest latencies the percentiles are computed from.
+
+        Attributes:
+            - count (int): The number of computed readings.
+            - coalesced (int): The number of readings skipped because a newer one was waiting.
+        """
+        self.latencies = collections.deque(maxlen=history)
+        self.count = 0
+        self.coalesced = 0
+
+    def add(self, latency):
+        """
+        Record the latency of one computed reading.
+
+        Args:
+            latency (float): The time from receiving the reading to emitting the volume, in seconds.
+        """
+        self.latencies.append(latency)
+        self.count += 1
+
+    def percentile(self, percent):
+        """
+        Args:
+            percent (float): The percentile to compute (0-100).
+
+        Returns:
+            float: The latency percentile in milliseconds, or None without any readings.
+        """
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))] * 1000
+
+    def summary(self):
+        """
+        Returns:
+            dict: The reading counts and the p50, p99 and maximum latency in milliseconds.
+        """
+        return {
+            'count': self.count,
+            'coalesced': self.coalesced,
+            'p50_ms': self.percentile(50),
+            'p99_ms': self.percentile(99),
+            'max_ms': max(self.latencies) * 1000 if self.latencies else None,
+        }
+
+
+class VolumeService:
+    def __init__(self, engine='skfuzzy', smoothing=None, coalesce=False):
+        """
+        Create the controller and warm it up.
+
+        Args:
+            engine (str): The name of the engine computing the volume, a key of ENGINES.
+            smoothing (float): The weight (0-1) of a new volume in the exponential moving
+                               average of the emitted volume, None to emit raw volumes.
+            coalesce (bool): Whether to compute only the newest of the readings waiting in the queue.
+
+        Attributes:
+            - stats (LatencyStats): The latency statistics of the computed readings.
+        """
+        self.compute = ENGINES[engine]()
+        self.compute(70, 80, 110)
+        self.smoothing = smoothing
+        self.coalesce = coalesce
+        self.volume = None
+        self.stats = LatencyStats()
+
+    def update(self, inputs):
+        """
+        Compute the volume for a reading and apply the smoothing.
+
+        Args:
+            inputs (tuple): heart_beat, surrounding_noise and music_beat_rate.
+
+        Returns:
+            float: The volume to emit.
+
+        Raises:
+            ValueError: If the engine has no volume for the reading (no rule fired).
+        """
+        volume = self.compute(*inputs)
+        if not math.isfinite(volume):
+            raise ValueError(f'No volume for the reading: {inputs}')
+        if self.smoothing is not None and self.volume is not None:
+            volume = self.volume + self.smoothing * (volume - self.volume)
+        self.volume = volume
+        return volume
+
+    async def run(self, queue):
+        """
+        Compute the volume for the readings put into the queue until a None item arrives.
+
+        Items are tuples: the `time.perf_counter()` when the reading was received,
+        its inputs, a function emitting the volume and a function reporting an error.
+        A reading that fails is reported with its error and the next readings are still computed.
+
+        Args:
+            queue (asyncio.Queue): The queue of readings.
+        """
+        while True:
+            item = await queue.get()
+            while self.coalesce and item is not None and not queue.empty():
+                newer = queue.get_nowait()
+                if newer is None:
+                    queue.put_nowait(None)
+                    break
+                item = newer
+                self.stats.coalesced += 1
+            if item is None:
+                return
+            received, inputs, emit, fail = item
+            try:
+                emit(self.update(inputs))
+            except Exception as e:
+                fail(e)
+                continue
+            self.stats.add(time.perf_counter() - received)
+
+
+def report(stats):
+    """
+    Write the latency statistics to stderr.
+
+    Args:
+        stats (LatencyStats): The statistics to report.
+    """
+    summary = stats.summary()
+    if summary['count']:
+        print(
+            f"readings: {summary['count']}, coalesced: {summary['coalesced']}, "
+            f"p50: {summary['p50_ms']:.3f} ms, p99: {summary['p99_ms']:.3f} ms, max: {summary['max_ms']:.3f} ms",
+            file=sys.stderr,
+        )
+
+
+async def report_periodically(stats, interval):
+    """
+    Report the latency statistics every interval seconds.
+
+    Args:
+        stats (LatencyStats): The statistics to report.
+        interval (float): The time between reports in seconds.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        report(stats)
+
+
+async def serve_stdin(service):
+    """
+    Compute the volume for readings from stdin and print every volume to stdout.
+
+    stdin is read in a thread, so a blocked read never delays the computation.
+
+    Args:
+        service (VolumeService): The controller.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def emit(volume):
+        print(f'{volume:.2f}', flush=True)
+
+    def fail(error):
+        print(error, file=sys.stderr)
+
+    def read():
+        for line in sys.stdin:
+            received = time.perf_counter()
+            if not line.strip():
+                continue
+            try:
+                item = (received, parse_reading(line), emit, fail)
+            except ValueError as e:
+                print(e, file=sys.stderr)
+                continue
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    threading.Thread(target=read, daemon=True).start()
+    await service.run(queue)
+
+
+async def serve_unix(service, path):
+    """
+    Compute the volume for readings from the clients of a UNIX socket and answer
+    every reading with the volume, until the process is stopped.
+
+    Args:
+        service (VolumeService): The controller.
+        path (str): The path of the socket.
+    """
+    queue = asyncio.Queue()
+
+    async def handle_client(reader, writer):
+        def emit(volume):
+            writer.write(f'{volume:.2f}\n'.encode())
+
+        def fail(error):
+            writer.write(f'error: {error}\n'.encode())
+
+        async for line in reader:
+            received = time.perf_counter()
+            try:
+                queue.put_nowait((received, parse_reading(line.decode()), emit, fail))
+            except ValueError as e:
+                fail(e)
+        writer.close()
+
+    server = await asyncio.start_unix_server(handle_client, path)
+    async with server:
+        await service.run(queue)
+
+
+async def main(args):
+    service = VolumeService(args.engine, args.smoothing, args.coalesce)
+    reporter = asyncio.create_task(report_periodically(service.stats, args.stats_interval)) if args.stats_interval else None
+    try:
+        if args.source == 'unix':
+            await serve_unix(service, args.socket)
+        else:
+            await serve_stdin(service)
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+        report(service.stats)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the music volume controller for a stream of sensor readings.')
+    parser.add_argument('--source', choices=('stdin', 'unix'), default='stdin')
+    parser.add_argument('--socket', default='/tmp/music_volume.sock', help='path of the UNIX socket')
+    parser.add_argument('--engine', choices=ENGINES, default='skfuzzy')
+    parser.add_argument('--smoothing', type=float, default=None,
+                        help='weight (0-1) of a new volume in the moving average of the emitted volume')
+    parser.add_argument('--coalesce', action='store_true', help='compute only the newest of the waiting readings')
+    parser.add_argument('--stats-interval', type=float, default=None, help='report latencies every N seconds')
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,225 @@
+"""
+Approximate nearest-neighbour search of similar users with random-projection LSH.
+
+Every user is a normalised vector of their ratings (centred on the user's mean for the
+'pearson' similarity). A user rates few of the movies, so these vectors are almost orthogonal;
+by default they are embedded in a few dimensions with a truncated SVD first, where users
+with similar tastes point in similar directions. `LSHIndex` hashes the vectors with random
+hyperplanes: a bit of the hash tells on which side of a hyperplane the vector lies, so users
+with a small angle between their vectors are likely to share a bucket. Several tables of
+`n_bits`-bit hashes are kept, each as a sorted array of hashes, so a query looks up one bucket
+per table (and optionally the buckets at a Hamming distance of 1) instead of comparing it
+with every user.
+
+`ANNKNNBasic` is a `SparseKNNBasic` whose neighbours come from the index: the users found
+in the buckets are ranked by their exact similarity (computed only for them) and the
+`n_neighbours` most similar ones feed the same estimate as KNNBasic.
+
+Usage
+---
+model = ANNKNNBasic(sim_options={'name': 'pearson', 'user_based': True}, n_tables=16, n_bits=8)
+model.fit(trainset)
+movies, estimates = model.predict_items('Anna Rogala')
+
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.linalg import svds
+
+from sparse_knn import SparseKNNBasic
+
+
+class LSHIndex:
+    """
+    Random-projection LSH index of vectors, for the cosine similarity.
+    """
+
+    def __init__(self, n_tables=8, n_bits=12, multiprobe=False, seed=0):
+        """
+        Creates an empty index.
+
+        Parameters:
+        n_tables (int): The number of hash tables; more tables find more neighbours and take longer.
+        n_bits (int): The number of bits of a hash (at most 62); more bits make smaller buckets.
+        multiprobe (bool): Whether to look up the buckets at a Hamming distance of 1 too.
+        seed (int): The seed of the random hyperplanes.
+
+        Raises:
+        ValueError: If the number of bits is not between 1 and 62.
+        """
+        if not 1 <= n_bits <= 62:
+            raise ValueError(f"Liczba bitów musi być z przedziału 1-62: {n_bits}")
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.multiprobe = multiprobe
+        self.seed = seed
+
+    def build(self, vectors):
+        """
+        Hashes the vectors into the tables. Zero vectors are left out, as they have no direction.
+
+        Parameters:
+        vectors (numpy.ndarray or scipy.sparse matrix): One vector per row.
+
+        Returns:
+        LSHIndex: The index.
+        """
+        rng = np.random.default_rng(self.seed)
+        self.planes = rng.standard_normal((vectors.shape[1], self.n_tables * self.n_bits))
+        keys = self.hash(vectors)
+        indexed = np.flatnonzero(_nonzero_rows(vectors))
+        self.order = []
+        self.keys = []
+        for table in range(self.n_tables):
+            order = indexed[np.argsort(keys[indexed, table], kind='stable')]
+            self.order.append(order)
+            self.keys.append(keys[order, table])
+        return self
+
+    def hash(self, vectors):
+        """
+        Computes the hashes of vectors in every table.
+
+        Parameters:
+        vectors (numpy.ndarray or scipy.sparse matrix): One vector per row.
+
+        Returns:
+        numpy.ndarray: An n_vectors x n_tables array of hashes.
+        """
+        bits = np.asarray(vectors @ self.planes) > 0
+        bits = bits.reshape(-1, self.n_tables, self.n_bits)
+        return bits.astype(np.int64) @ (1 << np.arange(self.n_bits, dtype=np.int64))
+
+    def query(self, vector):
+        """
+        Finds the vectors sharing a bucket with a vector in any table.
+
+        Parameters:
+        vector (numpy.ndarray or scipy.sparse matrix): A single row.
+
+        Returns:
+        numpy.ndarray: The sorted row numbers of the found vectors.
+        """
+        if not _nonzero_rows(vector)[0]:
+            return np.array([], dtype=np.int64)
+        keys = self.hash(vector)[0]
+        flips = np.concatenate(([0], 1 << np.arange(self.n_bits, dtype=np.int64))) if self.multiprobe else np.zeros(1, np.int64)
+        found = []
+        for table, key in enumerate(keys):
+            probes = key ^ flips
+            starts = np.searchsorted(self.keys[table], probes, side='left')
+            ends = np.searchsorted(self.keys[table], probes, side='right')
+            found.extend(self.order[table][start:end] for start, end in zip(starts, ends))
+        if not found:
+            return np.array([], dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+
+def _nonzero_rows(vectors):
+    """
+    Finds the rows which are not zero vectors.
+
+    Parameters:
+    vectors (numpy.ndarray or scipy.sparse matrix): One vector per row.
+
+    Returns:
+    numpy.ndarray: True for every row with a nonzero value.
+    """
+    return np.asarray(abs(vectors).sum(axis=1)).ravel() > 0
+
+
+class ANNKNNBasic(SparseKNNBasic):
+    """
+    User-based KNNBasic whose neighbours are found with an LSH index.
+    """
+
+    def __init__(self, k=40, min_k=1, sim_options=None, n_neighbours=200, n_components=32, n_tables=16, n_bits=8,
+                 multiprobe=False, seed=0):
+        """
+        Creates the model.
+
+        Parameters:
+        k (int): The largest number of neighbours taken into account for an estimate of a movie.
+        min_k (int): The smallest number of neighbours needed for an estimate.
+        sim_options (dict): The similarity options, as for KNNBasic (see SparseKNNBasic).
+        n_neighbours (int): The number of most similar users found for a user, shared by the estimates of all movies.
+        n_components (int): The number of dimensions of the SVD embedding of the user vectors, None to hash the vectors themselves.
+        n_tables (int): The number of hash tables of the index.
+        n_bits (int): The number of bits of a hash.
+        multiprobe (bool): Whether to look up the buckets at a Hamming distance of 1 too.
+        seed (int): The seed of the random hyperplanes.
+
+        Raises:
+        ValueError: If the similarity is not supported or the options are not user based.
+        """
+        super().__init__(k, min_k, sim_options)
+        self.n_neighbours = n_neighbours
+        self.n_components = n_components
+        self.seed = seed
+        self.index = LSHIndex(n_tables, n_bits, multiprobe, seed)
+
+    def fit(self, trainset):
+        """
+        Builds the sparse ratings matrices of a trainset and the index of the normalised user vectors.
+
+        Parameters:
+        trainset (surprise.Trainset): The training dataset.
+
+        Returns:
+        ANNKNNBasic: The model.
+        """
+        super().fit(trainset)
+        vectors = self.ratings.copy()
+        if self.name == 'pearson':
+            counts = np.diff(vectors.indptr)
+            means = np.asarray(vectors.sum(axis=1)).ravel() / np.maximum(counts, 1)
+            vectors.data = vectors.data - np.repeat(means, counts)
+            vectors.eliminate_zeros()
+        norms = np.sqrt(np.asarray(vectors.multiply(vectors).sum(axis=1)).ravel())
+        self.vectors = (sp.diags(np.divide(1, norms, out=np.zeros_like(norms), where=norms > 0)) @ vectors).tocsr()
+        if self.n_components and self.n_components < min(self.vectors.shape):
+            users, singular_values, _ = svds(self.vectors, k=self.n_components, random_state=self.seed)
+            self.vectors = users * singular_values
+        self.index.build(self.vectors)
+        return self
+
+    def neighbours(self, inner_user):
+        """
+        Finds the most similar users of a user with the index.
+
+        Parameters:
+        inner_user (int): The inner id of the user.
+
+        Returns:
+        tuple: The inner ids of at most n_neighbours users with a positive similarity,
+        from the most similar one, and their exact similarities.
+        """
+        candidates = self.index.query(self.vectors[inner_user:inner_user + 1])
+        candidates = candidates[candidates != inner_user]
+        if len(candidates) == 0:
+            return candidates, np.array([])
+        similarities = self.similarity_rows(inner_user, candidates)[0]
+        order = np.argsort(-similarities, kind='stable')[:self.n_neighbours]
+        order = order[similarities[order] > 0]
+        return candidates[order], similarities[order]
+
+    def user_similarities(self, inner_users):
+        """
+        Gives the similarities of users to the neighbours found with the index, and 0 to all other users.
+
+        Parameters:
+        inner_users (array-like of int): The inner ids of the users.
+
+        Returns:
+        numpy.ndarray: A len(inner_users) x n_users array of similarities.
+        """
+        inner_users = np.atleast_1d(inner_users)
+        result = np.zeros((len(inner_users), self.n_users))
+        for row, inner_user in enumerate(inner_users):
+            users, similarities = self.neighbours(inner_user)
+            result[row, users] = similarities
+            result[row, inner_user] = 1
+        return result
@@ -0,0 +1,255 @@
+"""
+Batch recommendations: the top and bottom movies of every user of the ratings sheet, at once.
+
+The users are split into blocks. For a block, the estimates of all movies are computed with
+a few sparse matrix products (see SparseKNNBasic.estimate_rows), the movies rated by the users
+are left out, and the best and worst n movies of every user are selected with argpartition,
+sorting only the selected movies (ties are ordered as in get_movie_recommendations).
+The blocks are computed by a pool of worker processes, each of which loads the trained
+models (memory-mapped, see model_store.py) once, and are written in order to a Parquet file
+with one row per user and metric.
+
+
+How to run
+---
+Run the program with the following command `python3 batch_recommendations.py`
+It writes recommendations.parquet and prints the time and the peak memory per 1000 users.
+Run `python3 batch_recommendations.py --help` to see all options, e.g. `--workers` and `--block-size`.
+
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from model_store import ARTIFACT_DIR, METRICS, SOURCE_FILE, ModelArtifact, load_or_build
+
+
+OUTPUT_FILE = 'recommendations.parquet'
+BLOCK_SIZE = 64
+SCHEMA = pa.schema([
+    ('Osoba', pa.string()),
+    ('metric', pa.dictionary(pa.int8(), pa.string())),
+    ('top_movies', pa.list_(pa.string())),
+    ('top_ratings', pa.list_(pa.float32())),
+    ('bottom_movies', pa.list_(pa.string())),
+    ('bottom_ratings', pa.list_(pa.float32())),
+])
+
+# Worker process state, set up by _init_worker.
+_artifact = None
+_columns = None
+
+
+def _init_worker(directory):
+    """
+    Loads the artifact in a worker process.
+
+    Parameters:
+    directory (str): The path to the artifact.
+    """
+    global _artifact, _columns
+    _artifact = ModelArtifact(directory)
+    _columns = {metric: movie_columns(_artifact, model) for metric, model in _artifact.models.items()}
+
+
+def select_best(scores, n):
+    """
+    Selects the n largest scores of every row, without sorting the whole rows.
+
+    argpartition finds the n-th largest score of every row; only the scores not smaller than it
+    are sorted, stably, so ties keep the order of the columns as with a full stable sort.
+    Scores of -inf are never selected.
+
+    Parameters:
+    scores (numpy.ndarray): A 2D array of scores.
+    n (int): The number of scores selected in every row.
+
+    Returns:
+    list of numpy.ndarray: The columns of the selected scores of every row, from the largest.
+    """
+    n = min(n, scores.shape[1])
+    if n == 0:
+        return [np.array([], dtype=np.int64) for _ in scores]
+    part = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+    thresholds = np.take_along_axis(scores, part, axis=1).min(axis=1)
+    selected = []
+    for row, threshold in zip(scores, thresholds):
+        columns = np.flatnonzero((row >= threshold) & (row > -np.inf))
+        selected.append(columns[np.argsort(-row[columns], kind='stable')][:n])
+    return selected
+
+
+def movie_columns(artifact, model):
+    """
+    Maps the movies of the ratings sheet to the movies of a model.
+
+    Parameters:
+    artifact (ModelArtifact): The loaded artifact.
+    model (SparseKNNBasic): A model of the artifact.
+
+    Returns:
+    numpy.ndarray: The inner id of every movie of the sheet, -1 for movies the model does not know.
+    """
+    return np.array([model.movie_ids.get(movie, -1) for movie in artifact.movies.tolist()], dtype=np.int64)
+
+
+def estimate_block(artifact, positions, metric, columns=None):
+    """
+    Estimates the ratings of all movies of the ratings sheet for a block of users.
+
+    Parameters:
+    artifact (ModelArtifact): The loaded artifact.
+    positions (numpy.ndarray): The positions of the users in artifact.users.
+    metric (str): The metric of the model.
+    columns (numpy.ndarray): The result of movie_columns, computed if not given.
+
+    Returns:
+    numpy.ndarray: A len(positions) x len(artifact.movies) array of estimates, clipped to the rating scale,
+    the global mean where they are impossible.
+    """
+    model = artifact.models[metric]
+    if columns is None:
+        columns = movie_columns(artifact, model)
+    inner_users = np.array([model.user_ids.get(user, -1) for user in artifact.users[positions].tolist()])
+    scores = np.full((len(positions), len(columns)), np.nan)
+    rows, known = np.flatnonzero(inner_users >= 0), np.flatnonzero(columns >= 0)
+    if len(rows) and len(known):
+        scores[np.ix_(rows, known)] = model.estimate_rows(inner_users[rows])[:, columns[known]]
+    scores[np.isnan(scores)] = model.global_mean
+    return np.clip(scores, *model.rating_scale)
+
+
+def rated_mask(artifact, positions):
+    """
+    Marks the movies rated by a block of users.
+
+    Parameters:
+    artifact (ModelArtifact): The loaded artifact.
+    positions (numpy.ndarray): The positions of the users in artifact.users.
+
+    Returns:
+    numpy.ndarray: A len(positions) x len(artifact.movies) boolean array.
+    """
+    starts, ends = artifact.rated_starts[positions], artifact.rated_starts[positions + 1]
+    counts = ends - starts
+    entries = np.arange(counts.sum()) + np.repeat(starts - (np.cumsum(counts) - counts), counts)
+    mask = np.zeros((len(positions), len(artifact.movies)), dtype=bool)
+    mask[np.repeat(np.arange(len(positions)), counts), artifact.rated_movies[entries]] = True
+    return mask
+
+
+def recommend_block(artifact, positions, metrics=METRICS, n=5, columns=None):
+    """
+    Computes the top and bottom n movies not rated by every user of a block.
+
+    Parameters:
+    artifact (ModelArtifact): The loaded artifact.
+    positions (numpy.ndarray): The positions of the users in artifact.users.
+    metrics (iterable of str): The metrics of the models.
+    n (int): The number of movies in each list.
+    columns (dict): The result of movie_columns for every metric, computed if not given.
+
+    Returns:
+    pyarrow.Table: One row per user and metric, with the columns of SCHEMA.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    rated = rated_mask(artifact, positions)
+    users = artifact.users[positions].tolist()
+    tables = []
+    for metric in metrics:
+        scores = estimate_block(artifact, positions, metric, columns and columns[metric])
+        top = select_best(np.where(rated, -np.inf, scores), n)
+        bottom = select_best(np.where(rated, -np.inf, -scores), n)
+        tables.append(pa.table({
+            'Osoba': users,
+            'metric': pa.array([metric] * len(users)).dictionary_encode(),
+            'top_movies': [artifact.movies[best].tolist() for best in top],
+            'top_ratings': [scores[row, best].tolist() for row, best in enumerate(top)],
+            'bottom_movies': [artifact.movies[worst].tolist() for worst in bottom],
+            'bottom_ratings': [scores[row, worst].tolist() for row, worst in enumerate(bottom)],
+        }).cast(SCHEMA))
+    return pa.concat_tables(tables)
+
+
+def _recommend_task(task):
+    """
+    Computes a block of users in a worker process.
+
+    Parameters:
+    task (tuple): The positions of the users, the metrics and n.
+
+    Returns:
+    tuple: The recommendations of the block (see recommend_block) and the peak memory of the worker in MiB.
+    """
+    positions, metrics, n = task
+    table = recommend_block(_artifact, positions, metrics, n, _columns)
+    return table, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def recommend_all(directory=ARTIFACT_DIR, output_path=OUTPUT_FILE, metrics=METRICS, n=5, workers=None,
+                  block_size=BLOCK_SIZE, report_every=1000):
+    """
+    Computes the recommendations of all users of an artifact and writes them to a Parquet file.
+
+    The time and the peak memory of the processes are printed for every report_every users.
+
+    Parameters:
+    directory (str): The path to the artifact.
+    output_path (str): The path to the Parquet file.
+    metrics (iterable of str): The metrics of the models.
+    n (int): The number of movies in each list.
+    workers (int): The number of worker processes, the number of CPUs if not given.
+    block_size (int): The number of users of a block.
+    report_every (int): The number of users between the reports.
+
+    Returns:
+    tuple: The number of users, the time in seconds and the peak memory of the largest worker in MiB.
+    """
+    workers = workers or multiprocessing.cpu_count()
+    n_users = len(ModelArtifact(directory).users)
+    tasks = [(np.arange(start, min(start + block_size, n_users)), tuple(metrics), n)
+             for start in range(0, n_users, block_size)]
+    start = last_time = time.perf_counter()
+    done = last_done = 0
+    worker_peak = 0
+    with pq.ParquetWriter(output_path, SCHEMA, compression='zstd') as writer:
+        with multiprocessing.Pool(workers, _init_worker, (directory,)) as pool:
+            for (positions, _, _), (table, peak) in zip(tasks, pool.imap(_recommend_task, tasks)):
+                writer.write_table(table)
+                done += len(positions)
+                worker_peak = max(worker_peak, peak)
+                if done - last_done >= report_every or done == n_users:
+                    now = time.perf_counter()
+                    main_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+                    print(f'{done:8d} users: {(now - last_time) / (done - last_done) * 1000:6.2f} s per 1000 users, '
+                          f'peak memory: main process {main_peak:.0f} MiB, largest worker {worker_peak:.0f} MiB')
+                    last_time, last_done = now, done
+    return n_users, time.perf_counter() - start, worker_peak
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recommendations for all users, written to a Parquet file.')
+    parser.add_argument('--source', default=SOURCE_FILE, help='path to the ratings sheet')
+    parser.add_argument('--artifact', default=ARTIFACT_DIR, help='path to the artifact of the trained models')
+    parser.add_argument('--output', default=OUTPUT_FILE)
+    parser.add_argument('--metrics', nargs='+', choices=METRICS, default=list(METRICS))
+    parser.add_argument('-n', type=int, default=5, help='number of movies in each list')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE, help='number of users computed at once')
+    parser.add_argument('--report-every', type=int, default=1000, help='number of users between the reports')
+    args = parser.parse_args()
+
+    load_or_build(args.source, args.artifact)
+    count, elapsed, worker_peak = recommend_all(args.artifact, args.output, args.metrics, args.n, args.workers,
+                                                args.block_size, args.report_every)
+    print(f'{count} users in {elapsed:.2f} s ({elapsed / count * 1000:.2f} s per 1000 users), '
+          f'{args.output}: {os.path.getsize(args.output) / 2 ** 10:.0f} KiB')
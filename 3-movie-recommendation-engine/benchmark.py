@@ -0,0 +1,372 @@
+"""
+Benchmarks of the movie recommendation engine.
+
+
+How to run
+---
+Run the benchmarks with: `python3 benchmark.py <benchmark>`,
+e.g. `python3 benchmark.py process-data --ratings 100000 1000000`
+or `python3 benchmark.py knn --users 1000 5000`
+or `python3 benchmark.py ann --users 2000 --tables 4 8 16 --bits 8 12`.
+Run `python3 benchmark.py --help` to list the available benchmarks.
+
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from surprise import Dataset, KNNBasic, Reader
+
+from ann_index import ANNKNNBasic
+from ingestion import read_ratings, reshape_ratings, RATING_DTYPE
+from sparse_knn import SparseKNNBasic
+
+
+# Movie and rating column pairs per user in the generated sheets, as in parsed_data.xlsx.
+PAIRS = 31
+
+
+def generate_sheet(ratings, movies=5000, missing=0.1, seed=0):
+    """
+    Generates a wide ratings sheet with about the given number of ratings.
+
+    Parameters:
+    ratings (int): The number of movie and rating pairs in the sheet.
+    movies (int): The number of different movies.
+    missing (float): The fraction of empty pairs.
+    seed (int): The seed of the random generator.
+
+    Returns:
+    pandas.DataFrame: The sheet with the columns Osoba, Nazwa, Ocena, Nazwa.1, Ocena.1, ...
+    """
+    rng = np.random.default_rng(seed)
+    users = -(-ratings // PAIRS)
+    names = np.array([f'Film {i}' for i in range(movies)], dtype=object)
+    columns = {'Osoba': np.array([f'Osoba {i}' for i in range(users)], dtype=object)}
+    for pair in range(PAIRS):
+        suffix = f'.{pair}' if pair else ''
+        empty = rng.random(users) < missing
+        movie = names[rng.integers(0, movies, users)]
+        movie[empty] = None
+        rating = rng.integers(1, 11, users).astype(float)
+        rating[empty] = np.nan
+        columns['Nazwa' + suffix] = movie
+        columns['Ocena' + suffix] = rating
+    return pd.DataFrame(columns)
+
+
+def process_data_iterrows(df):
+    """
+    The reshaping of process_data before it was vectorised: fillna(0) and a loop over iterrows.
+
+    Parameters:
+    df (pandas.DataFrame): The wide sheet.
+
+    Returns:
+    pandas.DataFrame: A DataFrame with columns ['Osoba', 'Nazwa', 'Ocena'].
+    """
+    df = df.astype(object).fillna(0)
+    data_list = []
+    for index, row in df.iterrows():
+        user = str(row['Osoba'])
+        for i in range(1, len(row), 2):
+            movie = row.iloc[i]
+            rating = row.iloc[i + 1]
+            if movie and rating:
+                data_list.append((user, movie, rating))
+    return pd.DataFrame(data_list, columns=['Osoba', 'Nazwa', 'Ocena'])
+
+
+def process_data_vectorised(df):
+    """
+    The reshaping of process_data: vectorised stacking of the pairs, categorical users and movies, float32 ratings.
+
+    Parameters:
+    df (pandas.DataFrame): The wide sheet.
+
+    Returns:
+    pandas.DataFrame: A DataFrame with columns ['Osoba', 'Nazwa', 'Ocena'].
+    """
+    long = reshape_ratings(df)
+    return long.astype({'Osoba': 'category', 'Nazwa': 'category', 'Ocena': RATING_DTYPE})
+
+
+def measure(function, *args):
+    """
+    Runs a function twice: once timed, once with traced memory.
+
+    Parameters:
+    function (callable): The function to run.
+    *args: The arguments of the function.
+
+    Returns:
+    tuple: The result, the time in seconds and the peak traced memory in bytes.
+    """
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    try:
+        function(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def benchmark_process_data(sizes, skip_iterrows):
+    """
+    Compares the iterrows reshaping with the vectorised one, in memory and from a CSV file.
+
+    Parameters:
+    sizes (list of int): The numbers of ratings to measure.
+    skip_iterrows (bool): Whether to skip the slow iterrows reshaping.
+    """
+    for size in sizes:
+        sheet = generate_sheet(size)
+        print(f'{len(sheet)} users, {sheet.iloc[:, 2::2].notna().sum().sum()} ratings:')
+        cases = [('vectorised', process_data_vectorised)]
+        if not skip_iterrows:
+            cases.insert(0, ('iterrows', process_data_iterrows))
+        for name, function in cases:
+            result, elapsed, peak = measure(function, sheet)
+            size_mib = result.memory_usage(deep=True).sum() / 2 ** 20
+            print(f'{name:>12}: {elapsed:7.2f} s, peak {peak / 2 ** 20:7.1f} MiB, result {size_mib:6.1f} MiB')
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'ratings.csv')
+            sheet.to_csv(path, index=False)
+            result, elapsed, peak = measure(read_ratings, path)
+            print(f'{"csv stream":>12}: {elapsed:7.2f} s, peak {peak / 2 ** 20:7.1f} MiB, {len(result)} ratings')
+
+
+def generate_ratings(users, movies=5000, per_user=PAIRS, groups=1, seed=0):
+    """
+    Generates long ratings with a few popular movies and many rarely rated ones.
+
+    With several groups, every group of users has its own popular movies and its own taste
+    (a random score of every movie the ratings are drawn around), so users of a group are
+    similar. With one group the ratings are uniformly random.
+
+    Parameters:
+    users (int): The number of users.
+    movies (int): The number of different movies.
+    per_user (int): The number of ratings drawn for every user (repeated movies are dropped).
+    groups (int): The number of groups of users with similar tastes.
+    seed (int): The seed of the random generator.
+
+    Returns:
+    pandas.DataFrame: A DataFrame with columns ['Osoba', 'Nazwa', 'Ocena'].
+    """
+    rng = np.random.default_rng(seed)
+    rank = np.minimum(rng.zipf(1.3, (users, per_user)), movies) - 1
+    if groups > 1:
+        group = rng.integers(0, groups, users)[:, None]
+        popular = np.array([rng.permutation(movies) for _ in range(groups)])
+        taste = rng.normal(0, 2, (groups, movies))
+        movie = popular[group, rank]
+        rating = np.clip(np.rint(5.5 + taste[group, movie] + rng.normal(0, 1, movie.shape)), 1, 10)
+    else:
+        movie = rank
+        rating = rng.integers(1, 11, movie.shape).astype(float)
+    ratings = pd.DataFrame({
+        'Osoba': np.repeat([f'Osoba {i}' for i in range(users)], per_user),
+        'Nazwa': [f'Film {i}' for i in movie.ravel()],
+        'Ocena': rating.ravel(),
+    })
+    return ratings.drop_duplicates(['Osoba', 'Nazwa'], ignore_index=True)
+
+
+def recommend_knnbasic(model, ratings, user):
+    """
+    The recommendations of get_movie_recommendations before SparseKNNBasic: one predict() call per movie not rated by the user.
+
+    Parameters:
+    model (surprise.KNNBasic): The trained model.
+    ratings (pandas.DataFrame): The ratings.
+    user (str): The user.
+
+    Returns:
+    dict: The estimate of every movie not rated by the user.
+    """
+    rated_movies = set(ratings[ratings['Osoba'] == user]['Nazwa'])
+    return {movie: model.predict(user, movie).est for movie in ratings['Nazwa'].unique() if movie not in rated_movies}
+
+
+def recommend_sparse(model, ratings, user):
+    """
+    The recommendations of get_movie_recommendations: all movies not rated by the user scored at once.
+
+    Parameters:
+    model (SparseKNNBasic): The trained model.
+    ratings (pandas.DataFrame): The ratings.
+    user (str): The user.
+
+    Returns:
+    dict: The estimate of every movie not rated by the user.
+    """
+    rated_movies = set(ratings[ratings['Osoba'] == user]['Nazwa'])
+    candidates = [movie for movie in ratings['Nazwa'].unique() if movie not in rated_movies]
+    return dict(zip(*model.predict_items(user, candidates)))
+
+
+def benchmark_knn(sizes, movies, per_user, queries, skip_knnbasic):
+    """
+    Compares KNNBasic with a predict() loop with SparseKNNBasic: fitting, recommendations for a few users and memory.
+
+    Parameters:
+    sizes (list of int): The numbers of users to measure.
+    movies (int): The number of different movies.
+    per_user (int): The number of ratings drawn for every user.
+    queries (int): The number of users to recommend movies for.
+    skip_knnbasic (bool): Whether to skip KNNBasic, whose similarity matrix is n_users x n_users.
+    """
+    for size in sizes:
+        ratings = generate_ratings(size, movies, per_user)
+        trainset = Dataset.load_from_df(ratings, Reader(rating_scale=(1, 10))).build_full_trainset()
+        print(f'{trainset.n_users} users, {trainset.n_items} movies, {trainset.n_ratings} ratings:')
+        users = ratings['Osoba'].unique()[:queries]
+        cases = [('sparse', SparseKNNBasic, recommend_sparse)]
+        if not skip_knnbasic:
+            cases.insert(0, ('knnbasic', KNNBasic, recommend_knnbasic))
+        results = {}
+        for name, algorithm, recommend in cases:
+            model = algorithm(sim_options={'name': 'pearson', 'user_based': True})
+            _, fit_time, fit_peak = measure(model.fit, trainset)
+            start = time.perf_counter()
+            results[name] = [recommend(model, ratings, user) for user in users]
+            per_user_ms = (time.perf_counter() - start) / len(users) * 1000
+            print(f'{name:>12}: fit {fit_time:7.2f} s, peak {fit_peak / 2 ** 20:7.1f} MiB, '
+                  f'recommendations {per_user_ms:8.1f} ms per user')
+        if len(results) == 2:
+            difference = max(abs(a[movie] - b[movie]) for a, b in zip(*results.values()) for movie in a)
+            print(f'{"difference":>12}: {difference:.1e}')
+
+
+def neighbour_recall(found, similarities, k):
+    """
+    Computes the recall of found neighbours against the exact k nearest neighbours.
+
+    Users with the same similarity as the k-th nearest neighbour count as exact neighbours too,
+    so any of the tied users can be found.
+
+    Parameters:
+    found (numpy.ndarray): The inner ids of the found neighbours, at most k.
+    similarities (numpy.ndarray): The exact similarity to every user, without the user itself.
+    k (int): The number of neighbours.
+
+    Returns:
+    float: The fraction of the exact neighbours that were found, NaN if the user has no neighbours.
+    """
+    positive = np.sort(similarities[similarities > 0])[::-1][:k]
+    if len(positive) == 0:
+        return np.nan
+    return np.count_nonzero(similarities[found] >= positive[-1]) / len(positive)
+
+
+def benchmark_ann(sizes, movies, per_user, groups, queries, k, neighbours, components, tables, bits, multiprobe, exact):
+    """
+    Compares the LSH neighbours of ANNKNNBasic with the exact KNNBasic neighbours: recall and latency.
+
+    Parameters:
+    sizes (list of int): The numbers of users to measure.
+    movies (int): The number of different movies.
+    per_user (int): The number of ratings drawn for every user.
+    groups (int): The number of groups of users with similar tastes.
+    queries (int): The number of users to find the neighbours of.
+    k (int): The number of neighbours the recall is measured for, and of an estimate.
+    neighbours (int): The number of neighbours found for a user by ANNKNNBasic.
+    components (int): The number of dimensions of the SVD embedding, 0 to hash the user vectors themselves.
+    tables (list of int): The numbers of hash tables to measure.
+    bits (list of int): The numbers of bits of a hash to measure.
+    multiprobe (bool): Whether to look up the buckets at a Hamming distance of 1 too.
+    exact (str): 'knnbasic' to take the exact similarities from the KNNBasic similarity matrix,
+    'sparse' to compute them with SparseKNNBasic (the same values, without the n_users x n_users matrix).
+    """
+    sim_options = {'name': 'pearson', 'user_based': True}
+    for size in sizes:
+        ratings = generate_ratings(size, movies, per_user, groups)
+        trainset = Dataset.load_from_df(ratings, Reader(rating_scale=(1, 10))).build_full_trainset()
+        print(f'{trainset.n_users} users, {trainset.n_items} movies, {trainset.n_ratings} ratings:')
+        users = np.random.default_rng(1).choice(trainset.n_users, min(queries, trainset.n_users), replace=False)
+
+        sparse = SparseKNNBasic(k, sim_options=sim_options).fit(trainset)
+        start = time.perf_counter()
+        exact_estimates = {user: sparse.estimate_all(user) for user in users}
+        exact_ms = (time.perf_counter() - start) / len(users) * 1000
+        if exact == 'knnbasic':
+            model = KNNBasic(k, sim_options=sim_options, verbose=False)
+            fit_time = measure(model.fit, trainset)[1]
+            exact_similarities = {user: model.sim[user].copy() for user in users}
+            print(f'{"exact":>16}: KNNBasic fit {fit_time:.2f} s, SparseKNNBasic estimates {exact_ms:.2f} ms per user')
+        else:
+            exact_similarities = {user: sparse.similarity_rows(user)[0] for user in users}
+            print(f'{"exact":>16}: SparseKNNBasic estimates {exact_ms:.2f} ms per user')
+        for user, similarities in exact_similarities.items():
+            similarities[user] = 0
+
+        for n_tables in tables:
+            for n_bits in bits:
+                model = ANNKNNBasic(k, sim_options=sim_options, n_neighbours=neighbours, n_components=components,
+                                    n_tables=n_tables, n_bits=n_bits, multiprobe=multiprobe)
+                build_time = measure(model.fit, trainset)[1]
+                start = time.perf_counter()
+                found = {user: model.neighbours(user)[0] for user in users}
+                query_ms = (time.perf_counter() - start) / len(users) * 1000
+                start = time.perf_counter()
+                estimates = {user: model.estimate_all(user) for user in users}
+                estimate_ms = (time.perf_counter() - start) / len(users) * 1000
+                candidates = np.mean([len(model.index.query(model.vectors[user:user + 1])) for user in users])
+                recall = np.nanmean([neighbour_recall(found[user][:k], exact_similarities[user], k) for user in users])
+                errors = np.concatenate([estimates[user] - exact_estimates[user] for user in users])
+                rmse = np.sqrt(np.nanmean(errors ** 2))
+                print(f'{f"{n_tables} x {n_bits} bits":>16}: build {build_time:5.2f} s, {candidates:6.0f} candidates, '
+                      f'recall@{k} {recall:.3f}, neighbours {query_ms:5.2f} ms, estimates {estimate_ms:5.2f} ms per user, '
+                      f'RMSE vs exact {rmse:.3f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Movie recommendation engine benchmarks.')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    process_parser = subparsers.add_parser('process-data', help='iterrows vs vectorised reshaping of the ratings sheet')
+    process_parser.add_argument('--ratings', type=int, nargs='+', default=[100000, 1000000])
+    process_parser.add_argument('--skip-iterrows', action='store_true')
+
+    knn_parser = subparsers.add_parser('knn', help='KNNBasic predict() loop vs SparseKNNBasic')
+    knn_parser.add_argument('--users', type=int, nargs='+', default=[1000, 5000])
+    knn_parser.add_argument('--movies', type=int, default=5000)
+    knn_parser.add_argument('--per-user', type=int, default=PAIRS)
+    knn_parser.add_argument('--queries', type=int, default=10, help='number of users to recommend movies for')
+    knn_parser.add_argument('--skip-knnbasic', action='store_true')
+
+    ann_parser = subparsers.add_parser('ann', help='recall and latency of the LSH neighbours vs the exact KNNBasic neighbours')
+    ann_parser.add_argument('--users', type=int, nargs='+', default=[2000])
+    ann_parser.add_argument('--movies', type=int, default=5000)
+    ann_parser.add_argument('--per-user', type=int, default=PAIRS)
+    ann_parser.add_argument('--groups', type=int, default=20, help='number of groups of users with similar tastes')
+    ann_parser.add_argument('--queries', type=int, default=200, help='number of users to find the neighbours of')
+    ann_parser.add_argument('--k', type=int, default=40, help='number of neighbours of the recall and of an estimate')
+    ann_parser.add_argument('--neighbours', type=int, default=200, help='number of neighbours found for a user')
+    ann_parser.add_argument('--components', type=int, default=32, help='dimensions of the SVD embedding, 0 for none')
+    ann_parser.add_argument('--tables', type=int, nargs='+', default=[8, 16])
+    ann_parser.add_argument('--bits', type=int, nargs='+', default=[6, 8, 10])
+    ann_parser.add_argument('--multiprobe', action='store_true', help='look up the buckets at a Hamming distance of 1 too')
+    ann_parser.add_argument('--exact', choices=['knnbasic', 'sparse'], default='knnbasic',
+                            help='where the exact similarities come from (sparse for many users)')
+
+    args = parser.parse_args()
+    if args.benchmark == 'process-data':
+        benchmark_process_data(args.ratings, args.skip_iterrows)
+    elif args.benchmark == 'knn':
+        benchmark_knn(args.users, args.movies, args.per_user, args.queries, args.skip_knnbasic)
+    elif args.benchmark == 'ann':
+        benchmark_ann(args.users, args.movies, args.per_user, args.groups, args.queries, args.k, args.neighbours,
+                      args.components, args.tables, args.bits, args.multiprobe, args.exact)
@@ -1,62 +1,375 @@
+"""
+The program replaces the movie names typed in by the users with their official titles.
+
+The titles are fetched from the imdbot API by a pool of threads sharing one HTTP session,
+with timeouts and retries with backoff. Every unique name is asked about once, and the
+results (including names without a title) are kept in an SQLite cache file keyed by
+the normalised movie name, so a rerun only asks the API about new names.
+
+
+How to run
+---
+Run the program with the following command `python3 data_cleaner.py`
+It reads data.xlsx and writes parsed_data.xlsx row by row (.csv and .parquet inputs and .csv outputs are supported too).
+Run `python3 data_cleaner.py --help` to see all options, e.g. `--base-url` to use another (e.g. local) API server.
+
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+import argparse
+import csv
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openpyxl
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+from ingestion import iter_rows
 
-def fetch_movie_title(movie_name):
+
+API_URL = 'https://search.imdbot.workers.dev/'
+CACHE_FILE = 'titles_cache.sqlite'
+MAX_WORKERS = 8
+# Connect and read timeouts in seconds.
+TIMEOUT = (3.05, 10)
+RETRIES = 3
+BACKOFF_FACTOR = 0.5
+# Rows of a sheet rewritten at once by process_file.
+CHUNK_ROWS = 10000
+
+
+def normalise_name(movie_name):
     """
-    Fetches the official movie title from an external API using the given movie name.
+    Normalises a movie name typed in by a user, so that the same movie typed differently shares a cache entry.
+
+    Parameters:
+    movie_name (str): The movie name.
+
+    Returns:
+    str: The name in lower case, with the whitespace collapsed.
+    """
+    return ' '.join(movie_name.split()).casefold()
+
+
+def create_session(max_workers=MAX_WORKERS, retries=RETRIES, backoff_factor=BACKOFF_FACTOR):
+    """
+    Creates an HTTP session with a connection pool for the worker threads and retries with backoff.
+
+    Parameters:
+    max_workers (int): The number of threads using the session at once.
+    retries (int): The number of retries of failed connections and of 429 and 5xx responses.
+    backoff_factor (float): The base of the exponential delay between retries in seconds.
+
+    Returns:
+    requests.Session: The session.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=('GET',),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class TitleCache:
+    """
+    Persistent cache of the official titles, keyed by the normalised movie name.
+    """
+
+    def __init__(self, path=CACHE_FILE):
+        """
+        Opens (or creates) the cache file.
+
+        Parameters:
+        path (str): The path to the SQLite file.
+        """
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS titles (name TEXT PRIMARY KEY, title TEXT, fetched_at REAL NOT NULL)'
+        )
+
+    def get_many(self, names):
+        """
+        Reads the cached titles of the given normalised names.
+
+        Parameters:
+        names (iterable of str): The normalised movie names.
+
+        Returns:
+        dict: The title of every cached name.
+        """
+        names = list(names)
+        titles = {}
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.connection.execute(f'SELECT name, title FROM titles WHERE name IN ({placeholders})', chunk)
+            titles.update(rows)
+        return titles
+
+    def put_many(self, titles):
+        """
+        Stores the titles of normalised names.
+
+        Parameters:
+        titles (dict): The title of every normalised movie name.
+        """
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO titles (name, title, fetched_at) VALUES (?, ?, ?)',
+                [(name, title, now) for name, title in titles.items()],
+            )
+
+    def close(self):
+        self.connection.close()
+
+
+def request_movie_title(movie_name, session=None, base_url=API_URL, timeout=TIMEOUT):
+    """
+    Requests the official movie title from an external API using the given movie name.
 
     Parameters:
     movie_name (str): The name of the movie for which the official title is to be fetched.
+    session (requests.Session): The session to send the request with, a new connection if not given.
+    base_url (str): The URL of the API.
+    timeout (tuple): The connect and read timeouts in seconds.
 
     Returns:
-    str: The official title of the movie if found.
+    str: The official title of the movie.
 
     Raises:
     ValueError: If the '#TITLE' data is not found for the given movie name.
     Requests.RequestException: If there is an error while making the API request.
     """
+    response = (session or requests).get(base_url, params={'q': movie_name}, timeout=timeout)
+    response.raise_for_status()
+    data = response.json()
+    if data.get('description') and '#TITLE' in data['description'][0]:
+        return data['description'][0]['#TITLE']
+    else:
+        raise ValueError(f"Brak danych '#TITLE' dla filmu: {movie_name}")
+
+
+def fetch_movie_title(movie_name, session=None, base_url=API_URL, timeout=TIMEOUT):
+    """
+    Fetches the official movie title from an external API using the given movie name.
+
+    Parameters:
+    movie_name (str): The name of the movie for which the official title is to be fetched.
+    session (requests.Session): The session to send the request with, a new connection if not given.
+    base_url (str): The URL of the API.
+    timeout (tuple): The connect and read timeouts in seconds.
+
+    Returns:
+    str: The official title of the movie if found, otherwise None (the error is printed).
+    """
     try:
-        response = requests.get('https://search.imdbot.workers.dev/', params={'q': movie_name})
-        response.raise_for_status()
-        data = response.json()
-        if '#TITLE' in data['description'][0]:
-            return data['description'][0]['#TITLE']
-        else:
-            raise ValueError(f"Brak danych '#TITLE' dla filmu: {movie_name}")
+        return request_movie_title(movie_name, session, base_url, timeout)
+    except requests.RequestException as e:
+        print(f"Błąd podczas zapytania do API dla filmu '{movie_name}': {e}")
+    except ValueError as e:
+        print(e)
+
+
+def _lookup_title(movie_name, session, base_url):
+    """
+    Looks up the official title of a movie name in a worker thread.
+
+    Parameters:
+    movie_name (str): The movie name.
+    session (requests.Session): The session to send the request with.
+    base_url (str): The URL of the API.
+
+    Returns:
+    tuple: The title (None if not found) and whether the result is final and can be cached.
+    API errors are not final, so the name is asked about again on the next run.
+    """
+    try:
+        return request_movie_title(movie_name, session, base_url), True
     except requests.RequestException as e:
         print(f"Błąd podczas zapytania do API dla filmu '{movie_name}': {e}")
+        return None, False
     except ValueError as e:
         print(e)
+        return None, True
+
 
+def resolve_titles(movie_names, cache, session, base_url=API_URL, max_workers=MAX_WORKERS):
+    """
+    Resolves the official titles of movie names, asking the API only about names missing from the cache.
+
+    Every normalised name is asked about at most once. Names the API has no title for
+    are cached too (with a NULL title), so they are not asked about again.
+
+    Parameters:
+    movie_names (iterable of str): The movie names.
+    cache (TitleCache): The cache of the titles.
+    session (requests.Session): The session to send the requests with.
+    base_url (str): The URL of the API.
+    max_workers (int): The largest number of requests sent at once.
 
-def process_dataframe(df):
+    Returns:
+    dict: The official title of every movie name that was found.
+    """
+    keys = {name: normalise_name(name) for name in movie_names}
+    cached = cache.get_many(set(keys.values()))
+    missing = {}
+    for name, key in keys.items():
+        if key not in cached:
+            missing.setdefault(key, name)
+
+    if missing:
+        with ThreadPoolExecutor(max_workers) as executor:
+            results = executor.map(lambda name: _lookup_title(name, session, base_url), missing.values())
+            fetched = {key: title for key, (title, final) in zip(missing, results) if final}
+        cache.put_many(fetched)
+        cached.update(fetched)
+
+    return {name: cached[key] for name, key in keys.items() if cached.get(key)}
+
+
+def resolve_all_titles(movie_names, cache_path=CACHE_FILE, base_url=API_URL, max_workers=MAX_WORKERS):
+    """
+    Opens the cache and an HTTP session and resolves the official titles of movie names.
+
+    Parameters:
+    movie_names (iterable of str): The unique movie names.
+    cache_path (str): The path to the SQLite cache of the titles.
+    base_url (str): The URL of the API.
+    max_workers (int): The largest number of requests sent at once.
+
+    Returns:
+    dict: The official title of every movie name that was found.
+    """
+    cache = TitleCache(cache_path)
+    session = create_session(max_workers)
+    try:
+        return resolve_titles(movie_names, cache, session, base_url, max_workers)
+    finally:
+        session.close()
+        cache.close()
+
+
+def process_dataframe(df, cache_path=CACHE_FILE, base_url=API_URL, max_workers=MAX_WORKERS, titles=None):
     """
     Processes a DataFrame by updating movie names with their official titles.
 
-    The function iterates through each column in the DataFrame that starts with 'Nazwa'.
-    For each movie name, it fetches the official title and updates the DataFrame accordingly.
+    The unique movie names of all columns starting with 'Nazwa' are collected in one pass
+    and resolved once each, then every column is rewritten with a single vectorised mapping.
+    Names without a title are left unchanged.
 
     Parameters:
     df (pandas.DataFrame): The DataFrame containing movie names that need to be updated.
+    cache_path (str): The path to the SQLite cache of the titles.
+    base_url (str): The URL of the API.
+    max_workers (int): The largest number of requests sent at once.
+    titles (dict): The official titles of the movie names, if they are already resolved (see process_file).
 
     Note:
     The function mutates the original DataFrame by replacing movie names with their official titles.
     """
-    processed_titles = {}
-    for column in df.columns:
-        if column.startswith('Nazwa'):
-            for idx, value in enumerate(df[column]):
-                if isinstance(value, str) and value not in processed_titles:
-                    title = fetch_movie_title(value)
-                    if title:
-                        processed_titles[value] = title
-                        df.at[idx, column] = title
-                elif value in processed_titles:
-                    df.at[idx, column] = processed_titles[value]
+    columns = [column for column in df.columns if column.startswith('Nazwa')]
+    if not columns:
+        return
+    if titles is None:
+        names = [name for name in pd.unique(df[columns].to_numpy().ravel()) if isinstance(name, str)]
+        titles = resolve_all_titles(names, cache_path, base_url, max_workers)
+
+    for column in columns:
+        mapped = df[column].map(titles)
+        found = mapped.notna()
+        df.loc[found, column] = mapped[found]
+
+
+def process_file(input_path, output_path, cache_path=CACHE_FILE, base_url=API_URL, max_workers=MAX_WORKERS,
+                 chunk_rows=CHUNK_ROWS):
+    """
+    Copies a ratings sheet, replacing movie names with their official titles, without loading it into memory.
+
+    The input is read twice row by row: first to collect the unique movie names, then to write
+    the rows with the titles, rewritten chunk by chunk with process_dataframe. Only the names,
+    their titles and a chunk of rows are kept in memory.
+
+    Parameters:
+    input_path (str): The path to the .xlsx, .csv or .parquet input file.
+    output_path (str): The path to the .xlsx or .csv output file.
+    cache_path (str): The path to the SQLite cache of the titles.
+    base_url (str): The URL of the API.
+    max_workers (int): The largest number of requests sent at once.
+    chunk_rows (int): The number of rows rewritten at once.
+
+    Returns:
+    int: The number of rows written, without the header.
+
+    Raises:
+    ValueError: If the output file format is not supported.
+    """
+    extension = os.path.splitext(output_path)[1].lower()
+    if extension not in ('.xlsx', '.csv'):
+        raise ValueError(f"Nieobsługiwany format pliku: {output_path}")
+
+    rows = iter_rows(input_path)
+    header = next(rows, [])
+    positions = [i for i, name in enumerate(header) if name.startswith('Nazwa')]
+    names = {row[i] for row in rows for i in positions if isinstance(row[i], str) and row[i].strip()}
+    titles = resolve_all_titles(names, cache_path, base_url, max_workers)
+
+    if extension == '.xlsx':
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        write_row = sheet.append
+    else:
+        file = open(output_path, 'w', newline='', encoding='utf-8')
+        write_row = csv.writer(file).writerow
+
+    def write_chunk(chunk):
+        # Object columns keep the values of the cells as they are (e.g. int ratings, empty cells as None).
+        df = pd.DataFrame(chunk, columns=header, dtype=object)
+        process_dataframe(df, titles=titles)
+        for row in df.itertuples(index=False, name=None):
+            write_row(row)
+        return len(chunk)
+
+    count = 0
+    try:
+        rows = iter_rows(input_path)
+        write_row(next(rows, []))
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunk_rows:
+                count += write_chunk(chunk)
+                chunk = []
+        if chunk:
+            count += write_chunk(chunk)
+    finally:
+        if extension == '.xlsx':
+            workbook.save(output_path)
+        else:
+            file.close()
+    return count
 
 
 if __name__ == '__main__':
-    df = pd.read_excel('data.xlsx')
-    process_dataframe(df)
-    df.to_excel('parsed_data.xlsx')
+    parser = argparse.ArgumentParser(description='Replace the movie names with their official titles.')
+    parser.add_argument('--input', default='data.xlsx')
+    parser.add_argument('--output', default='parsed_data.xlsx')
+    parser.add_argument('--base-url', default=API_URL, help='URL of the title search API')
+    parser.add_argument('--cache', default=CACHE_FILE, help='path to the SQLite cache of the titles')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help='largest number of requests sent at once')
+    args = parser.parse_args()
+
+    process_file(args.input, args.output, args.cache, args.base_url, args.workers)
@@ -0,0 +1,350 @@
+"""
+Streaming reading of the ratings spreadsheets.
+
+A ratings sheet has one row per user: the 'Osoba' column followed by pairs of 'Nazwa' (movie)
+and 'Ocena' (rating) columns. The sheet is read row by row (Excel files in openpyxl
+read-only mode, CSV files with the csv module, Parquet files in batches with pyarrow),
+so it never has to fit in memory as a whole, and is turned into normalised
+(Osoba, Nazwa, Ocena) records: one by one, in Arrow record batches, or as a long
+DataFrame reshaped with vectorised operations chunk by chunk (see read_ratings).
+
+Supported formats: .xlsx/.xlsm, .csv, .parquet (requires pyarrow).
+
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+import csv
+import math
+import os
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+
+USER_COLUMN = 'Osoba'
+MOVIE_COLUMN = 'Nazwa'
+RATING_COLUMN = 'Ocena'
+RECORD_COLUMNS = [USER_COLUMN, MOVIE_COLUMN, RATING_COLUMN]
+# Ratings are small numbers (1-10), float32 keeps them compact and still allows fractions.
+RATING_DTYPE = np.float32
+# The smallest and the largest rating; 0 is a rating, not a missing value.
+RATING_SCALE = (0, 10)
+
+
+def dedupe_header(header):
+    """
+    Makes the column names unique the way pandas does: the repeated 'Nazwa' columns become 'Nazwa.1', 'Nazwa.2', ...
+
+    Parameters:
+    header (iterable): The column names of the sheet.
+
+    Returns:
+    list of str: The unique column names.
+    """
+    counts = {}
+    names = []
+    for name in header:
+        name = '' if name is None else str(name)
+        if name in counts:
+            counts[name] += 1
+            names.append(f'{name}.{counts[name]}')
+        else:
+            counts[name] = 0
+            names.append(name)
+    return names
+
+
+def iter_rows(filename, batch_size=10000):
+    """
+    Reads the rows of a ratings sheet one by one.
+
+    Parameters:
+    filename (str): The path to the .xlsx, .csv or .parquet file.
+    batch_size (int): The number of rows read at once from a Parquet file.
+
+    Yields:
+    list or tuple: The unique column names (see dedupe_header) first, then the values of every row,
+    as many as there are columns (see fit_rows).
+
+    Raises:
+    FileNotFoundError: If the specified file does not exist.
+    ValueError: If the file format is not supported or a row has a value outside of the columns.
+    """
+    if not os.path.isfile(filename):
+        raise FileNotFoundError(f"Nie znaleziono pliku: {filename}")
+    extension = os.path.splitext(filename)[1].lower()
+
+    if extension in ('.xlsx', '.xlsm'):
+        workbook = openpyxl.load_workbook(filename, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            yield dedupe_header(header)
+            yield from fit_rows(rows, len(header))
+        finally:
+            workbook.close()
+    elif extension == '.csv':
+        with open(filename, newline='', encoding='utf-8') as file:
+            rows = csv.reader(file)
+            header = next(rows, None)
+            if header is None:
+                return
+            yield dedupe_header(header)
+            yield from fit_rows(rows, len(header))
+    elif extension == '.parquet':
+        import pyarrow.parquet as pq
+
+        with pq.ParquetFile(filename) as file:
+            yield dedupe_header(file.schema_arrow.names)
+            for batch in file.iter_batches(batch_size=batch_size):
+                yield from zip(*(column.to_pylist() for column in batch.columns))
+    else:
+        raise ValueError(f"Nieobsługiwany format pliku: {filename}")
+
+
+def fit_rows(rows, width):
+    """
+    Makes the rows of a sheet as long as its header, as pandas does: short rows are padded with empty cells.
+
+    Empty cells past the header (e.g. a trailing separator in a CSV file) are dropped.
+
+    Parameters:
+    rows (iterable of list or tuple): The values of the rows, without the header.
+    width (int): The number of columns of the header.
+
+    Yields:
+    list or tuple: The values of every row, exactly width of them.
+
+    Raises:
+    ValueError: If a row has a value past the header.
+    """
+    for row_number, row in enumerate(rows, start=2):
+        if len(row) < width:
+            row = list(row) + [None] * (width - len(row))
+        elif len(row) > width:
+            if not all(_is_missing(value) for value in row[width:]):
+                raise ValueError(f"Wiersz {row_number} ma więcej wartości niż kolumn w nagłówku ({width})")
+            row = row[:width]
+        yield row
+
+
+def rating_pairs(header):
+    """
+    Finds the positions of the user column and of the movie and rating column pairs.
+
+    Parameters:
+    header (list of str): The unique column names of the sheet.
+
+    Returns:
+    tuple: The position of the user column and a list of (movie, rating) column positions.
+
+    Raises:
+    ValueError: If the sheet has no user column.
+    """
+    if USER_COLUMN not in header:
+        raise ValueError(f"Brak kolumny '{USER_COLUMN}' w arkuszu")
+    movies = [i for i, name in enumerate(header) if name.split('.')[0] == MOVIE_COLUMN]
+    ratings = [i for i, name in enumerate(header) if name.split('.')[0] == RATING_COLUMN]
+    return header.index(USER_COLUMN), list(zip(movies, ratings))
+
+
+def parse_rating(value):
+    """
+    Reads a rating of a sheet or of a request; the same rule holds for both.
+
+    Parameters:
+    value (str, int or float): The rating.
+
+    Returns:
+    float: The rating.
+
+    Raises:
+    ValueError: If the rating is not a number in RATING_SCALE.
+    """
+    low, high = RATING_SCALE
+    try:
+        if isinstance(value, bool):
+            raise ValueError
+        rating = float(value)
+    except (ValueError, TypeError):
+        rating = math.nan
+    if not low <= rating <= high:
+        raise ValueError(f"Ocena musi być liczbą z przedziału {low}-{high}: {value}")
+    return rating
+
+
+def _is_missing(value):
+    """
+    Checks if a cell is empty: None, an empty string or NaN.
+
+    Parameters:
+    value: The value of the cell.
+
+    Returns:
+    bool: True if the cell is empty.
+    """
+    if value is None:
+        return True
+    if isinstance(value, str):
+        return not value.strip()
+    return isinstance(value, float) and math.isnan(value)
+
+
+def iter_ratings(filename):
+    """
+    Reads a ratings sheet as normalised (Osoba, Nazwa, Ocena) records.
+
+    Pairs with an empty movie name or rating are skipped. A rating of 0 is a rating, not a missing value.
+
+    Parameters:
+    filename (str): The path to the .xlsx, .csv or .parquet file.
+
+    Yields:
+    tuple: The user (str), the movie (str) and the rating (float).
+
+    Raises:
+    FileNotFoundError: If the specified file does not exist.
+    ValueError: If the file format is not supported, the sheet has no user column or a rating is not valid
+    (see parse_rating).
+    """
+    rows = iter_rows(filename)
+    header = next(rows, None)
+    if header is None:
+        return
+    user_position, pairs = rating_pairs(header)
+    for row_number, row in enumerate(rows, start=2):
+        if _is_missing(row[user_position]):
+            continue
+        user = str(row[user_position]).strip()
+        for movie_position, rating_position in pairs:
+            movie, rating = row[movie_position], row[rating_position]
+            if _is_missing(movie) or _is_missing(rating):
+                continue
+            try:
+                rating = parse_rating(rating)
+            except ValueError as e:
+                raise ValueError(f"{e} (wiersz {row_number})")
+            yield user, str(movie).strip(), rating
+
+
+def iter_rating_batches(filename, batch_size=65536):
+    """
+    Reads a ratings sheet as Arrow record batches of normalised (Osoba, Nazwa, Ocena) records.
+
+    Parameters:
+    filename (str): The path to the .xlsx, .csv or .parquet file.
+    batch_size (int): The number of records in a batch.
+
+    Yields:
+    pyarrow.RecordBatch: A batch with the string columns Osoba and Nazwa and the float32 column Ocena.
+
+    Raises:
+    FileNotFoundError: If the specified file does not exist.
+    ValueError: If the file format is not supported, the sheet has no user column or a rating is not a number.
+    """
+    import pyarrow as pa
+
+    schema = pa.schema([(USER_COLUMN, pa.string()), (MOVIE_COLUMN, pa.string()), (RATING_COLUMN, pa.float32())])
+    columns = ([], [], [])
+    for record in iter_ratings(filename):
+        for column, value in zip(columns, record):
+            column.append(value)
+        if len(columns[0]) == batch_size:
+            yield pa.record_batch(list(columns), schema=schema)
+            columns = ([], [], [])
+    if columns[0]:
+        yield pa.record_batch(list(columns), schema=schema)
+
+
+def reshape_ratings(wide):
+    """
+    Reshapes a chunk of a ratings sheet from one row per user to one row per rating, without a Python loop over the rows.
+
+    The movie and rating column pairs are stacked row by row, so the records come in the order of the sheet.
+    Pairs with an empty movie name or rating are dropped. A rating of 0 is kept.
+
+    Parameters:
+    wide (pandas.DataFrame): Rows of the sheet, with the unique column names (see dedupe_header).
+
+    Returns:
+    pandas.DataFrame: A DataFrame with the string columns Osoba and Nazwa and the float column Ocena.
+
+    Raises:
+    ValueError: If the sheet has no user column or a rating is not a number in RATING_SCALE.
+    """
+    user_position, pairs = rating_pairs(list(wide.columns))
+    movie_positions = [movie for movie, _ in pairs]
+    rating_positions = [rating for _, rating in pairs]
+
+    movies = wide.iloc[:, movie_positions].to_numpy(dtype=object).ravel()
+    try:
+        ratings = wide.iloc[:, rating_positions].apply(pd.to_numeric).to_numpy(dtype=float).ravel()
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Niepoprawna ocena w arkuszu: {e}")
+    users = np.repeat(wide.iloc[:, user_position].to_numpy(dtype=object), len(pairs))
+
+    movies = pd.Series(movies, dtype=object)
+    users = pd.Series(users, dtype=object)
+    movies = movies.where(movies.isna(), movies.astype(str).str.strip())
+    users = users.where(users.isna(), users.astype(str).str.strip())
+    keep = (movies.notna() & (movies != '') & users.notna() & (users != '') & ~np.isnan(ratings)).to_numpy()
+    low, high = RATING_SCALE
+    outside = keep & ~((ratings >= low) & (ratings <= high))
+    if outside.any():
+        raise ValueError(f"Ocena musi być liczbą z przedziału {low}-{high}: {ratings[outside][0]:g}")
+
+    return pd.DataFrame({
+        USER_COLUMN: users[keep].to_numpy(),
+        MOVIE_COLUMN: movies[keep].to_numpy(),
+        RATING_COLUMN: ratings[keep],
+    })
+
+
+def read_ratings(filename, chunk_rows=10000):
+    """
+    Reads a ratings sheet as a long DataFrame of (Osoba, Nazwa, Ocena) records.
+
+    The sheet is read row by row and reshaped in chunks of rows (see reshape_ratings), so only
+    the chunk and the long result are held in memory. Users and movies are stored as categories
+    and ratings as float32.
+
+    Parameters:
+    filename (str): The path to the .xlsx, .csv or .parquet file.
+    chunk_rows (int): The number of sheet rows reshaped at once.
+
+    Returns:
+    pandas.DataFrame: A DataFrame with the categorical columns Osoba and Nazwa and the float32 column Ocena.
+
+    Raises:
+    FileNotFoundError: If the specified file does not exist.
+    ValueError: If the file format is not supported, the sheet has no user column or a rating is not a number.
+    """
+    rows = iter_rows(filename)
+    header = next(rows, None)
+    chunks = []
+    if header is not None:
+        rating_pairs(header)
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunk_rows:
+                chunks.append(reshape_ratings(pd.DataFrame.from_records(chunk, columns=header)))
+                chunk = []
+        if chunk:
+            chunks.append(reshape_ratings(pd.DataFrame.from_records(chunk, columns=header)))
+
+    if not chunks:
+        return pd.DataFrame({
+            USER_COLUMN: pd.Categorical([]),
+            MOVIE_COLUMN: pd.Categorical([]),
+            RATING_COLUMN: np.array([], dtype=RATING_DTYPE),
+        })
+    return pd.DataFrame({
+        USER_COLUMN: pd.Categorical(np.concatenate([chunk[USER_COLUMN].to_numpy() for chunk in chunks])),
+        MOVIE_COLUMN: pd.Categorical(np.concatenate([chunk[MOVIE_COLUMN].to_numpy() for chunk in chunks])),
+        RATING_COLUMN: np.concatenate([chunk[RATING_COLUMN].to_numpy() for chunk in chunks]).astype(RATING_DTYPE),
+    })
@@ -0,0 +1,363 @@
+"""
+Trained recommendation models stored on disk, so they are fitted once and loaded at every start.
+
+An artifact is a directory of NumPy .npy files, loaded memory-mapped, and a meta.json file:
+- the arrays of the trained models (see SparseKNNBasic.state), shared by both metrics,
+- the user-user similarity matrices of the pearson and cosine metrics
+  (only up to MAX_DENSE_USERS users, otherwise the similarities are computed when needed),
+- the users and movies of the whole ratings sheet and the movies rated by every user,
+- the baseline statistics: the mean and the number of ratings of every user and movie.
+meta.json holds the format version, the SHA-256 of the ratings sheet the models were trained on,
+the parameters and the RMSE of the models on the test set. An artifact of another version or
+of a changed sheet is rebuilt by load_or_build.
+
+
+How to run
+---
+Build the artifact with the following command `python3 model_store.py build`
+(`--source` and `--artifact` give other paths, `--force` rebuilds a current artifact).
+Show the metadata of the artifact with `python3 model_store.py info`.
+
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+import argparse
+import copy
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from numpy.lib.format import open_memmap
+from surprise import Reader, Dataset
+from surprise.model_selection import train_test_split
+from surprise import accuracy
+
+from ingestion import RATING_SCALE, read_ratings
+from sparse_knn import SparseKNNBasic, STATE_ARRAYS
+
+
+SOURCE_FILE = 'parsed_data.xlsx'
+ARTIFACT_DIR = 'model_artifact'
+# Increase when the layout of the artifact changes, so old artifacts are rebuilt.
+ARTIFACT_VERSION = 2
+METRICS = ('pearson', 'cosine')
+TEST_SIZE = 0.2
+RANDOM_STATE = 42
+# Larger similarity matrices are not stored (10000 users take 800 MB).
+MAX_DENSE_USERS = 10000
+
+
+def file_hash(filename):
+    """
+    Computes the SHA-256 of a file, reading it in blocks.
+
+    Parameters:
+    filename (str): The path to the file.
+
+    Returns:
+    str: The hexadecimal digest.
+    """
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ModelArtifact:
+    """
+    Trained models and the ratings they were trained on, loaded from an artifact.
+
+    Attributes:
+    - metadata (dict): The contents of meta.json.
+    - models (dict): The SparseKNNBasic model of every metric.
+    - users (numpy.ndarray): The users of the ratings sheet.
+    - movies (numpy.ndarray): The movies of the ratings sheet, in the order of appearance.
+    - rated_starts, rated_movies (numpy.ndarray): The positions in movies of the movies rated by every user
+      are rated_movies[rated_starts[u]:rated_starts[u + 1]].
+    - user_means, user_counts, movie_means, movie_counts (numpy.ndarray): The baseline statistics of the trainset,
+      by inner id of the models.
+    """
+
+    def __init__(self, directory, mmap_mode='r'):
+        """
+        Loads an artifact.
+
+        Parameters:
+        directory (str): The path to the artifact.
+        mmap_mode (str): The memory-map mode of the arrays, None to read them into memory.
+
+        Raises:
+        FileNotFoundError: If the directory is not an artifact.
+        """
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as file:
+            self.metadata = json.load(file)
+
+        def array(name):
+            return np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+
+        state = {name: array(name) for name in STATE_ARRAYS}
+        self.models = {}
+        for metric in METRICS:
+            similarities = array(f'similarity_{metric}') if self.metadata['similarities'] else None
+            model = SparseKNNBasic(self.metadata['k'], self.metadata['min_k'], {'name': metric, 'user_based': True})
+            self.models[metric] = model.load_state(state, similarities)
+
+        self.users = array('all_users')
+        self.movies = array('all_movies')
+        self.rated_starts = array('rated_starts')
+        self.rated_movies = array('rated_movies')
+        self.user_positions = {user: u for u, user in enumerate(self.users.tolist())}
+        self.movie_positions = {movie: i for i, movie in enumerate(self.movies.tolist())}
+        for name in ('user_means', 'user_counts', 'movie_means', 'movie_counts'):
+            setattr(self, name, array(name))
+
+    def knows_user(self, user):
+        """
+        Checks if a user is in the ratings sheet.
+
+        Parameters:
+        user (str): The user.
+
+        Returns:
+        bool: True if the user rated any movie.
+        """
+        return user in self.user_positions
+
+    def unrated_movies(self, user):
+        """
+        Gives the movies of the ratings sheet not rated by a user.
+
+        Parameters:
+        user (str): The user.
+
+        Returns:
+        list of str: The movies, in the order of appearance in the sheet.
+        """
+        position = self.user_positions.get(user)
+        unrated = np.ones(len(self.movies), dtype=bool)
+        if position is not None:
+            unrated[self.rated_movies[self.rated_starts[position]:self.rated_starts[position + 1]]] = False
+        return self.movies[unrated].tolist()
+
+    def with_rating(self, user, movie, rating):
+        """
+        Creates a copy of the artifact with a rating added or changed; the artifact itself (and its files) is not changed.
+
+        The models get the rating (see SparseKNNBasic.with_rating) and the movie is marked as rated by the user.
+        The baseline statistics and the global mean (the estimate where an estimate is impossible) stay those
+        of the trainset the artifact was built from, so a rating does not change the estimates of every user.
+
+        Parameters:
+        user (str): The user, possibly a new one.
+        movie (str): The movie, possibly a new one.
+        rating (float): The rating.
+
+        Returns:
+        ModelArtifact: The new artifact.
+        """
+        artifact = copy.copy(self)
+        artifact.models = {metric: model.with_rating(user, movie, rating, model.global_mean)
+                           for metric, model in self.models.items()}
+        if movie not in self.movie_positions:
+            artifact.movies = np.append(self.movies, movie)
+            artifact.movie_positions = dict(self.movie_positions, **{movie: len(self.movies)})
+        if user not in self.user_positions:
+            artifact.users = np.append(self.users, user)
+            artifact.user_positions = dict(self.user_positions, **{user: len(self.users)})
+            artifact.rated_starts = np.append(self.rated_starts, self.rated_starts[-1])
+        position = artifact.user_positions[user]
+        movie_position = artifact.movie_positions[movie]
+        start, end = artifact.rated_starts[position], artifact.rated_starts[position + 1]
+        if movie_position not in artifact.rated_movies[start:end]:
+            artifact.rated_movies = np.insert(self.rated_movies, end, movie_position)
+            artifact.rated_starts = np.array(artifact.rated_starts)
+            artifact.rated_starts[position + 1:] += 1
+        return artifact
+
+
+def train_models(ratings, k=40, min_k=1, test_size=TEST_SIZE, random_state=RANDOM_STATE):
+    """
+    Trains the models of all metrics on a train split of the ratings and evaluates them on the test split.
+
+    Parameters:
+    ratings (pandas.DataFrame): A DataFrame with columns ['Osoba', 'Nazwa', 'Ocena'] (see process_data).
+    k (int): The largest number of neighbours of an estimate.
+    min_k (int): The smallest number of neighbours of an estimate.
+    test_size (float): The fraction of the ratings in the test split.
+    random_state (int): The seed of the split.
+
+    Returns:
+    tuple: The trained model of every metric (dict) and its RMSE on the test split (dict).
+    """
+    data = Dataset.load_from_df(ratings[['Osoba', 'Nazwa', 'Ocena']], Reader(rating_scale=RATING_SCALE))
+    trainset, testset = train_test_split(data, test_size=test_size, random_state=random_state)
+    models, rmse = {}, {}
+    for metric in METRICS:
+        models[metric] = SparseKNNBasic(k, min_k, {'name': metric, 'user_based': True}).fit(trainset)
+        rmse[metric] = accuracy.rmse(models[metric].test(testset), verbose=False)
+    return models, rmse
+
+
+def save_models(models, ratings, directory, metadata, block_size=256):
+    """
+    Saves trained models and the ratings sheet they were trained on as an artifact.
+
+    The artifact is written to a temporary directory next to the target and moved in place
+    at the end, so a reader never sees a half-written artifact.
+
+    Parameters:
+    models (dict): The SparseKNNBasic model of every metric, fitted on the same trainset.
+    ratings (pandas.DataFrame): The ratings the models were trained on.
+    directory (str): The path to the artifact.
+    metadata (dict): Information saved in meta.json, e.g. the hash of the ratings sheet.
+    block_size (int): The number of rows of a similarity matrix computed at once.
+    """
+    parent = os.path.dirname(os.path.abspath(directory))
+    temporary = tempfile.mkdtemp(prefix='.model-', dir=parent)
+    try:
+        def save(name, array):
+            np.save(os.path.join(temporary, f'{name}.npy'), array)
+
+        model = models[METRICS[0]]
+        for name, array in model.state().items():
+            save(name, array)
+
+        dense = model.n_users <= MAX_DENSE_USERS
+        if dense:
+            for metric in METRICS:
+                path = os.path.join(temporary, f'similarity_{metric}.npy')
+                matrix = open_memmap(path, mode='w+', dtype=float, shape=(model.n_users, model.n_users))
+                for start in range(0, model.n_users, block_size):
+                    users = np.arange(start, min(start + block_size, model.n_users))
+                    matrix[users] = models[metric].similarity_rows(users)
+                matrix.flush()
+                del matrix
+
+        users = ratings['Osoba'].astype(str)
+        movies = ratings['Nazwa'].astype(str)
+        user_codes, all_users = users.factorize()
+        movie_codes, all_movies = movies.factorize()
+        order = np.argsort(user_codes, kind='stable')
+        save('all_users', np.array(all_users.tolist()))
+        save('all_movies', np.array(all_movies.tolist()))
+        save('rated_starts', np.concatenate(([0], np.cumsum(np.bincount(user_codes, minlength=len(all_users))))))
+        save('rated_movies', movie_codes[order].astype(np.int64))
+
+        user_counts = np.diff(model.user_starts)
+        movie_counts = np.diff(model.item_starts)
+        save('user_counts', user_counts)
+        save('movie_counts', movie_counts)
+        save('user_means', np.asarray(model.ratings.sum(axis=1)).ravel() / np.maximum(user_counts, 1))
+        save('movie_means', np.asarray(model.item_ratings.sum(axis=1)).ravel() / np.maximum(movie_counts, 1))
+
+        metadata = dict(metadata, version=ARTIFACT_VERSION, k=model.k, min_k=model.min_k, similarities=dense,
+                        n_users=model.n_users, n_movies=model.n_items, n_ratings=len(model.entry_users),
+                        global_mean=model.global_mean, rating_scale=list(model.rating_scale))
+        with open(os.path.join(temporary, 'meta.json'), 'w', encoding='utf-8') as file:
+            json.dump(metadata, file, indent=2, ensure_ascii=False)
+
+        if os.path.isdir(directory):
+            old = tempfile.mkdtemp(prefix='.old-model-', dir=parent)
+            os.replace(directory, os.path.join(old, 'artifact'))
+            os.replace(temporary, directory)
+            shutil.rmtree(old)
+        else:
+            os.replace(temporary, directory)
+    except BaseException:
+        shutil.rmtree(temporary, ignore_errors=True)
+        raise
+
+
+def is_current(directory, source):
+    """
+    Checks if an artifact exists, has the current version and was built from the current ratings sheet.
+
+    Parameters:
+    directory (str): The path to the artifact.
+    source (str): The path to the ratings sheet.
+
+    Returns:
+    bool: True if the artifact can be used.
+    """
+    try:
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as file:
+            metadata = json.load(file)
+    except (OSError, ValueError):
+        return False
+    return metadata.get('version') == ARTIFACT_VERSION and metadata.get('source_sha256') == file_hash(source)
+
+
+def build(source=SOURCE_FILE, directory=ARTIFACT_DIR):
+    """
+    Reads the ratings sheet, trains the models and saves them as an artifact.
+
+    Parameters:
+    source (str): The path to the ratings sheet.
+    directory (str): The path to the artifact.
+
+    Returns:
+    dict: The metadata of the artifact.
+    """
+    source_hash = file_hash(source)
+    start = time.perf_counter()
+    ratings = read_ratings(source)
+    models, rmse = train_models(ratings)
+    save_models(models, ratings, directory, {
+        'source': os.path.basename(source),
+        'source_sha256': source_hash,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'test_size': TEST_SIZE,
+        'random_state': RANDOM_STATE,
+        'rmse': rmse,
+    })
+    print(f'Zbudowano modele w {time.perf_counter() - start:.2f} s: {directory}')
+    with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as file:
+        return json.load(file)
+
+
+def load_or_build(source=SOURCE_FILE, directory=ARTIFACT_DIR):
+    """
+    Loads the artifact, building it first if it is missing or out of date.
+
+    Parameters:
+    source (str): The path to the ratings sheet.
+    directory (str): The path to the artifact.
+
+    Returns:
+    ModelArtifact: The loaded artifact.
+
+    Raises:
+    FileNotFoundError: If the ratings sheet does not exist.
+    """
+    if not os.path.isfile(source):
+        raise FileNotFoundError(f"Nie znaleziono pliku: {source}")
+    if not is_current(directory, source):
+        build(source, directory)
+    return ModelArtifact(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build or inspect the artifact of the trained recommendation models.')
+    parser.add_argument('command', choices=['build', 'info'])
+    parser.add_argument('--source', default=SOURCE_FILE, help='path to the ratings sheet')
+    parser.add_argument('--artifact', default=ARTIFACT_DIR, help='path to the artifact directory')
+    parser.add_argument('--force', action='store_true', help='rebuild the artifact even if it is current')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        if args.force or not is_current(args.artifact, args.source):
+            build(args.source, args.artifact)
+        else:
+            print(f'Modele są aktualne: {args.artifact}')
+    else:
+        start = time.perf_counter()
+        artifact = ModelArtifact(args.artifact)
+        elapsed = time.perf_counter() - start
+        print(json.dumps(artifact.metadata, indent=2, ensure_ascii=False))
+        print(f'Aktualne: {is_current(args.artifact, args.source)}, wczytane w {elapsed * 1000:.1f} ms')
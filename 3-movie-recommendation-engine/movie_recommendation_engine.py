@@ -1,7 +1,8 @@
 """
 The program is a movie recommendation engine.
-It uses the Surprise library to train a recommendation model and provide movie recommendations for a specific user.
-The program reads from an Excel file, handles missing values, and transforms the data into a format where each row represents a user, a movie, and a rating.
+It loads the trained models with model_store.load_or_build: a ModelArtifact with a SparseKNNBasic model of every metric
+and the test RMSE of the models in its metadata. The artifact is built (the ratings are read from the Excel file,
+reshaped to one row per user, movie and rating, and the models trained) only if it is missing or the file has changed.
 It uses the Pearson and Cosine metrics to calculate the distance between users.
 The output is top 5 movie recommendations and 5 movies not recommended for a specific user.
 
@@ -14,6 +15,8 @@ Install the packages from the requirements.txt with the following command `pip3
 How to run
 ---
 Run the program with the following command `python3 movie_recommendation_engine.py`
+The models are trained once and stored in the model_artifact directory (see model_store.py);
+later runs load them, unless parsed_data.xlsx has changed (or `--rebuild` is given).
 You will be asked to provide a user for whom the recommendations are to be generated.
 Please type in user name exactly as it is in the Excel file.
 The program will print top 5 movie recommendations and 5 movies not recommended with both the Pearson and Cosine metrics.
@@ -22,82 +25,60 @@ The program will print top 5 movie recommendations and 5 movies not recommended
 Authors: Adam Łuszcz, Anna Rogala
 """
 
-import pandas as pd
-from surprise import Reader, Dataset
-from surprise.model_selection import train_test_split
-from surprise import KNNBasic
-from surprise import accuracy
+import argparse
+
+import numpy as np
 import requests
-import os
 
+from ingestion import read_ratings
+from model_store import ARTIFACT_DIR, SOURCE_FILE, build, load_or_build
 
-SOURCE_FILE = 'parsed_data.xlsx'
 
 def process_data(filename):
     """
-    Reads and processes an Excel file to format suitable for the Surprise library.
+    Reads and processes a ratings sheet to the format the models are trained on (see model_store.train_models).
 
-    The function reads from an Excel file, handles missing values, and transforms the data into a format where each row represents a user, a movie, and a rating.
+    The function reads the sheet row by row and reshapes it with vectorised operations (see ingestion.read_ratings), skips missing values, and transforms the data into a format where each row represents a user, a movie, and a rating.
+    A rating of 0 is kept as a rating.
 
     Parameters:
-    filename (str): The path to the Excel file containing user ratings.
+    filename (str): The path to the Excel (or CSV or Parquet) file containing user ratings.
 
     Returns:
     pandas.DataFrame: A DataFrame with columns ['Osoba', 'Nazwa', 'Ocena'] representing user, movie, and rating respectively.
+    Users and movies are categorical, ratings are float32.
 
     Raises:
     FileNotFoundError: If the specified file does not exist.
-    Exception: For errors encountered while reading the Excel file.
+    Exception: For errors encountered while reading the file.
     """
-    if not os.path.isfile(filename):
-        raise FileNotFoundError(f"Nie znaleziono pliku: {filename}")
-
     try:
-        df = pd.read_excel(filename)
+        return read_ratings(filename)
+    except FileNotFoundError:
+        raise
     except Exception as e:
-        raise Exception(f"Błąd podczas wczytywania pliku Excel: {e}")
-
-    df.fillna(0, inplace=True)
-
-    data_list = []
-    for index, row in df.iterrows():
-        user = str(row['Osoba'])
-        for i in range(1, len(row), 2):
-            movie = row.iloc[i]
-            rating = row.iloc[i + 1]
-            if movie and rating:
-                data_list.append((user, movie, rating))
+        raise Exception(f"Błąd podczas wczytywania pliku: {e}")
 
-    return pd.DataFrame(data_list, columns=['Osoba', 'Nazwa', 'Ocena'])
 
-
-def get_movie_recommendations(model, trainset, testset, user):
+def get_movie_recommendations(model, artifact, user, n=5):
     """
-    Trains a recommendation model and provides movie recommendations for a specific user.
+    Provides movie recommendations for a specific user from a trained recommendation model.
+
+    All movies not rated by the user are scored at once (see SparseKNNBasic.predict_items) instead of one predict() call per movie.
 
     Parameters:
-    model (surprise.prediction_algorithms): The recommendation model to be trained.
-    trainset (Trainset): The training dataset.
-    testset (list of (uid, iid, r_ui) tuples): The test dataset.
+    model (SparseKNNBasic): The trained recommendation model.
+    artifact (ModelArtifact): The loaded artifact the model comes from, with the movies rated by every user.
     user (str): The user for whom the recommendations are to be generated.
+    n (int): The number of movies in each list.
 
     Returns:
     tuple: Two lists of tuples, each containing movie names and predicted ratings. The first list is top recommendations, and the second is movies not recommended.
     """
-    model.fit(trainset)
-    predictions = model.test(testset)
-    accuracy.rmse(predictions)
-
-    rated_movies = set(processed_data[processed_data['Osoba'] == user]['Nazwa'])
-
-    recommendations = []
-    for movie_id in processed_data['Nazwa'].unique():
-        if movie_id not in rated_movies:
-            predicted_rating = model.predict(selected_user, movie_id).est
-            recommendations.append((movie_id, predicted_rating))
+    movies, estimates = model.predict_items(user, artifact.unrated_movies(user))
 
-    top_recommendations = sorted(recommendations, key=lambda x: x[1], reverse=True)[:5]
-    do_not_watch = sorted(recommendations, key=lambda x: x[1])[:5]
+    top_recommendations = [(movies[i], float(estimates[i])) for i in np.argsort(-estimates, kind='stable')[:n]]
+    do_not_watch = [(movies[i], float(estimates[i])) for i in np.argsort(estimates, kind='stable')[:n]]
     return top_recommendations, do_not_watch
 
 
@@ -148,39 +129,31 @@ def print_movie_recommendations(recommendations):
         =============================================
         ''')
 
-processed_data = process_data(SOURCE_FILE)
-reader = Reader(rating_scale=(1, 10))
-data = Dataset.load_from_df(processed_data[['Osoba', 'Nazwa', 'Ocena']], reader)
-
-trainset, testset = train_test_split(data, test_size=0.2, random_state=42)
-
-sim_options_pearson = {
-    'name': 'pearson',
-    'user_based': True
-}
-sim_options_cosine = {
-    'name': 'cosine',
-    'user_based': True
-}
-
-model_pearson = KNNBasic(sim_options=sim_options_pearson)
-model_cosine = KNNBasic(sim_options=sim_options_cosine)
-
-selected_user = input('Podaj użytkownika dla którego chcesz otrzymać rekomendacje: ')
-while processed_data[processed_data['Osoba'] == selected_user].empty:
-    print('Podany użytkownik nie istnieje w bazie!')
-    selected_user = input('\nPodaj użytkownika dla którego chcesz otrzymać rekomendacje: ')
-
-top_recommendations_pearson, do_not_watch_pearson = get_movie_recommendations(model_pearson, trainset, testset, selected_user)
-print('Metryka liczenia odległości: pearson')
-print(f'Top 5 rekomendacji dla użytkownika {selected_user}:')
-print_movie_recommendations(top_recommendations_pearson)
-print(f'\nUżytkownik {selected_user} nie powinien oglądać:')
-print_movie_recommendations(do_not_watch_pearson)
-
-top_recommendations_cosine, do_not_watch_cosine = get_movie_recommendations(model_cosine, trainset, testset, selected_user)
-print('Metryka liczenia odległości: cosine')
-print(f'Top 5 rekomendacji dla użytkownika {selected_user}:')
-print_movie_recommendations(top_recommendations_cosine)
-print(f'\nUżytkownik {selected_user} nie powinien oglądać:')
-print_movie_recommendations(do_not_watch_cosine)
+def main():
+    parser = argparse.ArgumentParser(description='Movie recommendations for a user.')
+    parser.add_argument('--source', default=SOURCE_FILE, help='path to the ratings sheet')
+    parser.add_argument('--artifact', default=ARTIFACT_DIR, help='path to the artifact of the trained models')
+    parser.add_argument('--rebuild', action='store_true', help='train the models again even if the artifact is current')
+    args = parser.parse_args()
+
+    if args.rebuild:
+        build(args.source, args.artifact)
+    artifact = load_or_build(args.source, args.artifact)
+
+    selected_user = input('Podaj użytkownika dla którego chcesz otrzymać rekomendacje: ')
+    while not artifact.knows_user(selected_user):
+        print('Podany użytkownik nie istnieje w bazie!')
+        selected_user = input('\nPodaj użytkownika dla którego chcesz otrzymać rekomendacje: ')
+
+    for metric, model in artifact.models.items():
+        top_recommendations, do_not_watch = get_movie_recommendations(model, artifact, selected_user)
+        print(f"RMSE: {artifact.metadata['rmse'][metric]:.4f}")
+        print(f'Metryka liczenia odległości: {metric}')
+        print(f'Top 5 rekomendacji dla użytkownika {selected_user}:')
+        print_movie_recommendations(top_recommendations)
+        print(f'\nUżytkownik {selected_user} nie powinien oglądać:')
+        print_movie_recommendations(do_not_watch)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,420 @@
+"""
+Long-running recommendation service.
+
+The ratings and the trained models are loaded once (see model_store.py) and requests are answered
+over TCP or a UNIX socket, one JSON object per line:
+- {"id": 1, "method": "recommend", "params": {"user": "Anna Rogala", "metric": "pearson", "n": 5}}
+  answers {"id": 1, "result": {"top": [[movie, rating], ...], "bottom": [[movie, rating], ...]}},
+- {"method": "rate", "params": {"user": "Anna Rogala", "movie": "Dune", "rating": 8}} adds or changes a rating,
+- {"method": "stats"} answers the latency percentiles of every method and the hit rate of the cache.
+Errors are answered as {"id": 1, "error": "..."}.
+
+Recommendations are kept in a per-user LRU cache. A rating changes the models (in memory, the artifact
+files stay as they are) and removes from the cache exactly the users whose recommendations can change:
+the user, the users who rated the movie (their similarity to the user changes) and the users similar
+to the user (the user is one of their neighbours). A new movie is a candidate for every user, so its
+first rating empties the cache. The estimate where an estimate is impossible stays the global mean of
+the trainset, so it does not change with every rating. Requests not found in the cache are computed in
+a thread pool, so one slow request does not hold up the others. The movie information API is not
+used, so the service works without network access.
+
+
+How to run
+---
+Run the service with the following command `python3 recommendation_service.py serve`
+(`--port` for another TCP port, `--unix /tmp/recommendations.sock` for a UNIX socket).
+Send requests e.g. with `echo '{"method": "recommend", "params": {"user": "Anna Rogala"}}' | nc localhost 8765`.
+Run `python3 recommendation_service.py load-test` to start the service and send it concurrent requests locally.
+
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import random
+import sys
+import time
+
+from ingestion import parse_rating
+from model_store import ARTIFACT_DIR, METRICS, SOURCE_FILE, load_or_build
+from movie_recommendation_engine import get_movie_recommendations
+
+
+HOST = '127.0.0.1'
+PORT = 8765
+CACHE_USERS = 10000
+MAX_N = 100
+
+
+class LatencyStats:
+    """
+    Latencies of the latest requests of one method.
+    """
+
+    def __init__(self, history=10000):
+        """
+        Creates empty statistics.
+
+        Parameters:
+        history (int): The number of the latest latencies the percentiles are computed from.
+        """
+        self.latencies = collections.deque(maxlen=history)
+        self.count = 0
+
+    def add(self, latency):
+        """
+        Records the latency of a request.
+
+        Parameters:
+        latency (float): The time from receiving the request to sending the answer, in seconds.
+        """
+        self.latencies.append(latency)
+        self.count += 1
+
+    def summary(self):
+        """
+        Summarises the latencies.
+
+        Returns:
+        dict: The number of requests and the p50, p90, p99 and maximum latency in milliseconds (None without requests).
+        """
+        ordered = sorted(self.latencies)
+
+        def percentile(percent):
+            return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))] * 1000 if ordered else None
+
+        return {
+            'count': self.count,
+            'p50_ms': percentile(50),
+            'p90_ms': percentile(90),
+            'p99_ms': percentile(99),
+            'max_ms': ordered[-1] * 1000 if ordered else None,
+        }
+
+
+class RecommendationService:
+    """
+    Recommendations from loaded models, with a per-user LRU cache.
+
+    Attributes:
+    - artifact (ModelArtifact): The models and the ratings; replaced by a new one on every rating.
+    - hits, misses (int): The numbers of recommendations found and not found in the cache.
+    - invalidated (int): The number of users removed from the cache by ratings.
+    """
+
+    def __init__(self, artifact, cache_users=CACHE_USERS):
+        """
+        Creates the service.
+
+        Parameters:
+        artifact (ModelArtifact): The loaded models and ratings.
+        cache_users (int): The largest number of users whose recommendations are cached.
+        """
+        self.artifact = artifact
+        self.cache_users = cache_users
+        self.cache = collections.OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self.stats = collections.defaultdict(LatencyStats)
+        self.update_lock = asyncio.Lock()
+
+    async def recommend(self, user, metric='pearson', n=5):
+        """
+        Gives the top and bottom n movies not rated by a user.
+
+        Parameters:
+        user (str): The user.
+        metric (str): The metric of the model, 'pearson' or 'cosine'.
+        n (int): The number of movies in each list.
+
+        Returns:
+        dict: The 'top' and 'bottom' lists of [movie, rating] pairs.
+
+        Raises:
+        ValueError: If the user, the metric or n is not valid.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Nieznana metryka: {metric}")
+        if not isinstance(n, int) or not 1 <= n <= MAX_N:
+            raise ValueError(f"Liczba filmów musi być z przedziału 1-{MAX_N}: {n}")
+        artifact = self.artifact
+        if not artifact.knows_user(user):
+            raise ValueError(f"Podany użytkownik nie istnieje w bazie: {user}")
+
+        entries = self.cache.get(user)
+        if entries is not None and (metric, n) in entries:
+            self.cache.move_to_end(user)
+            self.hits += 1
+            return entries[(metric, n)]
+
+        self.misses += 1
+        generation = self.generation
+        top, bottom = await asyncio.get_running_loop().run_in_executor(
+            None, get_movie_recommendations, artifact.models[metric], artifact, user, n)
+        result = {'top': [list(pair) for pair in top], 'bottom': [list(pair) for pair in bottom]}
+        # A rating during the computation may have made the result stale, then it is not cached.
+        if generation == self.generation:
+            self.cache.setdefault(user, {})[(metric, n)] = result
+            self.cache.move_to_end(user)
+            while len(self.cache) > self.cache_users:
+                self.cache.popitem(last=False)
+        return result
+
+    async def rate(self, user, movie, rating):
+        """
+        Adds or changes a rating and removes the users whose recommendations can change from the cache
+        (see affected_users), or all users if the movie is new.
+
+        Parameters:
+        user (str): The user, possibly a new one.
+        movie (str): The movie, possibly a new one.
+        rating (float): The rating.
+
+        Returns:
+        dict: The number of users removed from the cache.
+
+        Raises:
+        ValueError: If the rating is not a number in the rating scale of the sheets (see ingestion.parse_rating).
+        """
+        user, movie = str(user), str(movie)
+        rating = parse_rating(rating)
+        async with self.update_lock:
+            before = self.artifact
+            after = await asyncio.get_running_loop().run_in_executor(None, before.with_rating, user, movie,
+                                                                     rating)
+            if movie in before.movie_positions:
+                affected = self.affected_users(before, user, movie) | self.affected_users(after, user, movie)
+            else:
+                # A new movie is a candidate for every user.
+                affected = set(self.cache)
+            self.artifact = after
+            self.generation += 1
+        removed = 0
+        for affected_user in affected:
+            removed += self.cache.pop(affected_user, None) is not None
+        self.invalidated += removed
+        return {'invalidated': removed}
+
+    @staticmethod
+    def affected_users(artifact, user, movie):
+        """
+        Finds the users whose recommendations depend on the ratings of a user for a movie.
+
+        Parameters:
+        artifact (ModelArtifact): The models.
+        user (str): The user.
+        movie (str): The movie.
+
+        Returns:
+        set of str: The user, the users who rated the movie and the users with a positive similarity to the user
+        in any model.
+        """
+        affected = {user}
+        for model in artifact.models.values():
+            item = model.movie_ids.get(movie)
+            if item is not None:
+                raters = model.entry_users[model.item_starts[item]:model.item_starts[item + 1]]
+                affected.update(model.users[raters].tolist())
+            inner_user = model.user_ids.get(user)
+            if inner_user is not None:
+                affected.update(model.users[model.user_similarities(inner_user)[0] > 0].tolist())
+        return affected
+
+    def metrics(self):
+        """
+        Gives the statistics of the service.
+
+        Returns:
+        dict: The latencies of every method, the hits, misses and hit rate of the cache, the number of
+        cached users and the number of users removed from the cache by ratings.
+        """
+        requests = self.hits + self.misses
+        return {
+            'latency': {method: stats.summary() for method, stats in self.stats.items()},
+            'cache': {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else None,
+                'users': len(self.cache),
+                'invalidated': self.invalidated,
+            },
+        }
+
+    async def handle(self, request):
+        """
+        Answers a request.
+
+        Parameters:
+        request (dict): The request: 'method', 'params' and optionally 'id'.
+
+        Returns:
+        dict: The answer: 'result' or 'error', and the 'id' of the request.
+        """
+        received = time.perf_counter()
+        method = request.get('method') if isinstance(request, dict) else None
+        answer = {'id': request.get('id')} if isinstance(request, dict) else {'id': None}
+        params = request.get('params') or {} if isinstance(request, dict) else {}
+        try:
+            if method == 'recommend':
+                answer['result'] = await self.recommend(params['user'], params.get('metric', 'pearson'),
+                                                        params.get('n', 5))
+            elif method == 'rate':
+                answer['result'] = await self.rate(params['user'], params['movie'], params['rating'])
+            elif method == 'stats':
+                answer['result'] = self.metrics()
+            else:
+                raise ValueError(f"Nieznana metoda: {method}")
+        except KeyError as e:
+            answer['error'] = f"Brak parametru: {e.args[0]}"
+        except (ValueError, TypeError) as e:
+            answer['error'] = str(e)
+        self.stats[method if method in ('recommend', 'rate', 'stats') else 'invalid'].add(time.perf_counter() - received)
+        return answer
+
+
+async def handle_client(service, reader, writer):
+    """
+    Answers the requests of a client, one JSON object per line, until it disconnects.
+
+    Parameters:
+    service (RecommendationService): The service.
+    reader (asyncio.StreamReader): The stream of the requests.
+    writer (asyncio.StreamWriter): The stream of the answers.
+    """
+    try:
+        async for line in reader:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                answer = {'id': None, 'error': f"Niepoprawny JSON: {e}"}
+            else:
+                answer = await service.handle(request)
+            writer.write((json.dumps(answer, ensure_ascii=False) + '\n').encode())
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(service, host=HOST, port=PORT, unix=None):
+    """
+    Starts serving the clients of a TCP port or a UNIX socket.
+
+    Parameters:
+    service (RecommendationService): The service.
+    host (str): The address to listen on.
+    port (int): The TCP port, 0 for any free port.
+    unix (str): The path of a UNIX socket, used instead of TCP if given.
+
+    Returns:
+    asyncio.Server: The server.
+    """
+    def client(reader, writer):
+        return handle_client(service, reader, writer)
+
+    if unix:
+        return await asyncio.start_unix_server(client, unix)
+    return await asyncio.start_server(client, host, port)
+
+
+async def request(reader, writer, message):
+    """
+    Sends a request to the service and waits for the answer.
+
+    Parameters:
+    reader (asyncio.StreamReader): The stream of the answers.
+    writer (asyncio.StreamWriter): The stream of the requests.
+    message (dict): The request.
+
+    Returns:
+    dict: The answer.
+    """
+    writer.write((json.dumps(message) + '\n').encode())
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+def report(service):
+    """
+    Writes the statistics of the service to stderr.
+
+    Parameters:
+    service (RecommendationService): The service.
+    """
+    print(json.dumps(service.metrics(), indent=2), file=sys.stderr)
+
+
+async def serve(args):
+    service = RecommendationService(load_or_build(args.source, args.artifact), args.cache_users)
+    server = await start_server(service, args.host, args.port, args.unix)
+    address = args.unix or '{}:{}'.format(*server.sockets[0].getsockname()[:2])
+    print(f'Serwis rekomendacji nasłuchuje na {address}', file=sys.stderr)
+    try:
+        async with server:
+            while True:
+                await asyncio.sleep(args.stats_interval or 3600)
+                if args.stats_interval:
+                    report(service)
+    finally:
+        report(service)
+
+
+async def load_test(args):
+    """
+    Starts the service on a free local port and sends it concurrent requests from several clients:
+    recommendations for random users and metrics, with a rating now and then.
+    """
+    service = RecommendationService(load_or_build(args.source, args.artifact), args.cache_users)
+    server = await start_server(service, HOST, 0)
+    port = server.sockets[0].getsockname()[1]
+    users = service.artifact.users.tolist()
+    movies = service.artifact.movies.tolist()
+    rng = random.Random(0)
+
+    async def client(count):
+        reader, writer = await asyncio.open_connection(HOST, port)
+        for _ in range(count):
+            if rng.random() < args.rate_fraction:
+                message = {'method': 'rate', 'params': {'user': rng.choice(users), 'movie': rng.choice(movies),
+                                                        'rating': rng.randint(1, 10)}}
+            else:
+                message = {'method': 'recommend', 'params': {'user': rng.choice(users), 'metric': rng.choice(METRICS)}}
+            answer = await request(reader, writer, message)
+            if 'error' in answer:
+                raise RuntimeError(answer['error'])
+        writer.close()
+
+    start = time.perf_counter()
+    async with server:
+        await asyncio.gather(*(client(args.requests // args.clients) for _ in range(args.clients)))
+        elapsed = time.perf_counter() - start
+    print(f'{args.requests // args.clients * args.clients} requests from {args.clients} clients in {elapsed:.2f} s')
+    report(service)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve movie recommendations over TCP or a UNIX socket.')
+    parser.add_argument('command', choices=['serve', 'load-test'])
+    parser.add_argument('--source', default=SOURCE_FILE, help='path to the ratings sheet')
+    parser.add_argument('--artifact', default=ARTIFACT_DIR, help='path to the artifact of the trained models')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--unix', default=None, help='path of a UNIX socket to serve instead of TCP')
+    parser.add_argument('--cache-users', type=int, default=CACHE_USERS, help='number of users in the cache')
+    parser.add_argument('--stats-interval', type=float, default=None, help='report the statistics every N seconds')
+    parser.add_argument('--requests', type=int, default=2000, help='number of requests of the load test')
+    parser.add_argument('--clients', type=int, default=8, help='number of clients of the load test')
+    parser.add_argument('--rate-fraction', type=float, default=0.02, help='fraction of ratings in the load test')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args) if args.command == 'serve' else load_test(args))
+    except KeyboardInterrupt:
+        pass
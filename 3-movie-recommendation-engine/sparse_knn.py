@@ -0,0 +1,387 @@
+"""
+User-based k-nearest-neighbours collaborative filtering on sparse matrices.
+
+`SparseKNNBasic` gives the same estimates as the user-based `surprise.KNNBasic` with the
+'cosine' or 'pearson' similarity, but:
+- the similarities of a user to all users are computed when needed, from products of
+  the sparse user x item ratings matrix, instead of keeping the dense n_users x n_users
+  matrices of Surprise, so the memory grows with the number of ratings only,
+- all movies are scored for a user (or a block of users) at once, with sparse matrix
+  products, instead of one `predict()` call per movie.
+
+As in KNNBasic, the estimate for a movie is the similarity-weighted mean of the ratings
+of the k most similar users who rated it, counting only users with a positive similarity.
+It is the global mean when the user or the movie is unknown or fewer than min_k such
+users exist, and it is clipped to the rating scale.
+
+Usage
+---
+model = SparseKNNBasic(k=40, sim_options={'name': 'pearson', 'user_based': True})
+model.fit(trainset)
+movies, estimates = model.predict_items('Anna Rogala')
+
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+import numpy as np
+import scipy.sparse as sp
+from surprise import Prediction
+
+
+# The arrays of a fitted model (see SparseKNNBasic.state).
+STATE_ARRAYS = (
+    'users', 'movies', 'item_starts', 'entry_users', 'entry_ratings',
+    'user_starts', 'user_items', 'user_ratings', 'global_mean', 'rating_scale',
+)
+# The number of users estimated at once by test().
+BLOCK_SIZE = 64
+# The largest number of ratings ranked at once by estimate_rows, to bound its memory.
+RANKED_ENTRIES = 1 << 21
+
+class SparseKNNBasic:
+    """
+    User-based KNNBasic on sparse matrices.
+    """
+
+    def __init__(self, k=40, min_k=1, sim_options=None):
+        """
+        Creates the model.
+
+        Parameters:
+        k (int): The largest number of neighbours taken into account for an estimate.
+        min_k (int): The smallest number of neighbours needed for an estimate.
+        sim_options (dict): The similarity options, as for KNNBasic: 'name' ('cosine' or 'pearson'),
+        'user_based' (must be True) and 'min_support'.
+
+        Raises:
+        ValueError: If the similarity is not supported or the options are not user based.
+        """
+        self.sim_options = sim_options or {'name': 'cosine', 'user_based': True}
+        self.name = self.sim_options.get('name', 'cosine').lower()
+        if self.name not in ('cosine', 'pearson'):
+            raise ValueError(f"Nieobsługiwana miara podobieństwa: {self.name}")
+        if not self.sim_options.get('user_based', True):
+            raise ValueError('Obsługiwane są tylko podobieństwa między użytkownikami (user_based=True)')
+        self.min_support = self.sim_options.get('min_support', 1)
+        self.k = k
+        self.min_k = min_k
+
+    def fit(self, trainset):
+        """
+        Builds the sparse ratings matrices of a trainset.
+
+        Parameters:
+        trainset (surprise.Trainset): The training dataset.
+
+        Returns:
+        SparseKNNBasic: The model.
+        """
+        n_users, n_items = trainset.n_users, trainset.n_items
+
+        # The ratings of every movie in the order of trainset.ir, which decides
+        # between neighbours with equal similarities, as in KNNBasic.
+        counts = np.array([len(trainset.ir[i]) for i in range(n_items)], dtype=np.int64)
+        item_starts = np.concatenate(([0], np.cumsum(counts)))
+        entry_users = np.fromiter((u for i in range(n_items) for u, _ in trainset.ir[i]), np.int64, counts.sum())
+        entry_ratings = np.fromiter((r for i in range(n_items) for _, r in trainset.ir[i]), float, counts.sum())
+        by_user = sp.csr_matrix((entry_ratings, entry_users, item_starts), shape=(n_items, n_users)).T.tocsr()
+
+        return self.load_state({
+            'users': np.array([str(trainset.to_raw_uid(u)) for u in range(n_users)]),
+            'movies': np.array([str(trainset.to_raw_iid(i)) for i in range(n_items)]),
+            'item_starts': item_starts,
+            'entry_users': entry_users,
+            'entry_ratings': entry_ratings,
+            'user_starts': by_user.indptr.astype(np.int64),
+            'user_items': by_user.indices.astype(np.int64),
+            'user_ratings': by_user.data,
+            'global_mean': np.array(trainset.global_mean),
+            'rating_scale': np.array(trainset.rating_scale, dtype=float),
+        })
+
+    def state(self):
+        """
+        Gives the arrays of the fitted model, e.g. to save them as .npy files.
+
+        Returns:
+        dict: The arrays by name: the raw ids of the users and movies (by inner id, as strings),
+        the ratings by movie (item_starts, entry_users, entry_ratings, in the order of trainset.ir)
+        and by user (user_starts, user_items, user_ratings), the global mean and the rating scale.
+        """
+        return {name: getattr(self, name) for name in STATE_ARRAYS}
+
+    def load_state(self, state, similarities=None):
+        """
+        Restores a fitted model from its arrays (see state), which may be memory-mapped.
+
+        Parameters:
+        state (dict): The arrays of the model.
+        similarities (numpy.ndarray): The n_users x n_users similarity matrix, if precomputed (see similarity_rows).
+
+        Returns:
+        SparseKNNBasic: The model.
+        """
+        for name in STATE_ARRAYS:
+            setattr(self, name, state[name])
+        self.global_mean = float(self.global_mean)
+        self.rating_scale = tuple(self.rating_scale.tolist())
+        self.similarities = similarities
+        self.user_ids = {user: u for u, user in enumerate(self.users.tolist())}
+        self.movie_ids = {movie: i for i, movie in enumerate(self.movies.tolist())}
+        self.n_users, self.n_items = len(self.users), len(self.movies)
+        self.entry_items = np.repeat(np.arange(self.n_items), np.diff(self.item_starts))
+
+        shape = (self.n_users, self.n_items)
+        self.ratings = sp.csr_matrix((self.user_ratings, self.user_items, self.user_starts), shape=shape)
+        self.rated = sp.csr_matrix((np.ones(len(self.user_items)), self.user_items, self.user_starts), shape=shape)
+        self.squares = sp.csr_matrix((self.user_ratings ** 2, self.user_items, self.user_starts), shape=shape)
+        shape = (self.n_items, self.n_users)
+        self.item_ratings = sp.csr_matrix((self.entry_ratings, self.entry_users, self.item_starts), shape=shape)
+        self.item_rated = sp.csr_matrix((np.ones(len(self.entry_users)), self.entry_users, self.item_starts), shape=shape)
+        return self
+
+    def with_rating(self, user, movie, rating, global_mean=None):
+        """
+        Creates a SparseKNNBasic with a rating added or changed; the model itself is not changed.
+
+        The arrays are rebuilt, which takes time proportional to the number of ratings, and the
+        precomputed similarity matrix (if any) is dropped, as the similarities of the user change.
+
+        Parameters:
+        user (str): The raw id of the user, possibly a new one.
+        movie (str): The raw id of the movie, possibly a new one.
+        rating (float): The rating.
+        global_mean (float): The estimate of the new model where an estimate is impossible,
+        the mean of all its ratings (as after fitting) if not given.
+
+        Returns:
+        SparseKNNBasic: The new model.
+        """
+        state = {name: np.array(value) for name, value in self.state().items()}
+        inner_user = self.user_ids.get(user, self.n_users)
+        inner_item = self.movie_ids.get(movie, self.n_items)
+        if inner_user == self.n_users:
+            state['users'] = np.append(state['users'], user)
+            state['user_starts'] = np.append(state['user_starts'], state['user_starts'][-1])
+        if inner_item == self.n_items:
+            state['movies'] = np.append(state['movies'], movie)
+            state['item_starts'] = np.append(state['item_starts'], state['item_starts'][-1])
+
+        # A new rating goes after the other ratings of the movie, as it would in trainset.ir.
+        for starts, keys, values, row, key in (
+            ('item_starts', 'entry_users', 'entry_ratings', inner_item, inner_user),
+            ('user_starts', 'user_items', 'user_ratings', inner_user, inner_item),
+        ):
+            start, end = state[starts][row], state[starts][row + 1]
+            found = np.flatnonzero(state[keys][start:end] == key)
+            if len(found):
+                state[values][start + found[0]] = rating
+            else:
+                state[keys] = np.insert(state[keys], end, key)
+                state[values] = np.insert(state[values], end, rating)
+                state[starts][row + 1:] += 1
+        state['global_mean'] = np.array(state['entry_ratings'].mean() if global_mean is None else global_mean)
+
+        return SparseKNNBasic(self.k, self.min_k, self.sim_options).load_state(state)
+
+    def similarity_rows(self, inner_users, others=None):
+        """
+        Computes the similarities of some users to all users (or to the given ones), from sums over the movies rated by both users.
+
+        Every sum is a product of a sparse user x item matrix with the dense ratings of the given
+        users (e.g. the sums of the squared ratings of the given users over the movies rated by
+        every user are B @ (R_u ** 2).T), so the n_users x n_users matrix is never built.
+
+        Parameters:
+        inner_users (array-like of int): The inner ids of the users.
+        others (array-like of int): The inner ids of the users to compare with, all users if not given.
+
+        Returns:
+        numpy.ndarray: A len(inner_users) x len(others) array of similarities, as in KNNBasic:
+        1 for the user itself, 0 without at least min_support common movies.
+        """
+        inner_users = np.atleast_1d(inner_users)
+        if others is None:
+            ratings, rated, squares = self.ratings, self.rated, self.squares
+            others = np.arange(self.n_users)
+        else:
+            others = np.asarray(others, dtype=np.int64)
+            ratings, rated, squares = self.ratings[others], self.rated[others], self.squares[others]
+        user_ratings = self.ratings[inner_users].toarray().T
+        user_rated = self.rated[inner_users].toarray().T
+        freq = rated @ user_rated
+        prods = ratings @ user_ratings
+        sqi = rated @ (user_ratings ** 2)
+        sqj = squares @ user_rated
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if self.name == 'cosine':
+                denum = np.sqrt(sqi * sqj)
+                sim = prods / denum
+            else:
+                si = rated @ user_ratings
+                sj = ratings @ user_rated
+                denum = np.sqrt((freq * sqi - si ** 2) * (freq * sqj - sj ** 2))
+                sim = (freq * prods - si * sj) / denum
+        sim[(denum == 0) | (freq < max(self.min_support, 1))] = 0
+        sim[others[:, None] == inner_users[None, :]] = 1
+        return sim.T
+
+    def user_similarities(self, inner_users):
+        """
+        Computes the similarities of some users to all users, which decide the neighbours of the estimates.
+
+        The rows of the precomputed similarity matrix are used if the model has one (see load_state).
+
+        Parameters:
+        inner_users (array-like of int): The inner ids of the users.
+
+        Returns:
+        numpy.ndarray: A len(inner_users) x n_users array of similarities.
+        """
+        inner_users = np.atleast_1d(inner_users)
+        if self.similarities is not None:
+            return np.array(self.similarities[inner_users])
+        return self.similarity_rows(inner_users)
+
+    def estimate_all(self, inner_user):
+        """
+        Estimates the ratings of all movies of the trainset for a known user.
+
+        Parameters:
+        inner_user (int): The inner id of the user.
+
+        Returns:
+        numpy.ndarray: The estimate of every movie (by inner id), NaN where it is impossible.
+        """
+        return self.estimate_rows([inner_user])[0]
+
+    def estimate_rows(self, inner_users):
+        """
+        Estimates the ratings of all movies of the trainset for a block of known users.
+
+        The sums over the positive-similarity neighbours are products of the sparse item x user
+        matrices with the block of similarities. Only (user, movie) pairs with more than k such
+        neighbours need the k most similar of them, which are found by ranking the neighbours
+        within the movie's ratings, for at most RANKED_ENTRIES ratings at once.
+
+        Parameters:
+        inner_users (array-like of int): The inner ids of the users.
+
+        Returns:
+        numpy.ndarray: A len(inner_users) x n_items array of estimates, NaN where it is impossible.
+        """
+        similarities = self.user_similarities(inner_users)
+        positive = np.maximum(similarities, 0)
+        sum_sim = np.asarray(self.item_rated @ positive.T).T
+        sum_ratings = np.asarray(self.item_ratings @ positive.T).T
+        neighbours = np.asarray(self.item_rated @ (similarities > 0).T.astype(float)).T
+
+        rows, items = np.nonzero(neighbours > self.k)
+        counts = np.diff(self.item_starts)[items]
+        ends = np.cumsum(counts)
+        start = 0
+        while start < len(rows):
+            stop = max(np.searchsorted(ends, ends[start] - counts[start] + RANKED_ENTRIES, side='right'), start + 1)
+            self._rank_neighbours(similarities, rows[start:stop], items[start:stop], sum_sim, sum_ratings)
+            start = stop
+        neighbours[rows, items] = self.k
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            estimates = sum_ratings / sum_sim
+        estimates[neighbours < max(self.min_k, 1)] = np.nan
+        return estimates
+
+    def _rank_neighbours(self, similarities, rows, items, sum_sim, sum_ratings):
+        """
+        Replaces the sums of (user, movie) pairs with more than k neighbours by the sums over the k most similar neighbours.
+
+        Parameters:
+        similarities (numpy.ndarray): The similarities of the block of users to all users.
+        rows (numpy.ndarray): The rows of the users in the block.
+        items (numpy.ndarray): The inner ids of the movies.
+        sum_sim (numpy.ndarray): The sums of the similarities, updated in place.
+        sum_ratings (numpy.ndarray): The sums of the similarity-weighted ratings, updated in place.
+        """
+        counts = np.diff(self.item_starts)[items]
+        pairs = np.repeat(np.arange(len(rows)), counts)
+        entries = np.arange(counts.sum()) + np.repeat(self.item_starts[items] - (np.cumsum(counts) - counts), counts)
+        entry_sims = similarities[rows[pairs], self.entry_users[entries]]
+        keep = entry_sims > 0
+        pairs, entries, entry_sims = pairs[keep], entries[keep], entry_sims[keep]
+        # Ties between neighbours are decided by the order of the movie's ratings, as in KNNBasic.
+        order = np.lexsort((entries, -entry_sims, pairs))
+        pairs, entries, entry_sims = pairs[order], entries[order], entry_sims[order]
+        first = np.flatnonzero(np.r_[True, pairs[1:] != pairs[:-1]])
+        rank = np.arange(len(pairs)) - np.repeat(first, np.diff(np.r_[first, len(pairs)]))
+        top = rank < self.k
+        sum_sim[rows, items] = 0
+        sum_ratings[rows, items] = 0
+        np.add.at(sum_sim, (rows[pairs[top]], items[pairs[top]]), entry_sims[top])
+        np.add.at(sum_ratings, (rows[pairs[top]], items[pairs[top]]), entry_sims[top] * self.entry_ratings[entries[top]])
+
+    def predict_items(self, user, movies=None):
+        """
+        Estimates the ratings of movies for a user.
+
+        Parameters:
+        user (str): The raw id of the user.
+        movies (iterable): The raw ids of the movies, all movies of the trainset if not given.
+
+        Returns:
+        tuple: The list of the movies and the array of their estimates, clipped to the rating scale.
+        """
+        if movies is None:
+            movies = self.movies.tolist()
+        movies = list(movies)
+        items = np.array([self.movie_ids.get(movie, -1) for movie in movies], dtype=np.int64)
+        estimates = np.full(len(movies), np.nan)
+        inner_user = self.user_ids.get(user, -1)
+        if inner_user >= 0:
+            known = items >= 0
+            estimates[known] = self.estimate_all(inner_user)[items[known]]
+        estimates[np.isnan(estimates)] = self.global_mean
+        return movies, np.clip(estimates, *self.rating_scale)
+
+    def predict(self, uid, iid, r_ui=None):
+        """
+        Estimates the rating of a movie for a user, like KNNBasic.predict.
+
+        Parameters:
+        uid (str): The raw id of the user.
+        iid (str): The raw id of the movie.
+        r_ui (float): The true rating, if known.
+
+        Returns:
+        surprise.Prediction: The prediction.
+        """
+        return self.test([(uid, iid, r_ui)])[0]
+
+    def test(self, testset, block_size=BLOCK_SIZE):
+        """
+        Estimates the ratings of a testset, like KNNBasic.test, for blocks of users at once (see estimate_rows).
+
+        Parameters:
+        testset (list of (uid, iid, r_ui) tuples): The test dataset.
+        block_size (int): The number of users estimated at once.
+
+        Returns:
+        list of surprise.Prediction: The predictions.
+        """
+        inner_users = np.array([self.user_ids.get(uid, -1) for uid, _, _ in testset], dtype=np.int64)
+        inner_items = np.array([self.movie_ids.get(iid, -1) for _, iid, _ in testset], dtype=np.int64)
+        known = (inner_users >= 0) & (inner_items >= 0)
+        estimates = np.full(len(testset), np.nan)
+        users = np.unique(inner_users[known])
+        for start in range(0, len(users), block_size):
+            block = users[start:start + block_size]
+            selected = known & np.isin(inner_users, block)
+            rows = np.searchsorted(block, inner_users[selected])
+            estimates[selected] = self.estimate_rows(block)[rows, inner_items[selected]]
+
+        predictions = []
+        for (uid, iid, r_ui), est in zip(testset, estimates.tolist()):
+            was_impossible = bool(np.isnan(est))
+            est = float(np.clip(self.global_mean if was_impossible else est, *self.rating_scale))
+            predictions.append(Prediction(uid, iid, r_ui, est, {'was_impossible': was_impossible}))
+        return predictions
@@ -0,0 +1,102 @@
+"""
+Tests of the resolution of the official titles against a local stub of the imdbot API.
+
+
+How to run
+---
+Run the tests with the following command `python3 -m pytest test_data_cleaner.py`
+
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+import collections
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from data_cleaner import TitleCache, create_session, process_file, resolve_titles
+
+
+TITLES = {'dune': 'Dune: Part One', 'incepcja': 'Inception'}
+# Names answered with a 503 the first time they are asked about.
+FLAKY = {'incepcja'}
+
+
+@pytest.fixture
+def stub_api():
+    requests = collections.Counter()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            name = parse_qs(urlparse(self.path).query)['q'][0]
+            requests[name] += 1
+            if name.casefold() in FLAKY and requests[name] == 1:
+                self.send_response(503)
+                self.end_headers()
+                return
+            title = TITLES.get(name.casefold())
+            body = json.dumps({'description': [{'#TITLE': title}] if title else []}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/', requests
+    server.shutdown()
+    server.server_close()
+
+
+def resolve(names, cache_path, base_url):
+    cache = TitleCache(cache_path)
+    session = create_session(max_workers=2, backoff_factor=0)
+    try:
+        return resolve_titles(names, cache, session, base_url, max_workers=2)
+    finally:
+        session.close()
+        cache.close()
+
+
+def test_resolve_titles_retries_and_caches(stub_api, tmp_path):
+    base_url, requests = stub_api
+    cache_path = str(tmp_path / 'titles.sqlite')
+    names = ['Dune', 'dune ', 'Incepcja', 'Nieznany film']
+
+    titles = resolve(names, cache_path, base_url)
+    assert titles == {'Dune': 'Dune: Part One', 'dune ': 'Dune: Part One', 'Incepcja': 'Inception'}
+    # 'Dune' and 'dune ' share the normalised name, 'Incepcja' is asked again after the 503.
+    assert requests['Dune'] + requests['dune '] == 1
+    assert requests['Incepcja'] == 2
+    assert requests['Nieznany film'] == 1
+
+    # A second run reads every name, also the one without a title, from the cache file.
+    asked = sum(requests.values())
+    assert resolve(names, cache_path, base_url) == titles
+    assert sum(requests.values()) == asked
+
+
+def test_process_file_rewrites_the_names_chunk_by_chunk(stub_api, tmp_path):
+    base_url, requests = stub_api
+    source, output = tmp_path / 'data.csv', tmp_path / 'parsed_data.csv'
+    source.write_text('Osoba,Nazwa,Ocena,Nazwa,Ocena\nA,Dune,8,Incepcja,0\nB,dune,5\nC,,,Nieznany film,3\n',
+                      encoding='utf-8')
+
+    count = process_file(str(source), str(output), str(tmp_path / 'titles.sqlite'), base_url, chunk_rows=2)
+
+    assert count == 3
+    assert output.read_text(encoding='utf-8').splitlines() == [
+        'Osoba,Nazwa,Ocena,Nazwa.1,Ocena.1',
+        'A,Dune: Part One,8,Inception,0',
+        'B,Dune: Part One,5,,',
+        'C,,,Nieznany film,3',
+    ]
@@ -0,0 +1,67 @@
+"""
+Tests of the streaming reading of the ratings sheets.
+
+
+How to run
+---
+Run the tests with the following command `python3 -m pytest test_ingestion.py`
+
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+import pytest
+
+from ingestion import iter_ratings, parse_rating, read_ratings
+
+
+SHEET = (
+    'Osoba,Nazwa,Ocena,Nazwa,Ocena\n'
+    'Anna,Dune,8,Up,0\n'     # a rating of 0 is a rating
+    'Adam,Heat,5\n'          # a short row
+    'Ewa,,7,Casino,\n'       # empty cells
+    'Jan,Se7en,6,Up,3,\n'    # an empty cell past the header
+    ',Dune,4\n'              # no user
+)
+RECORDS = [
+    ('Anna', 'Dune', 8.0),
+    ('Anna', 'Up', 0.0),
+    ('Adam', 'Heat', 5.0),
+    ('Jan', 'Se7en', 6.0),
+    ('Jan', 'Up', 3.0),
+]
+
+
+@pytest.fixture
+def sheet(tmp_path):
+    path = tmp_path / 'ratings.csv'
+    path.write_text(SHEET, encoding='utf-8')
+    return str(path)
+
+
+def test_iter_ratings_pads_short_rows_and_keeps_zero_ratings(sheet):
+    assert list(iter_ratings(sheet)) == RECORDS
+
+
+def test_read_ratings_gives_the_records_of_iter_ratings(sheet):
+    ratings = read_ratings(sheet)
+    assert list(zip(ratings['Osoba'].astype(str), ratings['Nazwa'].astype(str), ratings['Ocena'].astype(float))) == RECORDS
+
+
+def test_iter_ratings_rejects_values_past_the_header(tmp_path):
+    path = tmp_path / 'ratings.csv'
+    path.write_text('Osoba,Nazwa,Ocena\nAnna,Dune,8,Up\n', encoding='utf-8')
+    with pytest.raises(ValueError):
+        list(iter_ratings(str(path)))
+
+
+@pytest.mark.parametrize('rating', ['11', '-1', 'dobry', 'nan'])
+def test_ratings_outside_the_scale_are_rejected(tmp_path, rating):
+    path = tmp_path / 'ratings.csv'
+    path.write_text(f'Osoba,Nazwa,Ocena\nAnna,Dune,{rating}\n', encoding='utf-8')
+    with pytest.raises(ValueError):
+        list(iter_ratings(str(path)))
+    with pytest.raises(ValueError):
+        read_ratings(str(path))
+    with pytest.raises(ValueError):
+        parse_rating(rating)
@@ -0,0 +1,78 @@
+"""
+Tests of the cache of the recommendation service: after a rating, every cached recommendation
+must be the same as one computed from scratch.
+
+The ratings sheet has two groups of users who rated different movies, so the users of one group
+have no similarity to the users of the other one and their estimates of its movies are impossible.
+
+
+How to run
+---
+Run the tests with the following command `python3 -m pytest test_recommendation_service.py`
+
+
+Authors: Adam Łuszcz, Anna Rogala
+"""
+
+import asyncio
+import csv
+
+import pytest
+
+from model_store import METRICS, ModelArtifact, build
+from recommendation_service import RecommendationService
+
+
+N = 100
+
+
+@pytest.fixture(scope='module')
+def artifact(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('recommendations')
+    source = directory / 'ratings.csv'
+    with open(source, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Osoba'] + ['Nazwa', 'Ocena'] * 6)
+        for group in 'AB':
+            for user in range(6):
+                row = [f'{group}{user}']
+                for movie in range(6):
+                    if (user + movie) % 4:
+                        row += [f'{group} film {movie}', (user * 3 + movie * 5) % 10 + 1]
+                writer.writerow(row)
+    build(str(source), str(directory / 'model_artifact'))
+    return ModelArtifact(str(directory / 'model_artifact'))
+
+
+async def recommend_all(service, users):
+    return [await service.recommend(user, metric, N) for user in users for metric in METRICS]
+
+
+@pytest.mark.parametrize('movie', ['A film 0', 'Nowy film'])
+def test_cache_of_non_neighbours_stays_fresh_after_rating(artifact, movie):
+    others = [f'B{user}' for user in range(6)]
+
+    async def rate_and_compare():
+        service = RecommendationService(artifact)
+        await recommend_all(service, others)
+        await service.rate('A1', movie, 10)
+        cached = await recommend_all(service, others)
+        fresh = await recommend_all(RecommendationService(service.artifact), others)
+        return service, cached, fresh
+
+    service, cached, fresh = asyncio.run(rate_and_compare())
+    assert cached == fresh
+    # A rating of a known movie keeps the cache of the other group, a new movie empties it.
+    assert service.hits == (len(others) * len(METRICS) if movie in artifact.movie_positions else 0)
+
+
+@pytest.mark.parametrize('rating, accepted', [(0, True), ('7', True), (10, True), (11, False), (-1, False),
+                                              (True, False), (float('nan'), False), ('dobry', False)])
+def test_rate_accepts_the_ratings_of_the_sheets(artifact, rating, accepted):
+    service = RecommendationService(artifact)
+    if accepted:
+        asyncio.run(service.rate('A1', 'A film 0', rating))
+        assert service.artifact.models[METRICS[0]].rating_scale == (0, 10)
+    else:
+        with pytest.raises(ValueError):
+            asyncio.run(service.rate('A1', 'A film 0', rating))